@@ -1,657 +1,659 @@
+import time
 import asyncio
-from spade.agent import Agent
-from spade.behaviour import CyclicBehaviour
-from spade.message import Message
-from queue import Queue
+from transport import Agent, CyclicBehaviour, Message
+from collections import deque
 from asyncio import Lock
+import coordination
+import events
+import metrics
+import protocol
+from coordination import colors, REQUEST_TIMEOUT, RECEIVE_WINDOW, CENTRAL_SLEEP, RECEIVE_TIMEOUT
 
 #--------------------------------------------------------------------------------------------------------------------------------------------------------------
 
-# List of the possible colors of the traffic lights
-colors = ["green", "yellow", "red"]
+# Builds a message with a protocol body (see protocol.py)
+def make_message(to, body, performative="inform"):
+    msg = Message(to=str(to))
+    msg.set_metadata("performative", performative)
+    msg.body = body
+    return msg
 
-#--------------------------------------------------------------------------------------------------------------------------------------------------------------      
+
+# Decodes the body of a received message - None if there is no message or if it does not follow the protocol
+def read_message(msg):
+    if not msg:
+        return None
+    try:
+        envelope = protocol.decode(msg.body)
+    except protocol.ProtocolError as error:
+        events.agent.warning("invalid_message", to=str(msg.to), sender=str(msg.sender), error=str(error))
+        return None
+
+    events.agent.debug("message", sender=envelope.entity, request=protocol.KIND_NAMES[envelope.kind], value=envelope.value)
+    metrics.increment("messages_received", envelope.role)
+    return envelope
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Overload of the central: requests of the vehicles/people queued per cycle and per class before the next ones are answered "busy",
+# and seconds the sender waits before asking again (more if several cycles of requests were refused)
+QUEUE_CAPACITY = 1000
+RETRY_AFTER = 2
+
+
+# Behaviour that sends requests and waits for the answer with the same correlation id, with a deadline:
+#   - the messages that arrive in the meantime and are not an answer go back to the mailbox, already decoded (the next receive_envelope() returns them first)
+#   - an answer to another request in flight completes that request instead
+# Every message is decoded once (read_message), whether it is an answer or deferred
+class RequestBehaviour(CyclicBehaviour):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pending = {} # Requests in flight, ex: "1f": (future, time sent, kind)
+        self.deferred = deque() # Messages received while waiting for an answer, with their Envelope, ex: (msg, Envelope(kind=EMERGENCY, ...))
+
+    # Envelope of the next message (the deferred ones first) - None if there is none within the timeout or if it does not follow the protocol
+    async def receive_envelope(self, timeout=None):
+        if self.deferred:
+            return self.deferred.popleft()[1]
+        return read_message(await super().receive(timeout=timeout))
+
+    # Sends the request and returns the Envelope of the answer, or None if there is none within the timeout
+    async def request(self, to, kind, role, entity, subject="", value="", timeout=REQUEST_TIMEOUT):
+        loop = asyncio.get_running_loop()
+        correlation_id = protocol.new_correlation_id()
+        future = loop.create_future()
+        self.pending[correlation_id] = (future, time.perf_counter(), kind)
+
+        await self.send(make_message(to, protocol.encode(kind, role, entity, subject, value, correlation_id=correlation_id, sent_at=f"{time.time():.3f}")))
+
+        deadline = loop.time() + timeout
+        try:
+            while not future.done():
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    protocol.request_stats.timeouts += 1
+                    metrics.increment("request_timeouts", protocol.KIND_NAMES[kind])
+                    events.agent.warning("request_timeout", agent=str(self.agent.jid), request=protocol.KIND_NAMES[kind], correlation_id=correlation_id)
+                    return None
+
+                # Only route() completes the request, from the messages received here
+                msg = await super().receive(timeout=remaining)
+                if msg:
+                    self.route(msg)
+
+            return future.result()
+        finally:
+            self.pending.pop(correlation_id, None)
+
+    # Same as request(), but a "busy" answer (the central is overloaded) is retried after exactly the wait it asks for - returns the first other answer, or None
+    async def request_until_handled(self, to, kind, role, entity, subject="", value="", timeout=REQUEST_TIMEOUT):
+        while True:
+            envelope = await self.request(to, kind, role, entity, subject, value, timeout)
+            if envelope is None or envelope.kind != protocol.BUSY:
+                return envelope
+            events.agent.info("central_busy", agent=str(self.agent.jid), request=protocol.KIND_NAMES[kind], retry_after=envelope.value)
+            await asyncio.sleep(float(envelope.value))
+
+    # Takes out of the mailbox the first message of that kind received while waiting for an answer - None if there is none
+    def take_deferred(self, kind):
+        for deferred in self.deferred:
+            if deferred[1].kind == kind:
+                self.deferred.remove(deferred)
+                return deferred[1]
+        return None
+
+    # Completes the request the message answers, or keeps it with its Envelope for the next receive_envelope() - a message that does not follow the protocol is dropped
+    def route(self, msg):
+        envelope = read_message(msg)
+        if envelope is None:
+            return
+        request = self.pending.pop(envelope.correlation_id, None) if envelope.correlation_id else None
+
+        if request is None:
+            self.deferred.append((msg, envelope))
+        else:
+            future, sent_at, kind = request
+            if not future.done():
+                latency = time.perf_counter() - sent_at
+                protocol.request_stats.record(latency)
+                metrics.observe("request_seconds", protocol.KIND_NAMES[kind], latency)
+                future.set_result(envelope)
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
 
 class TrafficLightAgent(Agent):
-    def __init__(self, jid, password, environment, traffic_light_name, central_jid):
+    def __init__(self, jid, password, environment, traffic_light_name, central_jid, signal_control="fixed", signal_plan=None):
         super().__init__(jid, password)
         self.environment = environment  # Reference to the simulation environment
         self.traffic_light_name = traffic_light_name # Traffic Light id, ex: "Traffic_Light_1"
         self.central_jid = central_jid # The JID of the CentralCordinateAgent
+        self.signal_control = signal_control # "fixed" cycle or "actuated" by the queues (see coordination.ActuatedController)
+        self.signal_plan = signal_plan or coordination.SignalPlan() # Durations/offset of the fixed cycle
+        self.color_changed_at = time.monotonic() # Time of the last change of its color, whatever the reason
 
     async def setup(self):
-        print(f"{self.traffic_light_name} started")
-        self.add_behaviour(self.TrafficLightBehaviour())
+        events.agent.info("traffic_light_started", traffic_light=self.traffic_light_name)
+        self.environment.subscribe_traffic_lights(self.traffic_light_changed)
+        if self.signal_control == "actuated":
+            self.add_behaviour(self.ActuatedTrafficLightBehaviour())
+        else:
+            self.add_behaviour(self.TrafficLightBehaviour())
+
+    def traffic_light_changed(self, traffic_light_name, color_name, version):
+        if traffic_light_name == self.traffic_light_name:
+            self.color_changed_at = time.monotonic()
 
     class TrafficLightBehaviour(CyclicBehaviour):
+        # The offset of the plan: the first color lasts longer
+        async def on_start(self):
+            await asyncio.sleep(self.agent.signal_plan.offsets.get(self.agent.traffic_light_name, 0))
+
         async def run(self):
+            started = metrics.start()
 
             current_color_name = self.agent.environment.get_traffic_light(self.agent.traffic_light_name)
 
             # Waits for a message from the CentralCordinateAgent
-            msg = await self.receive(timeout=1)
+            envelope = read_message(await self.receive(timeout=1))
+            await self.handle(envelope, current_color_name)
+
+            # Wait for some time before changing the color again (the duration of the color in the plan, minus the second of the receive)
+            await asyncio.sleep(max(self.agent.signal_plan.durations[current_color_name] - 1, 0))
+
+            # Find the next color name in the cycle
+            next_color_name = coordination.next_color(current_color_name)
+
+            # Update the traffic light color in the environment
+            self.agent.environment.update_traffic_light(self.agent.traffic_light_name, next_color_name, None)
+            metrics.elapsed("behaviour_seconds", "traffic_light", started)
 
-            if msg:
+        # Handles a message of the central (None = no message)
+        async def handle(self, envelope, current_color_name):
+            if envelope is not None:
+                handled = metrics.start()
 
                 # If the message is to know the color of the traffic light at the moment
-                if msg.body == "color":
-                    msg = Message(to=str(self.agent.central_jid))
-                    msg.set_metadata("performative", "inform")
-                    msg.body = current_color_name
-                    await self.send(msg)
+                if envelope.kind == protocol.COLOR:
+                    await self.send(make_message(self.agent.central_jid, protocol.reply(envelope, protocol.COLOR_REPLY, protocol.TRAFFIC_LIGHT, self.agent.traffic_light_name,
+                                                                                        subject=self.agent.traffic_light_name, value=current_color_name)))
 
                 # If the message is to let the traffic light know it is an emergency and that it needs to change itself to green
-                elif msg.body == "emergency":
+                elif envelope.kind == protocol.EMERGENCY:
                     await self.change_color_ambulance()
 
                 #  If the message is to let the traffic light know there is a person who wants to cross the street and that it needs to change itself to red
-                elif msg.body == "person":
+                elif envelope.kind == protocol.PERSON_CROSSING:
                     await self.change_color_person()
-                
-                # Check if the message is (new_color:event) type
-                elif isinstance(msg.body, str):
-                    
-                    parts = msg.body.split(':')
-
-                    if len(parts) == 2:
-                        new_color_name, event_type = parts
-
-                        if new_color_name in colors and event_type in ["emergency", "person"]:
-
-                            if event_type == "emergency":
-                                self.agent.environment.update_traffic_light(self.agent.traffic_light_name, new_color_name, "emergency")
-                            else:
-                                self.agent.environment.update_traffic_light(self.agent.traffic_light_name, new_color_name, "person")
-                
-            # Wait for some time before changing the color again
-            await asyncio.sleep(2)
 
-            # Find the next color name in the cycle
-            next_color_name = colors[(colors.index(current_color_name) + 1) % len(colors)]
-            
-            # Update the traffic light color in the environment
-            self.agent.environment.update_traffic_light(self.agent.traffic_light_name, next_color_name, None)
-    
+                # If the message is to change to a new color due to an event (emergency or person)
+                elif envelope.kind == protocol.SET_COLOR:
+                    if envelope.value in colors and envelope.event in ["emergency", "person"]:
+                        self.agent.environment.update_traffic_light(self.agent.traffic_light_name, envelope.value, envelope.event)
+
+                metrics.elapsed("traffic_light_handler_seconds", protocol.KIND_NAMES[envelope.kind], handled)
+
 
         # Changes itself to green/red in case of emergency/person wanting to cross
         async def change_color_ambulance(self):
             # Method to send to the central a warning that it is going to change to green so that the others change to other colors (pre defined)
-            msg_change = Message(to=str(self.agent.central_jid))
-            msg_change.set_metadata("performative", "request")
-            msg_change.body = "changed to green"
-            await self.send(msg_change)
+            await self.send(make_message(self.agent.central_jid, protocol.encode(protocol.CHANGED_TO_GREEN, protocol.TRAFFIC_LIGHT, self.agent.traffic_light_name), "request"))
 
             # Change itself to green
             await asyncio.sleep(2)
             self.agent.environment.update_traffic_light(self.agent.traffic_light_name, "green", "emergency")
-    
+
         async def change_color_person(self):
             # Method to send to the central a warning that it is going to change to red so that the others change to other colors (pre defined)
-            msg_change = Message(to=str(self.agent.central_jid))
-            msg_change.set_metadata("performative", "request")
-            msg_change.body = "changed to red"
-            await self.send(msg_change)
+            await self.send(make_message(self.agent.central_jid, protocol.encode(protocol.CHANGED_TO_RED, protocol.TRAFFIC_LIGHT, self.agent.traffic_light_name), "request"))
 
             # Change itself to red
             await asyncio.sleep(2)
             self.agent.environment.update_traffic_light(self.agent.traffic_light_name, "red", "person")
-            
-#--------------------------------------------------------------------------------------------------------------------------------------------------------------      
+
+    # Same messages as the fixed cycle, but the color changes when the ActuatedController decides it (checked every second)
+    class ActuatedTrafficLightBehaviour(TrafficLightBehaviour):
+        async def on_start(self):
+            self.controller = coordination.ActuatedController(self.agent.environment, self.agent.traffic_light_name)
+
+        async def run(self):
+            started = metrics.start()
+            environment = self.agent.environment
+            name = self.agent.traffic_light_name
+
+            envelope = read_message(await self.receive(timeout=1))
+            await self.handle(envelope, environment.get_traffic_light(name))
+
+            current_color_name = environment.get_traffic_light(name)
+            new_color_name = self.controller.decide(current_color_name, time.monotonic() - self.agent.color_changed_at)
+            if new_color_name != current_color_name:
+                environment.update_traffic_light(name, new_color_name, None)
+            metrics.elapsed("behaviour_seconds", "traffic_light", started)
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
 
 class CentralCordinateAgent(Agent):
-    def __init__(self, jid, password, environment, traffic_light_jid_1, traffic_light_jid_2, traffic_light_jid_3):
+    def __init__(self, jid, password, environment, traffic_light_jids, signal_plan=None, queue_capacity=QUEUE_CAPACITY, request_deadline=REQUEST_TIMEOUT):
         super().__init__(jid, password)
         self.environment = environment  # Reference to the simulation environment
-        self.traffic_light_jid_1 = traffic_light_jid_1 # JID of the different traffic lights
-        self.traffic_light_jid_2 = traffic_light_jid_2
-        self.traffic_light_jid_3 = traffic_light_jid_3
-        self.message_queue = Queue() # Queue to store the messages by order
+        self.traffic_light_jids = dict(traffic_light_jids) # JID of the different traffic lights, ex: "Traffic_Light_1": "traffic_light1@localhost"
+        self.signal_plan = signal_plan or coordination.SignalPlan() # Colors of the other traffic lights when one overrides its color
+        self.queue_capacity = queue_capacity # Capacity of the queues of the vehicles and people, None = unbounded (the emergencies and traffic lights are never refused)
+        self.request_deadline = request_deadline # Seconds after which a queued request of a vehicle/person is dropped, None = never
         self.lock = Lock() # Method used so that actions occure exclusively to avoid concurrency problems
-        
+        self.traffic_light_cache = coordination.TrafficLightCache() # Colors of the traffic lights, pushed by the environment on every change
+        self.decisions = 0 # Number of answers sent to vehicles and people
+        self.emergencies = 0 # Number of emergencies alerted
+        self.lookups_saved = 0 # Number of requests answered with the traffic light/priority road state resolved for another request of the same cycle
+        self.busy_replies = 0 # Number of requests refused because the central was overloaded
+        self.expired = 0 # Number of requests dropped because they waited past their deadline
+
     async def setup(self):
-        print(f"CentralCordinateAgent started")
+        events.agent.info("central_started", central=str(self.jid))
+        self.environment.subscribe_traffic_lights(self.traffic_light_cache.update)
         self.add_behaviour(self.CentralBehaviour(self))
 
     class CentralBehaviour(CyclicBehaviour):
         def __init__(self, agent, *args, **kwargs):
             super().__init__(*args, **kwargs)
-            self.agent = agent 
-            self.message_queue = Queue()
-            self.lock = Lock() 
+            self.agent = agent
+            self.name = str(agent.jid) # Label of the metrics of this central
+            # Received messages by priority class, ex: (msg, Envelope, received at) - only the requests of the vehicles and people are bounded/dropped
+            n_classes = len(protocol.PRIORITY_CLASS_NAMES)
+            bounded = (protocol.VEHICLE_CLASS, protocol.PEDESTRIAN_CLASS)
+            self.message_queue = coordination.PriorityScheduler(n_classes,
+                                                                [agent.queue_capacity if priority_class in bounded else None for priority_class in range(n_classes)],
+                                                                [agent.request_deadline if priority_class in bounded else None for priority_class in range(n_classes)])
+            self.lock = Lock()
+            self.emergency_batch = coordination.EmergencyBatch() # Emergencies of the current cycle, by road
+            self.state_requests = {} # "may i go?"/"color" requests of the current cycle, by the state they depend on, ex: ("traffic_light", "Traffic_Light_1"): [(msg, envelope)]
+
+            # Handler of every kind of request
+            self.handlers = {protocol.MAY_I_GO: self.handle_may_i_go,
+                             protocol.COLOR: self.handle_color,
+                             protocol.EMERGENCY: self.handle_emergency,
+                             protocol.CHANGE_TO_RED: self.handle_change_to_red,
+                             protocol.CHANGED_TO_GREEN: self.handle_traffic_light_changed,
+                             protocol.CHANGED_TO_RED: self.handle_traffic_light_changed}
 
         async def run(self):
+            started = metrics.start()
 
-            await asyncio.sleep(1)
-     
-            # Recieves the messages and stores them
-            message = await self.receive(timeout=0.25)
-            while message:
-                self.message_queue.put(message)
-                message = await self.receive(timeout=0.25)
-                
+            await asyncio.sleep(CENTRAL_SLEEP)
 
-            # Processes the messages from the queue
+            # Recieves the messages and stores them - when the queue of a class is full, its oldest message is answered "busy" right away
+            refused = 0
+            message = await self.receive(timeout=RECEIVE_TIMEOUT)
+            window_end = time.perf_counter() + RECEIVE_WINDOW
+            while message:
+                envelope = read_message(message)
+                if envelope is not None:
+                    priority_class = protocol.PRIORITY_CLASSES.get(envelope.kind, protocol.PEDESTRIAN_CLASS)
+                    received = time.perf_counter()
+                    # The deadline counts from the send, so the time in the mailbox and the sleep of the cycle count too
+                    sent = protocol.sent_time(envelope, time.time())
+                    refused_message = self.message_queue.put(priority_class, (message, envelope, received), sent)
+                    if refused_message is not None:
+                        await self.answer_busy(*refused_message[:2], priority_class, refused)
+                        refused += 1
+                if time.perf_counter() > window_end: # The rest waits in the mailbox for the next cycle
+                    break
+                message = await self.receive(timeout=RECEIVE_TIMEOUT)
+
+            metrics.gauge("central_queue_depth", self.name, len(self.message_queue))
+
+            # Processes the messages from the queue, the most urgent class first
             async with self.agent.lock:
-                while not self.message_queue.empty():
-                    msg = self.message_queue.get() 
-
-                #--------------------------------------------------------------------------------------------------------------------------------------------------------------     
-
-                    # If the message is from an ambulance
-                    if "ambulance" in str(msg.sender):
-                        # If the message is to inform there is an emergency
-                        if msg.body == "emergency":
-                            
-                            ambulance_jid = msg.sender
-
-                            # Get the ambulance instance
-                            ambulance = self.agent.environment.ambulances[ambulance_jid]
-                
-                            # Checks if the road where the ambulance is at has a traffic light
-                            if ambulance.road.traffic_light != "No traffic light":
-
-                                if ambulance.road.traffic_light == "Traffic_Light_1":
-                                    traffic_light_jid = self.agent.traffic_light_jid_1
-                                
-                                elif ambulance.road.traffic_light == "Traffic_Light_2":
-                                    traffic_light_jid = self.agent.traffic_light_jid_2
-
-                                elif ambulance.road.traffic_light == "Traffic_Light_3":
-                                    traffic_light_jid = self.agent.traffic_light_jid_3
-                
-                                # Construct the message to the traffic light agent - only the one on its road
-                                traffic_light_msg = Message(to=str(traffic_light_jid))
-                                traffic_light_msg.set_metadata("performative", "inform")
-                                traffic_light_msg.body = "emergency" 
-                                await self.send(traffic_light_msg)
-
-                                print(f"Emergency at {ambulance.ambulance_id}. Changing traffic light {ambulance.road.traffic_light} to green. All the cars on {ambulance.road.name} must stop")
-
-                                # Construct the message to the car agents - only the ones on its road
-                                car_agents = list(self.agent.environment.cars.keys())  # Convert dict_keys to a list
-
-                                for car_jid in car_agents:
-                                    
-                                    car = self.agent.environment.cars[car_jid]  # Get the car instance 
-                            
-                                    # Ensure car has the same road as the ambulance
-                                    if car.road.name == ambulance.road.name:
-                                        
-                                        car_msg = Message(to=str(traffic_light_jid))
-                                        car_msg.set_metadata("performative", "inform")
-                                        car_msg.body = "emergency" 
-                                        await self.send(car_msg)
-                                
-                            
-                            # The road where the ambulance is at does not have a traffic light
-                            else:
-
-                                # Construct the message to the car agents - only the ones on its road
-                                car_agents = list(self.agent.environment.cars.keys())  # Convert dict_keys to a list
-                                
-                                for car_jid in car_agents:
-                                    
-                                    car = self.agent.environment.cars[car_jid]  # Get the car instance 
-                                    
-                                    # Ensure car has the same road as the ambulance
-                                    if car.road.name == ambulance.road.name:
-                                        
-                                        car_msg = Message(to=str(car_jid))
-                                        car_msg.set_metadata("performative", "inform")
-                                        car_msg.body = "emergency" 
-                                        await self.send(car_msg)
-
-                                print(f"Emergency at {ambulance.ambulance_id}. All the cars on {ambulance.road.name} must stop.")
-
-
-                        # If the message is to know the state of the traffic light at the ambulance's road
-                        elif msg.body == "color":
-
-                            ambulance_jid = msg.sender
-
-                            # Get the ambulance instance
-                            ambulance = self.agent.environment.ambulances[ambulance_jid]
-
-                            if ambulance.road.traffic_light == "Traffic_Light_1":
-                                traffic_light_jid = self.agent.traffic_light_jid_1
-                            
-                            elif ambulance.road.traffic_light == "Traffic_Light_2":
-                                traffic_light_jid = self.agent.traffic_light_jid_2
-
-                            elif ambulance.road.traffic_light == "Traffic_Light_3":
-                                traffic_light_jid = self.agent.traffic_light_jid_3
-                            
-                            # Construct the message to the traffic light agent - only the one on its road - to ask for its color
-                            traffic_light_msg = Message(to=str(traffic_light_jid))
-                            traffic_light_msg.set_metadata("performative", "inform")
-                            traffic_light_msg.body = "color" 
-                            await self.send(traffic_light_msg)
-                            
-                            # Wait for a response from the CentralCordinateAgent
-                            expected_sender = str(traffic_light_jid)
-                            msg_1 = None
-
-                            # Loop to wait for the expected message
-                            while not msg_1 or str(msg_1.sender) != expected_sender:
-                                msg_1 = await self.receive(timeout=1) 
-                
-                            if msg_1:
-                                if msg_1.body in colors:
-                                    
-                                    # Sends back the color of the ambulance
-                                    ambulance_msg = Message(to=str(ambulance_jid))
-                                    ambulance_msg.set_metadata("performative", "inform")
-                                    ambulance_msg.body = msg_1.body
-                                    await self.send(ambulance_msg)
-
-                #--------------------------------------------------------------------------------------------------------------------------------------------------------------      
-
-                    # If the message is from a car
-                    elif "vehicle" in str(msg.sender):
-                        
-                        # If the message is to ask if it can go ahead
-                        if msg.body == "may i go?":
-
-                            car_jid = msg.sender
-
-                            # Get the car instance
-                            car = self.agent.environment.cars[car_jid]
-
-                            # If the road where the car is at has a traffic light
-                            if car.road.traffic_light != "No traffic light":
-
-                                if car.road.traffic_light == "Traffic_Light_1":
-                                    traffic_light_jid = self.agent.traffic_light_jid_1
-                                
-                                elif car.road.traffic_light == "Traffic_Light_2":
-                                    traffic_light_jid = self.agent.traffic_light_jid_2
-
-                                elif car.road.traffic_light == "Traffic_Light_3":
-                                    traffic_light_jid = self.agent.traffic_light_jid_3
-                                
-                                # Construct the message to the traffic light agent - only the one on its road - to ask for its color
-                                traffic_light_msg = Message(to=str(traffic_light_jid))
-                                traffic_light_msg.set_metadata("performative", "inform")
-                                traffic_light_msg.body = "color" 
-                                await self.send(traffic_light_msg)
-
-                                # Waits for a response from the traffic light
-                                expected_sender = str(traffic_light_jid)
-                                msg_2 = None
-
-                                # Loop to wait for the expected message
-                                while not msg_2 or str(msg_2.sender) != expected_sender:
-                                    msg_2 = await self.receive(timeout=1) 
-                    
-                                if msg_2:
-                                    if msg_2.body in colors:
-
-                                        if msg_2.body == "green":
-                                            command = "move"
-                                        
-                                        else:
-                                            command = "stop"
-                    
-
-                            # If the road where the car is at has no traffic light, which means it is at road_9 which has a traffic signal
-                            else:
-                                
-                                # Check if there is any vehicle ou ambulance on position 5 on the roads: road_5 and road_6
-                                for car_jid, car in self.cars.items():
-                                    if car.road.name == "road_5" or car.road.name == "road_6":
-                                        if car.position == 5:
-                                            command = "give priority"
-
-                                for ambulance_jid, ambulance in self.ambulances.items():
-                                    if ambulance.road.name == "road_5" or ambulance.road.name == "road_6":
-                                        if ambulance.position == 5:
-                                            command = "give priority"
-
-
-                            # Sends back the command to the car
-                            car_msg = Message(to=str(car_jid))
-                            car_msg.set_metadata("performative", "inform")
-                            car_msg.body = command
-                            await self.send(car_msg)
-
-                #--------------------------------------------------------------------------------------------------------------------------------------------------------------      
-
-                    # If the message is from a traffic light
-                    elif "traffic_light" in str(msg.sender):
-
-                        # If the message is for the other traffic lights - the sender changed to green so the others must change themselfs to the correspondant colors
-                        if msg.body == "changed to green":
-
-                            # Extract the number of the traffic light that sent the msg
-                            traffic_light_number = int(str(msg.sender).split("@")[0][-1])
-
-                            # Create the traffic_light_name based on the number extracted above
-                            traffic_light_name = f"Traffic_Light_{traffic_light_number}"
-
-                            # Define the new colors based on the traffic light that sent the message
-                            new_colors = self.define_new_colors_ambulance(traffic_light_name)
-
-                            # Sends the messages to the other traffic lights with the new colors - the ones they must change to
-                            for other_traffic_light, new_color in new_colors.items():
-                                change_msg = Message(to=str(other_traffic_light))
-                                change_msg.set_metadata("performative", "inform")
-                                change_msg.body = f"{new_color}:emergency" # The event is only for print purposes so the user can identify the reason why the traffic light has changed
-                                await self.send(change_msg)
-
-                        # If the message is for the other traffic lights - the sender changed to red so that the others must change themselfs to the correspondant colors
-                        elif msg.body == "changed to red":
-
-                            # Extract the number of the traffic light that sent the msg
-                            traffic_light_number = int(str(msg.sender).split("@")[0][-1])
-
-                            # Create the traffic_light_name based on the number extracted above
-                            traffic_light_name = f"Traffic_Light_{traffic_light_number}"
-
-                            # Define the new colors based on the traffic light that sent the message
-                            new_colors = self.define_new_colors_person(traffic_light_name)
-
-                            # Sends the messages to the other traffic lights with the new colors - the ones they must change to
-                            for other_traffic_light, new_color in new_colors.items():
-                                change_msg = Message(to=str(other_traffic_light))
-                                change_msg.set_metadata("performative", "inform")
-                                change_msg.body = f"{new_color}:person" # The event is only for print purposes so that the user can identify the reason why the traffic light has changed
-                                await self.send(change_msg)
-
-                #--------------------------------------------------------------------------------------------------------------------------------------------------------------      
-
-                    # If the message is from a person
-                    elif "person" in str(msg.sender):
-
-                        # If the message is to request the traffic light at his road to change to red
-                        if msg.body == "change to red":
-
-                            person_jid = msg.sender
-
-                            # Get the person instance
-                            person = self.agent.environment.people[person_jid]
-            
-                            if person.road.zebra_crossing == "Zebra_Crossing_1":
-                                traffic_light_jid = self.agent.traffic_light_jid_1
-                            
-                            elif person.road.zebra_crossing == "Zebra_Crossing_2":
-                                traffic_light_jid = self.agent.traffic_light_jid_2
+                locked = metrics.start()
+
+                expired = list(self.message_queue.expired)
+                while self.message_queue:
+                    try:
+                        priority_class, (msg, envelope, received) = self.message_queue.get(time.time())
+                    except IndexError: # The last messages were past their deadline
+                        break
+                    metrics.elapsed("central_wait_seconds", protocol.PRIORITY_CLASS_NAMES[priority_class], received)
+
+                    # The emergencies are alerted as soon as their class is done, before any request of the other classes is handled
+                    if priority_class != protocol.EMERGENCY_CLASS and self.emergency_batch.roads:
+                        await self.alert_emergencies()
+
+                    handler = self.handlers.get(envelope.kind)
+                    if handler is not None:
+                        handled = metrics.start()
+                        await handler(msg, envelope)
+                        metrics.elapsed("central_handler_seconds", protocol.KIND_NAMES[envelope.kind], handled)
+                    else:
+                        events.central.warning("unexpected_message", central=str(self.agent.jid), request=protocol.KIND_NAMES[envelope.kind], sender=str(msg.sender))
+
+                # Alerts the roads with emergencies (if there were only emergencies), then answers the requests that depend on the state of a traffic light/priority road
+                await self.alert_emergencies()
+                await self.answer_state_requests()
+                self.emergency_batch.end_cycle()
+                self.count_expired(expired)
+
+                metrics.elapsed("lock_hold_seconds", self.name, locked)
+
+            metrics.elapsed("behaviour_seconds", "central", started)
+
+        # Sends the answer to a request and counts the decision
+        async def answer(self, msg, envelope, kind, value):
+            await self.send(make_message(msg.sender, protocol.reply(envelope, kind, protocol.CENTRAL, self.agent.jid, subject=envelope.subject, value=value)))
+            self.agent.decisions += 1
+            events.central.debug("decision", central=str(self.agent.jid), request=protocol.KIND_NAMES[envelope.kind], sender=envelope.entity, command=value)
+
+        # Refuses a request the central has no room for: the sender asks again after the retry-after, longer for every "capacity" requests
+        # already refused in this cycle, so that a spike comes back spread over the next cycles instead of all at once
+        async def answer_busy(self, msg, envelope, priority_class, refused):
+            retry_after = RETRY_AFTER * (1 + refused // (self.agent.queue_capacity or 1))
+            await self.send(make_message(msg.sender, protocol.reply(envelope, protocol.BUSY, protocol.CENTRAL, self.agent.jid, subject=envelope.subject, value=retry_after)))
+            self.agent.busy_replies += 1
+            metrics.increment("central_busy_replies", protocol.PRIORITY_CLASS_NAMES[priority_class])
+            events.central.debug("busy", central=str(self.agent.jid), request=protocol.KIND_NAMES[envelope.kind], sender=envelope.entity, retry_after=retry_after)
+
+        # Requests dropped without an answer in this cycle (their sender already timed out), by class - "before" are the counts at the start of the cycle
+        def count_expired(self, before):
+            for priority_class, (n_before, n_after) in enumerate(zip(before, self.message_queue.expired)):
+                if n_after > n_before:
+                    self.agent.expired += n_after - n_before
+                    metrics.increment("central_expired", protocol.PRIORITY_CLASS_NAMES[priority_class], n_after - n_before)
+                    events.central.debug("expired", central=str(self.agent.jid), priority_class=protocol.PRIORITY_CLASS_NAMES[priority_class], requests=n_after - n_before)
+
+        #--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+        # Ambulance: there is an emergency - the alerts go out once per road at the end of the cycle
+        async def handle_emergency(self, msg, envelope):
+
+            # Get the ambulance instance
+            ambulance = self.agent.environment.ambulances[msg.sender]
+            self.emergency_batch.add(ambulance)
+
+        # Ambulance: state of the traffic light at the ambulance's road - answered at the end of the cycle, with the other requests on the same traffic light
+        async def handle_color(self, msg, envelope):
+
+            # Get the ambulance instance
+            ambulance = self.agent.environment.ambulances[msg.sender]
+            self.state_requests.setdefault(("traffic_light", ambulance.road.traffic_light), []).append((msg, envelope))
+
+        #--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+        # Car: asks if it can go ahead - answered at the end of the cycle, with the other requests on the same traffic light/priority road
+        async def handle_may_i_go(self, msg, envelope):
+
+            # Get the car instance
+            car = self.agent.environment.cars[msg.sender]
+
+            # If the road where the car is at has a traffic light the answer depends on its color, otherwise (road_9, with a traffic signal) on the roads it gives priority to
+            if car.road.traffic_light != "No traffic light":
+                self.state_requests.setdefault(("traffic_light", car.road.traffic_light), []).append((msg, envelope))
+            else:
+                self.state_requests.setdefault(("priority", car.road), []).append((msg, envelope))
+
+        # Resolves the state once per traffic light/priority road and answers all the requests waiting on it
+        async def answer_state_requests(self):
+            state_requests, self.state_requests = self.state_requests, {}
 
-                            elif person.road.zebra_crossing == "Zebra_Crossing_3":
-                                traffic_light_jid = self.agent.traffic_light_jid_3
+            for (state, key), requests in state_requests.items():
+                self.agent.lookups_saved += len(requests) - 1
 
-                            # Construct the message to the traffic light agent - only the one on its road - to ask for its color
-                            traffic_light_msg = Message(to=str(traffic_light_jid))
-                            traffic_light_msg.set_metadata("performative", "inform")
-                            traffic_light_msg.body = "color" 
-                            await self.send(traffic_light_msg)
+                if state == "traffic_light":
 
-                            # Wait for a response from the CentralCordinateAgent
-                            expected_sender = str(traffic_light_jid)
-                            msg_3 = None
+                    # The color comes from the cache - no need to ask the traffic light
+                    color_name = self.agent.traffic_light_cache.get(key)
+                    command = coordination.command_for_light(color_name)
 
-                            # Loop to wait for the expected message
-                            while not msg_3 or str(msg_3.sender) != expected_sender:
-                                msg_3 = await self.receive(timeout=1) 
+                    for msg, envelope in requests:
 
-                            command = "move" #default command
+                        # Sends back the command to the car
+                        if envelope.kind == protocol.MAY_I_GO:
+                            await self.answer(msg, envelope, protocol.COMMAND, command)
 
-                            if msg_3:
-                                if msg_3.body in colors:
-                                    
-                                    if msg.body == "red":
-                                        command = "move"
-                                    else:
-                                        # Check if there's an "emergency" message from any ambulance on a road with a traffic light - the ambulance has priority
-                                        ambulance_queue = Queue()
+                        # Sends back the color to the ambulance
+                        elif color_name in colors:
+                            await self.answer(msg, envelope, protocol.COLOR_REPLY, color_name)
 
-                                        # Creates a copy of the message_queue so that the original one is not changed
-                                        ambulance_queue.queue = self.message_queue.queue.copy()
-                                        
-                                        # Checks if theres any emergency on any road with a traffic light
-                                        while not ambulance_queue.empty():
-                            
-                                            ambulance_msg = ambulance_queue.get()
+                else:
+
+                    # Check if there is any vehicle ou ambulance on position 5 on the roads it gives priority to: road_5 and road_6
+                    command = coordination.command_for_priority_road(self.agent.environment, key)
+
+                    for msg, envelope in requests:
+                        await self.answer(msg, envelope, protocol.COMMAND, command)
+
+        #--------------------------------------------------------------------------------------------------------------------------------------------------------------
 
-                                            if ambulance_msg.body == "emergency":
-                                                ambulance_jid = msg.sender
+        # Traffic light: the sender changed to green (emergency) or to red (person) so the others must change themselfs to the correspondant colors
+        async def handle_traffic_light_changed(self, msg, envelope):
 
-                                                ambulance = self.agent.environment.ambulances[ambulance_jid]
+            # The sender is identified by its traffic light id, whatever its JID
+            traffic_light_name = envelope.entity
 
-                                                # If there is some emergency
-                                                if ambulance.road.traffic_light != "No traffic light":
-                                                    command = "wait"
+            # Define the new colors based on the traffic light that sent the message
+            event = "emergency" if envelope.kind == protocol.CHANGED_TO_GREEN else "person"
+            new_colors = self.agent.signal_plan.new_colors(traffic_light_name, event, self.agent.environment.phases)
 
-                                        # If there is not any emergency
-                                        if command != "wait":    
+            # Sends the messages to the other traffic lights with the new colors - the ones they must change to
+            # The event is only for print purposes so the user can identify the reason why the traffic light has changed
+            for other_traffic_light, new_color in new_colors.items():
+                await self.send(make_message(self.agent.traffic_light_jids[other_traffic_light],
+                                             protocol.encode(protocol.SET_COLOR, protocol.CENTRAL, self.agent.jid, subject=other_traffic_light, value=new_color, event=event)))
 
-                                            # Construct the message to the traffic light agent - only the one on its road - to change the traffic light to red
-                                            traffic_light_msg = Message(to=str(traffic_light_jid))
-                                            traffic_light_msg.set_metadata("performative", "inform")
-                                            traffic_light_msg.body = "person" 
-                                            await self.send(traffic_light_msg)
-                                            
-                                            print(f"Changing {person.road.traffic_light} to red.")
+        #--------------------------------------------------------------------------------------------------------------------------------------------------------------
 
-                                            command = "move"
+        # Person: requests the traffic light at his road to change to red
+        async def handle_change_to_red(self, msg, envelope):
 
-                                    # Send the command (move or wait) to the person
-                                    person_msg = Message(to=str(person_jid))
-                                    person_msg.set_metadata("performative", "inform")
-                                    person_msg.body = command
-                                    await self.send(person_msg)
+            # Get the person instance
+            person = self.agent.environment.people[msg.sender]
 
+            traffic_light_jid = self.agent.traffic_light_jids[person.road.traffic_light]
 
-                        
+            # The color comes from the cache - no need to ask the traffic light
+            color_name = self.agent.traffic_light_cache.get(person.road.traffic_light)
 
+            if color_name in colors:
 
-        # Define the new colors based on the traffic light that sent the message
-        def define_new_colors_ambulance(self, sender_traffic_light):
+                # Check if there's an "emergency" from an ambulance on a road of a traffic light of the same intersection - the ambulance has priority
+                # The emergencies are handled before the people, so every emergency of the cycle is already in the index of the batch
+                environment = self.agent.environment
+                intersection_traffic_lights = environment.intersection_traffic_lights.get(environment.traffic_light_intersection.get(person.road.traffic_light), [person.road.traffic_light])
+                emergency_pending = self.emergency_batch.pending_on_traffic_light(intersection_traffic_lights)
 
-            new_colors = {}
+                command, change_to_red = coordination.command_for_person(color_name, emergency_pending)
 
-            if sender_traffic_light == "Traffic_Light_1":
-                new_colors[self.agent.traffic_light_jid_2] = "red"
-                new_colors[self.agent.traffic_light_jid_3] = "yellow"
+                if change_to_red:
 
-            elif sender_traffic_light == "Traffic_Light_2":
-                new_colors[self.agent.traffic_light_jid_1] = "yellow"
-                new_colors[self.agent.traffic_light_jid_3] = "red"
+                    # Construct the message to the traffic light agent - only the one on its road - to change the traffic light to red
+                    await self.send(make_message(traffic_light_jid, protocol.encode(protocol.PERSON_CROSSING, protocol.CENTRAL, self.agent.jid, subject=person.road.traffic_light)))
 
-            elif sender_traffic_light == "Traffic_Light_3":
-                new_colors[self.agent.traffic_light_jid_1] = "red"
-                new_colors[self.agent.traffic_light_jid_2] = "yellow"
+                    events.central.info("change_to_red", traffic_light=person.road.traffic_light)
 
-            return new_colors
-        
-        def define_new_colors_person(self, sender_traffic_light):
+                # Send the command (move or wait) to the person
+                await self.answer(msg, envelope, protocol.COMMAND, command)
 
-            new_colors = {}
+        #--------------------------------------------------------------------------------------------------------------------------------------------------------------
 
-            if sender_traffic_light == "Traffic_Light_1":
-                new_colors[self.agent.traffic_light_jid_2] = "yellow"
-                new_colors[self.agent.traffic_light_jid_3] = "green"
+        # One alert per road with emergencies: the traffic light on the road changes to green and every car on the road (from the road index) stops
+        async def alert_emergencies(self):
+            for road, ambulance_ids in self.emergency_batch.take().items():
+                ambulance_id = ", ".join(ambulance_ids)
+                body = protocol.encode(protocol.EMERGENCY, protocol.CENTRAL, self.agent.jid, subject=road.name)
 
-            elif sender_traffic_light == "Traffic_Light_2":
-                new_colors[self.agent.traffic_light_jid_1] = "green"
-                new_colors[self.agent.traffic_light_jid_3] = "yellow"
+                # Checks if the road where the ambulance is at has a traffic light
+                if road.traffic_light != "No traffic light":
 
-            elif sender_traffic_light == "Traffic_Light_3":
-                new_colors[self.agent.traffic_light_jid_1] = "yellow"
-                new_colors[self.agent.traffic_light_jid_2] = "green"
+                    # Construct the message to the traffic light agent - only the one on its road
+                    await self.send(make_message(self.agent.traffic_light_jids[road.traffic_light], body))
+
+                    events.central.info("emergency_traffic_light", ambulance=ambulance_id, traffic_light=road.traffic_light, road=road.name)
+
+                else:
+                    events.central.info("emergency", ambulance=ambulance_id, road=road.name)
 
-            return new_colors
+                # The car agents on its road, all in one multicast
+                await self.multicast(list(self.agent.environment.vehicles_on_road(road, "car")), body)
+                self.agent.emergencies += len(ambulance_ids)
 
-#--------------------------------------------------------------------------------------------------------------------------------------------------------------      
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
 
 class CarAgent(Agent):
-    def __init__(self, jid, password, environment, car_id, road, central_jid):
+    def __init__(self, jid, password, environment, car_id, road, central_jid, destination=None):
         super().__init__(jid, password)
         self.environment = environment  # Reference to the simulation environment
         self.car_id = car_id  # Unique identifier for the car, ex: car_1
-        self.road = road 
+        self.road = road
         self.position = 0 # Default position
         self.central_jid = central_jid
+        self.origin = road # Start road of the current trip
+        self.destination = destination # Road the car heads for (see routing.py), None = random turns
 
     async def setup(self):
-        print(f"CarAgent: {self.car_id} started")
-        self.add_behaviour(self.CarBehaviour(self)) 
+        events.agent.info("car_started", vehicle=self.car_id)
+        self.add_behaviour(self.CarBehaviour(self))
 
-    class CarBehaviour(CyclicBehaviour):
+    class CarBehaviour(RequestBehaviour):
         def __init__(self, agent, *args, **kwargs):
             super().__init__(*args, **kwargs)
             self.agent = agent
 
         async def run(self):
+            started = metrics.start()
 
             # Check if the path is clear before moving
             if not self.agent.environment.is_vehicle_ahead(self.agent.jid, "car"):
 
                 await asyncio.sleep(3)
-                self.agent.environment.change_road(self.agent.jid, self.agent.car_id, self.agent.road, "car") 
-                self.agent.position += 1
-                print(f"{self.agent.car_id}: Moving to position {self.agent.position} on {self.agent.road.name}.")
+                self.agent.environment.move_vehicle(self.agent.jid, self.agent.car_id, "car")
+                events.vehicle.info("moving", vehicle=self.agent.car_id, position=self.agent.position, road=self.agent.road.name)
 
             else:
 
                 # Keep the car's position
-                print(f"{self.agent.car_id}: Waiting, there's a vehicle ahead on {self.agent.road.name}.")
+                events.vehicle.info("vehicle_ahead", vehicle=self.agent.car_id, road=self.agent.road.name)
 
 
             # Wait for a message from the CentralCordinateAgent
-            msg = await self.receive(timeout=1)  
-            if msg:
-                if msg.body == "emergency":
+            envelope = await self.receive_envelope(timeout=1)
+            if envelope is not None:
+                if envelope.kind == protocol.EMERGENCY:
 
                     # Keep the car's position
-                    print(f"{self.agent.car_id}: Stopping due to an emergency on {self.agent.road.name}.")
+                    events.vehicle.info("emergency_stop", vehicle=self.agent.car_id, road=self.agent.road.name)
 
             if self.agent.position == 4:
-                # If the road where the car is at has a traffic light
-                if self.agent.road.name in ["road_1", "road_2", "road_3", "road_4", "road_9"]:
+                # If the road where the car is at ends at an intersection (traffic light or priority sign)
+                if self.agent.environment.ends_at_intersection(self.agent.road):
 
-                    # Send request to the Central Agent to know if it can go ahead
-                    msg = Message(to=str(self.agent.central_jid))
-                    msg.set_metadata("performative", "inform")
-                    msg.body = "may i go?"
-                    await self.send(msg)
+                    # Send request to the Central Agent to know if it can go ahead, and wait for its answer
+                    envelope = await self.request_until_handled(self.agent.central_jid, protocol.MAY_I_GO, protocol.CAR, self.agent.car_id, subject=self.agent.road.name)
 
-                    # Wait for a message from the CentralCordinateAgent
-                    msg = await self.receive(timeout=1)  
-                    if msg:
-                        command = msg.body
+                    # An emergency on the car's road that arrived meanwhile has priority over the answer
+                    if self.take_deferred(protocol.EMERGENCY) is not None:
+                        command = "emergency"
+                    else:
+                        command = envelope.value if envelope is not None else None
+
+                    if command is not None:
 
                         # If there is an emergency on the car's road
                         if command == "emergency":
 
                             # Keep the car's position
-                            print(f"{self.agent.car_id}: Stopping due to an emergency on {self.agent.road.name}.")
+                            events.vehicle.info("emergency_stop", vehicle=self.agent.car_id, road=self.agent.road.name)
 
                         # If it can move
                         elif command == "move":
 
-                            self.agent.environment.change_road(self.agent.jid, self.agent.car_id, self.agent.road, "car") 
-                            self.agent.position += 1
-                            print(f"{self.agent.car_id}: Moving to position {self.agent.position} on {self.agent.road.name}.")
+                            self.agent.environment.move_vehicle(self.agent.jid, self.agent.car_id, "car")
+                            events.vehicle.info("moving", vehicle=self.agent.car_id, position=self.agent.position, road=self.agent.road.name)
 
                         # If the traffic light is red
                         elif command == "stop":
 
                             # Keep the car's position
-                            print(f"{self.agent.car_id}: Stopping.")
+                            events.vehicle.info("stopping", vehicle=self.agent.car_id, road=self.agent.road.name)
 
                         # If it has to let the other cars go ahead
                         elif command == "give priority":
-                            
+
                             # Keep the car's position
-                            print(f"{self.agent.car_id}: Giving priority.")
+                            events.vehicle.info("giving_priority", vehicle=self.agent.car_id, road=self.agent.road.name)
 
 
             await asyncio.sleep(3)
+            metrics.elapsed("behaviour_seconds", "car", started)
 
 
-#-------------------------------------------------------------------------------------------------------------------------------------------------------------- 
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
 
 class AmbulanceAgent(Agent):
-    def __init__(self, jid, password, environment,  ambulance_id, road, central_jid):
+    def __init__(self, jid, password, environment,  ambulance_id, road, central_jid, destination=None):
         super().__init__(jid, password)
         self.environment = environment # Reference to the simulation environment
         self.central_jid = central_jid
         self.position = 0  # Default position
         self.ambulance_id = ambulance_id # Unique identifier, ex: ambulance_1
         self.road = road
+        self.origin = road # Start road of the current trip
+        self.destination = destination # Road the ambulance heads for, ex: the hospital (see routing.py), None = random turns
 
     async def setup(self):
-        print(f"AmbulanceAgent: {self.ambulance_id} started")
+        events.agent.info("ambulance_started", vehicle=self.ambulance_id)
         self.add_behaviour(self.AmbulanceBehaviour(self))
 
-    class AmbulanceBehaviour(CyclicBehaviour):
+    class AmbulanceBehaviour(RequestBehaviour):
         def __init__(self, agent, *args, **kwargs):
             super().__init__(*args, **kwargs)
             self.agent = agent
 
         async def run(self):
+            started = metrics.start()
 
             # Check if the path is clear before moving
             if not self.agent.environment.is_vehicle_ahead(self.agent.jid, "ambulance"):
 
                 await asyncio.sleep(2)
-                self.agent.environment.change_road(self.agent.jid, self.agent.ambulance_id, self.agent.road, "ambulance") 
-                self.agent.position += 1
-                print(f"{self.agent.ambulance_id}: Moving to position {self.agent.position} on {self.agent.road.name}.")
+                self.agent.environment.move_vehicle(self.agent.jid, self.agent.ambulance_id, "ambulance")
+                events.vehicle.info("moving", vehicle=self.agent.ambulance_id, position=self.agent.position, road=self.agent.road.name)
 
             else:
 
-                print(f"{self.agent.ambulance_id}: Waiting, there's an ambulance ahead on {self.agent.road.name}.")
+                events.vehicle.info("ambulance_ahead", vehicle=self.agent.ambulance_id, road=self.agent.road.name)
 
             # It asks on the 4th position so it has time to communicate without stopping
             if self.agent.position == 4:
-                
+
                 # If the road where the ambulance is at has a traffic light
-                if self.agent.road.name in ["road_1", "road_2", "road_3", "road_4"]:
-
-                    # Send request to the Central Agent to know the color of the traffic light
-                    msg = Message(to=str(self.agent.central_jid))
-                    msg.set_metadata("performative", "inform")
-                    msg.body = "color"
-                    await self.send(msg)
-
-                    # Wait for a response from the CentralCordinateAgent
-                    msg_1 = None
-                    
-                    # Loop to wait for the expected message
-                    while not msg_1:
-                        msg_1 = await self.receive(timeout=1) 
-                  
-                    msg_color_traffic_light = msg_1.body
+                if self.agent.road.traffic_light != "No traffic light":
+
+                    # Send request to the Central Agent to know the color of the traffic light, and wait for its answer
+                    envelope = await self.request_until_handled(self.agent.central_jid, protocol.COLOR, protocol.AMBULANCE, self.agent.ambulance_id, subject=self.agent.road.traffic_light)
+
+                    # Without an answer the traffic light is treated as red - the emergency is never refused
+                    msg_color_traffic_light = envelope.value if envelope is not None else "red"
 
                     if msg_color_traffic_light in ["red", "yellow"]:
-                        
+
                         # Ambulance sends an emergency message to the central agent
-                        msg_emergency = Message(to=str(self.agent.central_jid))
-                        msg_emergency.set_metadata("performative", "inform")
-                        msg_emergency.body = "emergency"
-                        await self.send(msg_emergency)
-                        
+                        await self.send(make_message(self.agent.central_jid, protocol.encode(protocol.EMERGENCY, protocol.AMBULANCE, self.agent.ambulance_id, subject=self.agent.road.name)))
+
                         # Wait for some time to simulate the ambulance moving
                         await asyncio.sleep(2)
-                        
+
                     # If the traffic light on its road is green
-                    else: 
-                        print(f"Emergency at {self.agent.ambulance_id}: Traffic Light green. Going forward, be careful.")
-                
+                    else:
+                        events.vehicle.info("green_light", vehicle=self.agent.ambulance_id, road=self.agent.road.name)
+
                 # If the road where the ambulance is at does not have a traffic light - it is only necessary to let the cars know they must stop
                 else:
 
                     # Ambulance sends an emergency message to the central agent
-                    msg = Message(to=str(self.agent.central_jid))
-                    msg.set_metadata("performative", "inform")
-                    msg.body = "emergency"
-                    await self.send(msg)
+                    await self.send(make_message(self.agent.central_jid, protocol.encode(protocol.EMERGENCY, protocol.AMBULANCE, self.agent.ambulance_id, subject=self.agent.road.name)))
 
                     # Wait for some time to simulate the ambulance moving
                     await asyncio.sleep(2)
 
             await asyncio.sleep(2)
+            metrics.elapsed("behaviour_seconds", "ambulance", started)
 
 #--------------------------------------------------------------------------------------------------------------------------------------------------------------
 
@@ -664,41 +666,34 @@ class PersonAgent(Agent):
         self.person_id = person_id # Unique identifier, ex: person_1
 
     async def setup(self):
-        print(f"Person Agent: {self.person_id} started")
+        events.agent.info("person_started", person=self.person_id)
         self.add_behaviour(self.PersonBehaviour(self))
 
-    class PersonBehaviour(CyclicBehaviour):
+    class PersonBehaviour(RequestBehaviour):
         def __init__(self, agent):
             super().__init__()
             self.agent = agent
 
         async def run(self):
+            started = metrics.start()
 
-            print(f"{self.agent.person_id} approaching a zebra crossing on {self.agent.road.name}.")
-
-            # Person requests the traffic light, at their intersection, to change to red
-            msg_request = Message(to=str(self.agent.central_jid))
-            msg_request.set_metadata("performative", "inform")
-            msg_request.body = "change to red"
-            await self.send(msg_request)
+            events.person.info("approaching", person=self.agent.person_id, road=self.agent.road.name)
 
-            # Wait for a response from the CentralCordinateAgent
-            msg_response = None 
+            # Person requests the traffic light, at their intersection, to change to red, and waits for the answer - without one the person waits
+            envelope = await self.request_until_handled(self.agent.central_jid, protocol.CHANGE_TO_RED, protocol.PERSON, self.agent.person_id, subject=self.agent.road.traffic_light)
+            command = envelope.value if envelope is not None else "wait"
 
-            # Loop to wait for the expected message
-            while not msg_response:
-                msg_response = await self.receive(timeout=1) 
+            if command == "move":
 
-            if msg_response.body == "move":
-                
-                print(f"Central Agent responded with: {msg_response.body}. {self.agent.person_id} crossing the street.")
+                events.person.info("crossing", person=self.agent.person_id, road=self.agent.road.name, command=command)
                 # the person already crossed so he chooses a new zebra crossing
-                self.agent.environment.change_zebra_crossing(self.agent.jid) 
+                self.agent.environment.change_zebra_crossing(self.agent.jid)
 
-            else: 
+            else:
 
                 # He needs to wait (the behaviour repetes)
-                print(f"Central Agent responded with: {msg_response.body}. {self.agent.person_id} waiting.")
+                events.person.info("waiting", person=self.agent.person_id, road=self.agent.road.name, command=command)
 
             # Wait for some time to simulate the person approaching a new zebra crossing
-            await asyncio.sleep(20)
\ No newline at end of file
+            await asyncio.sleep(20)
+            metrics.elapsed("behaviour_seconds", "person", started)
@@ -0,0 +1,1213 @@
+import os
+import sys
+import time
+import random
+import json
+import argparse
+import bisect
+import platform
+import asyncio
+import tempfile
+from contextlib import redirect_stdout, asynccontextmanager
+
+# The benchmarks run without the XMPP server unless told otherwise
+os.environ.setdefault("SIM_TRANSPORT", "local")
+
+import transport
+import coordination
+import protocol
+import network
+from environment import Environment, Road
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Lightweight stand-in for a vehicle agent - the environment only needs the jid, the road and the position
+class BenchVehicle:
+    def __init__(self, jid, road):
+        self.jid = jid
+        self.road = road
+        self.position = 0
+        self.central_jid = None
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Builds an environment with n_vehicles spread over the roads where the vehicles start (1 ambulance every 10 vehicles)
+def build_fleet(n_vehicles, seed=0):
+    rng = random.Random(seed)
+    env = Environment()
+    vehicles = []
+
+    for i in range(n_vehicles):
+        type_vehicle = "ambulance" if i % 10 == 0 else "car"
+        vehicle = BenchVehicle(f"{type_vehicle}{i}@localhost", rng.choice(env.choose_new_road))
+
+        if type_vehicle == "car":
+            env.add_car_agent(vehicle)
+        else:
+            env.add_ambulance_agent(vehicle)
+
+        vehicles.append((vehicle, type_vehicle))
+
+    return env, vehicles
+
+
+# One tick: every vehicle checks the cell ahead and, if it is free, moves one position forward (like CarBehaviour/AmbulanceBehaviour)
+def run_tick(env, vehicles):
+    for vehicle, type_vehicle in vehicles:
+        if not env.is_vehicle_ahead(vehicle.jid, type_vehicle):
+            env.move_vehicle(vehicle.jid, vehicle.jid, type_vehicle)
+
+
+def bench_occupancy(sizes=(10, 100, 1000, 10000), ticks=20):
+    results = []
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for n_vehicles in sizes:
+            env, vehicles = build_fleet(n_vehicles)
+
+            start = time.perf_counter()
+            for _ in range(ticks):
+                run_tick(env, vehicles)
+            elapsed = time.perf_counter() - start
+
+            results.append({"vehicles": n_vehicles,
+                            "tick_ms": elapsed / ticks * 1e3,
+                            "per_vehicle_us": elapsed / (ticks * n_vehicles) * 1e6})
+
+    return results
+
+# is_vehicle_ahead alone: every vehicle checks the cell ahead once per tick
+def bench_is_vehicle_ahead(sizes=(10, 100, 1000, 10000), ticks=20):
+    results = []
+
+    for n_vehicles in sizes:
+        env, vehicles = build_fleet(n_vehicles)
+
+        start = time.perf_counter()
+        for _ in range(ticks):
+            for vehicle, type_vehicle in vehicles:
+                env.is_vehicle_ahead(vehicle.jid, type_vehicle)
+        elapsed = time.perf_counter() - start
+
+        results.append({"vehicles": n_vehicles, "per_call_us": elapsed / (ticks * n_vehicles) * 1e6})
+
+    return results
+
+
+# change_road alone: every vehicle is at the end of its road and chooses a new one
+def bench_change_road(sizes=(10, 100, 1000, 10000), rounds=5):
+    results = []
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for n_vehicles in sizes:
+            env, vehicles = build_fleet(n_vehicles)
+            elapsed = 0.0
+
+            for _ in range(rounds):
+                for vehicle, type_vehicle in vehicles:
+                    env.set_vehicle_location(vehicle.jid, type_vehicle, vehicle.road, 5)
+
+                start = time.perf_counter()
+                for vehicle, type_vehicle in vehicles:
+                    env.change_road(vehicle.jid, vehicle.jid, vehicle.road, type_vehicle)
+                elapsed += time.perf_counter() - start
+
+            results.append({"vehicles": n_vehicles, "per_call_us": elapsed / (rounds * n_vehicles) * 1e6})
+
+    return results
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Ping-pong between two agents: the pinger sends a message and waits for the echo before sending the next one
+async def ping_pong(agent_class, behaviour_class, message_class, n_messages, domain="localhost"):
+    done = asyncio.get_running_loop().create_future()
+
+    class EchoBehaviour(behaviour_class):
+        async def run(self):
+            msg = await self.receive(timeout=1)
+            if msg:
+                reply = message_class(to=str(msg.sender))
+                reply.body = msg.body
+                await self.send(reply)
+
+    class PingBehaviour(behaviour_class):
+        async def run(self):
+            start = time.perf_counter()
+            for i in range(n_messages):
+                msg = message_class(to=f"bench_pong@{domain}")
+                msg.body = str(i)
+                await self.send(msg)
+                await self.receive(timeout=5)
+            if not done.done():
+                done.set_result(time.perf_counter() - start)
+            self.kill()
+
+    pong = agent_class(f"bench_pong@{domain}", "bench")
+    ping = agent_class(f"bench_ping@{domain}", "bench")
+    await pong.start(auto_register=True)
+    pong.add_behaviour(EchoBehaviour())
+    await ping.start(auto_register=True)
+    ping.add_behaviour(PingBehaviour())
+
+    try:
+        elapsed = await asyncio.wait_for(done, timeout=60)
+    finally:
+        await ping.stop()
+        await pong.stop()
+
+    # Every round trip is 2 messages
+    return 2 * n_messages / elapsed
+
+
+def bench_transport(n_messages=10000):
+    results = [{"backend": "local",
+                "messages_per_second": asyncio.run(ping_pong(transport.LocalAgent, transport.LocalCyclicBehaviour, transport.LocalMessage, n_messages))}]
+
+    # The XMPP backend needs SPADE and a server running at localhost
+    try:
+        from spade.agent import Agent
+        from spade.behaviour import CyclicBehaviour
+        from spade.message import Message
+        results.append({"backend": "xmpp",
+                        "messages_per_second": asyncio.run(ping_pong(Agent, CyclicBehaviour, Message, n_messages // 100))})
+    except Exception as error:
+        results.append({"backend": "xmpp", "messages_per_second": None, "error": repr(error)})
+
+    return results
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Adds n_intersections intersections to the environment, each with one road and one (green) traffic light
+def add_bench_intersections(env, n_intersections):
+    roads = []
+    for k in range(n_intersections):
+        traffic_light_name = f"Bench_Light_{k}"
+        road = Road(f"bench_road_{k}", traffic_light_name, "No Zebra Crossing", "No traffic sign")
+        env.add_traffic_light(traffic_light_name, "green")
+        env.add_intersection(f"Bench_Intersection_{k}", [road], [traffic_light_name])
+        roads.append(road)
+    return roads
+
+
+# One shard of the sharding benchmark: the central of shard "shard" (out of n_shards, with the intersections split by the ShardMap) answers the
+# "may i go?" requests of its intersections. Every shard runs in its own process, so the shards only go faster together if they get their own cores.
+# The central starts when the parent says so (all the shards at the same time) and its phases are timed with perf_counter (same clock in every process):
+#   - receive: from the first to the last message taken out of the mailbox (decoding and queueing)
+#   - answer: from the first to the last answer sent
+# The 0.25 s without message that closes the receive window is not counted, it is idle time
+async def shard_decisions(connection, n_shards, shard, n_requests, n_intersections, n_vehicles):
+    from agents import CentralCordinateAgent
+
+    class TimedCentral(CentralCordinateAgent):
+        class CentralBehaviour(CentralCordinateAgent.CentralBehaviour):
+            async def receive(self, timeout=None):
+                msg = await super().receive(timeout=timeout)
+                if msg is not None:
+                    self.agent.received_at.append(time.perf_counter())
+                return msg
+
+            async def send(self, msg):
+                await super().send(msg)
+                self.agent.answered_at.append(time.perf_counter())
+
+    env = Environment(0)
+    roads = add_bench_intersections(env, n_intersections)
+
+    vehicles = []
+    for i in range(n_vehicles):
+        vehicle = BenchVehicle(f"vehicle{i}@localhost", roads[i % n_intersections])
+        vehicle.position = 4
+        env.add_car_agent(vehicle)
+        vehicles.append(vehicle)
+
+    central_jids = [f"bench_central{index}@localhost" for index in range(n_shards)]
+    env.set_shard_map(coordination.ShardMap(env, central_jids))
+    central = TimedCentral(central_jids[shard], "bench", env, {}, queue_capacity=None)
+    central.received_at = []
+    central.answered_at = []
+
+    # Requests of the vehicles of this shard, encoded before the start
+    bodies = [(vehicle.jid, protocol.encode(protocol.MAY_I_GO, protocol.CAR, vehicle.jid, subject=vehicle.road.name, correlation_id=protocol.new_correlation_id()))
+              for vehicle in (vehicles[i % n_vehicles] for i in range(n_requests)) if vehicle.central_jid == central.jid]
+
+    connection.send("ready")
+    connection.recv()
+    await central.start(auto_register=True)
+    for jid, body in bodies:
+        transport.router.deliver(transport.LocalMessage(to=central.jid, sender=jid, body=body))
+
+    while central.decisions < len(bodies):
+        await asyncio.sleep(0.01)
+    await central.stop()
+
+    return len(bodies), central.received_at[0], central.received_at[-1], central.answered_at[0], central.answered_at[-1]
+
+
+def run_shard(connection, *args):
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        connection.send(asyncio.run(shard_decisions(connection, *args)))
+
+
+# Decisions per second of 1, 2, 4, 8 central shards, each in its own process, on the same requests - the time of a phase is from the first shard
+# that starts it to the last one that ends it. The speedup over 1 shard is bounded by the number of cores (reported as "cores")
+def bench_sharding(shard_counts=(1, 2, 4, 8), n_requests=20000, n_intersections=8, n_vehicles=400):
+    import multiprocessing
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+    results = []
+    base = None
+
+    for n_shards in shard_counts:
+        connections, processes = [], []
+        for shard in range(n_shards):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target=run_shard, args=(worker_connection, n_shards, shard, n_requests, n_intersections, n_vehicles), daemon=True)
+            process.start()
+            worker_connection.close()
+            connections.append(connection)
+            processes.append(process)
+
+        for connection in connections:
+            connection.recv()
+        for connection in connections:
+            connection.send("go")
+        shards = [connection.recv() for connection in connections]
+        for process in processes:
+            process.join()
+
+        decisions = sum(shard[0] for shard in shards)
+        receive_seconds = max(shard[2] for shard in shards) - min(shard[1] for shard in shards)
+        answer_seconds = max(shard[4] for shard in shards) - min(shard[3] for shard in shards)
+        decisions_per_second = decisions / (receive_seconds + answer_seconds)
+        base = base or decisions_per_second
+        results.append({"shards": n_shards, "cores": os.cpu_count(), "decisions": decisions, "receive_ms": receive_seconds * 1e3,
+                        "answer_ms": answer_seconds * 1e3, "decisions_per_second": decisions_per_second, "speedup": decisions_per_second / base})
+
+    return results
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Time to load a generated grid network from its JSON file and build the Environment on top of it
+def bench_network_loading(grid_sizes=((4, 4), (16, 16), (32, 32))):
+    results = []
+
+    for rows, cols in grid_sizes:
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as file:
+            json.dump(network.grid_description(rows, cols), file)
+
+        try:
+            start = time.perf_counter()
+            road_network = network.load_network(file.name)
+            loaded = time.perf_counter()
+            Environment(0, road_network)
+            built = time.perf_counter()
+        finally:
+            os.remove(file.name)
+
+        results.append({"roads": len(road_network.road_names),
+                        "intersections": len(road_network.intersection_names),
+                        "load_ms": (loaded - start) * 1e3,
+                        "environment_ms": (built - loaded) * 1e3})
+
+    return results
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Vehicle-ticks per second of the vectorized fleet (fleet.py, needs NumPy) on a generated grid, 1 ambulance every 10 vehicles
+def bench_fleet(sizes=(1000, 10000, 100000), ticks=50, grid=(64, 64)):
+    try:
+        import fleet
+    except ImportError as error:
+        return [{"vehicles": n_vehicles, "vehicle_ticks_per_second": None, "error": repr(error)} for n_vehicles in sizes]
+
+    road_network = network.generate_grid(*grid)
+    results = []
+
+    for n_vehicles in sizes:
+        vehicles = fleet.VehicleFleet(road_network, seed=0)
+        vehicles.spawn(n_vehicles - n_vehicles // 10, fleet.CAR)
+        vehicles.spawn(n_vehicles // 10, fleet.AMBULANCE)
+
+        start = time.perf_counter()
+        for _ in range(ticks):
+            vehicles.step()
+        elapsed = time.perf_counter() - start
+
+        results.append({"vehicles": n_vehicles, "vehicle_ticks_per_second": n_vehicles * ticks / elapsed})
+
+    return results
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Stand-in for an agent on the local transport that only records when its messages arrive
+class BenchSink:
+    def __init__(self, jid, inbox):
+        self.jid = jid
+        self.behaviours = [self]
+        self.queue = self
+        self.inbox = inbox # Shared list of (arrival time, message)
+
+    def match(self, msg):
+        return True
+
+    def put_nowait(self, msg):
+        self.inbox.append((time.perf_counter(), msg))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# CentralCordinateAgent "bench_central@localhost" on the local transport, with a BenchSink for every traffic light of env (recording into
+# traffic_light_inbox) and for every sender (recording into sender_inbox) - the senders are added to env by the caller
+# Everything is stopped and unregistered on exit, ex: async with central_fixture(env, senders, answers, []) as central: ...
+@asynccontextmanager
+async def central_fixture(env, senders, sender_inbox, traffic_light_inbox, **central_options):
+    from agents import CentralCordinateAgent
+
+    router = transport.router
+    traffic_light_jids = {name: f"bench_light{index}@localhost" for index, name in enumerate(env.traffic_lights)}
+    for jid in traffic_light_jids.values():
+        router.register(BenchSink(jid, traffic_light_inbox))
+    for sender in senders:
+        router.register(BenchSink(sender.jid, sender_inbox))
+
+    central = CentralCordinateAgent("bench_central@localhost", "bench", env, traffic_light_jids, **central_options)
+    await central.start(auto_register=True)
+    try:
+        yield central
+    finally:
+        await central.stop()
+        for jid in list(traffic_light_jids.values()) + [sender.jid for sender in senders]:
+            router.agents.pop(jid, None)
+
+
+# Floods one CentralCordinateAgent with n_requests messages of one kind ("may i go?", "emergency" or "change to red") and measures
+# the decision throughput (while answering) and the queue-drain latency (from the request to the answer, including the cycle of the central)
+# The emergencies are answered by the alert of their road (coalesced per road), with n_cars cars spread over all the roads to alert
+async def central_flood(body, n_requests, n_senders=200, n_cars=0):
+    env = Environment(0)
+    inbox = []
+    router = transport.router
+
+    # Senders on the roads with traffic lights, at position 4
+    senders = []
+    for i in range(n_senders):
+        if body == "may i go?":
+            sender = BenchVehicle(f"vehicle{i}@localhost", env.choose_zebra_crossing[i % len(env.choose_zebra_crossing)])
+            sender.position = 4
+            env.add_car_agent(sender)
+        elif body == "emergency":
+            sender = BenchVehicle(f"ambulance{i}@localhost", env.choose_zebra_crossing[i % len(env.choose_zebra_crossing)])
+            sender.position = 4
+            sender.ambulance_id = f"ambulance_{i}"
+            env.add_ambulance_agent(sender)
+        else: # body == "change to red"
+            sender = BenchVehicle(f"person{i}@localhost", env.choose_zebra_crossing[i % len(env.choose_zebra_crossing)])
+            env.add_person_agent(sender)
+        senders.append(sender)
+
+    # Cars spread over all the roads, that only get the alerts
+    cars = []
+    for i in range(n_cars):
+        car = BenchVehicle(f"bench_car{i}@localhost", env.roads[i % len(env.roads)])
+        env.add_car_agent(car)
+        cars.append(car)
+
+    # Every request gets exactly one answer, in the order the central processes them
+    kind, role = {"may i go?": (protocol.MAY_I_GO, protocol.CAR), "emergency": (protocol.EMERGENCY, protocol.AMBULANCE),
+                  "change to red": (protocol.CHANGE_TO_RED, protocol.PERSON)}[body]
+    sent_at = []
+    async with central_fixture(env, senders + cars, [] if body == "emergency" else inbox, inbox if body == "emergency" else [],
+                               queue_capacity=None) as central:
+        for i in range(n_requests):
+            sender = senders[i % n_senders]
+            sent_at.append(time.perf_counter())
+            router.deliver(transport.LocalMessage(to="bench_central@localhost", sender=sender.jid,
+                                                  body=protocol.encode(kind, role, sender.jid, subject=sender.road.name, correlation_id=protocol.new_correlation_id())))
+
+        if body == "emergency":
+            while central.emergencies < n_requests:
+                await asyncio.sleep(0.001)
+        else:
+            while len(inbox) < n_requests:
+                await asyncio.sleep(0.001)
+
+    traffic_light_jids = central.traffic_light_jids
+    if body == "emergency":
+        # An emergency is answered by the first alert of the traffic light of its road after it was sent
+        alerts = {}
+        for arrival, msg in inbox:
+            alerts.setdefault(msg.to, []).append(arrival)
+        answered_at = []
+        first_sent = {} # (traffic light jid, alert index): time the oldest emergency answered by that alert was sent
+        for i, sent in enumerate(sent_at):
+            jid = traffic_light_jids[senders[i % n_senders].road.traffic_light]
+            alert = bisect.bisect_left(alerts[jid], sent)
+            answered_at.append(alerts[jid][alert])
+            first_sent.setdefault((jid, alert), sent)
+        # The coalesced emergencies share one alert, so the decisions per second would only be the requests over the gap between a few alerts:
+        # the time from the oldest emergency of an alert to the alert is reported instead
+        alert_latencies = [alerts[jid][alert] - sent for (jid, alert), sent in first_sent.items()]
+    else:
+        answered_at = [arrival for arrival, _ in inbox]
+
+    latencies = [answered - sent for answered, sent in zip(answered_at, sent_at)]
+    answering = max(answered_at) - min(answered_at)
+
+    result = {"kind": body, "requests": n_requests}
+    if body != "emergency":
+        result["decisions_per_second"] = n_requests / answering if answering > 0 else None
+    result.update({"drain_seconds": max(answered_at) - sent_at[0],
+                   "latency_p50_ms": percentile(latencies, 0.5) * 1e3,
+                   "latency_p99_ms": percentile(latencies, 0.99) * 1e3})
+    if body == "may i go?":
+        result["lookups"] = central.traffic_light_cache.lookups
+        result["lookups_saved"] = central.lookups_saved
+    if body == "emergency":
+        result["cars"] = n_cars
+        result["alerts"] = len(inbox)
+        result["alert_latency_p50_ms"] = percentile(alert_latencies, 0.5) * 1e3
+        result["alert_latency_max_ms"] = max(alert_latencies) * 1e3
+        result["coalesced"] = central.behaviours[0].emergency_batch.coalesced
+    return result
+
+
+def bench_central(kinds=("may i go?", "emergency", "change to red"), n_requests=5000):
+    results = []
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for body in kinds:
+            results.append(asyncio.run(central_flood(body, n_requests)))
+
+    return results
+
+
+# One emergency sent after a burst of n_background "may i go?"/"change to red" requests: its alert goes out as soon as the central takes the burst
+# (the emergency class is handled first), so the time from the first message of the cycle to the alert does not grow with the burst
+async def emergency_under_load(n_background, n_senders=200):
+    env = Environment(0)
+    router = transport.router
+    alerts = []
+    answers = []
+
+    senders = []
+    for i in range(n_senders):
+        road = env.choose_zebra_crossing[i % len(env.choose_zebra_crossing)]
+        if i % 2 == 0:
+            sender = BenchVehicle(f"vehicle{i}@localhost", road)
+            sender.position = 4
+            env.add_car_agent(sender)
+        else:
+            sender = BenchVehicle(f"person{i}@localhost", road)
+            env.add_person_agent(sender)
+        senders.append(sender)
+
+    ambulance = BenchVehicle("ambulance0@localhost", env.choose_zebra_crossing[0])
+    ambulance.ambulance_id = "ambulance_0"
+    env.add_ambulance_agent(ambulance)
+
+    # The cars on the road of the ambulance also get its alert - only the commands are answers
+    def commands():
+        return [arrival for arrival, msg in answers if protocol.decode(msg.body).kind == protocol.COMMAND]
+
+    async with central_fixture(env, senders, answers, alerts, queue_capacity=None) as central:
+        first_sent = time.perf_counter()
+        for i in range(n_background):
+            sender = senders[i % n_senders]
+            kind, role = (protocol.MAY_I_GO, protocol.CAR) if i % n_senders % 2 == 0 else (protocol.CHANGE_TO_RED, protocol.PERSON)
+            router.deliver(transport.LocalMessage(to="bench_central@localhost", sender=sender.jid,
+                                                  body=protocol.encode(kind, role, sender.jid, subject=sender.road.name, correlation_id=protocol.new_correlation_id())))
+        router.deliver(transport.LocalMessage(to="bench_central@localhost", sender=ambulance.jid,
+                                              body=protocol.encode(protocol.EMERGENCY, protocol.AMBULANCE, ambulance.jid, subject=ambulance.road.name)))
+
+        while central.emergencies < 1 or len(commands()) < n_background:
+            await asyncio.sleep(0.01)
+
+    alerted_at = min(arrival for arrival, msg in alerts if protocol.decode(msg.body).kind == protocol.EMERGENCY)
+    answered_at = sorted(commands())
+
+    # The times include the sleep of the central before its cycle (~1.25 s)
+    return {"background": n_background,
+            "emergency_alert_ms": (alerted_at - first_sent) * 1e3,
+            "answers_before_alert": bisect.bisect_left(answered_at, alerted_at),
+            "last_answer_ms": (answered_at[-1] - first_sent) * 1e3 if answered_at else None}
+
+
+def bench_priority(background_counts=(0, 1000, 10000)):
+    results = []
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for n_background in background_counts:
+            results.append(asyncio.run(emergency_under_load(n_background)))
+
+    return results
+
+# Steady flow of "may i go?"/"change to red" requests at "rate" per second for "duration" seconds, on a central with queues of "queue_capacity"
+# (None = unbounded, without deadline). The senders behave like RequestBehaviour.request_until_handled: a "busy" request is sent again after the
+# wait the central asks for, until it gets a decision or is dropped (expired, its sender gives up). Reported:
+#   - busy/expired: answers "busy" and requests dropped, and their fraction of the requests (the first sends, not the retries)
+#   - latency of the decisions: from the send of the attempt that got the decision to the decision - only over the decided attempts
+#   - end-to-end latency: from the first send of the request to its decision, retries included - the time a car/person really waits
+async def central_spike(rate, queue_capacity, duration=5, n_senders=200):
+    env = Environment(0)
+    answers = []
+    router = transport.router
+
+    senders = []
+    for i in range(n_senders):
+        road = env.choose_zebra_crossing[i % len(env.choose_zebra_crossing)]
+        sender = BenchVehicle(f"vehicle{i}@localhost" if i % 2 == 0 else f"person{i}@localhost", road)
+        if i % 2 == 0:
+            sender.position = 4
+            env.add_car_agent(sender)
+        else:
+            env.add_person_agent(sender)
+        senders.append(sender)
+
+    attempts = {} # Correlation id of an attempt: (request number, time the request was first sent, time the attempt was sent)
+    retries = [] # (time to send again, request number, time the request was first sent)
+
+    def send(i, first_sent=None):
+        sender = senders[i % n_senders]
+        kind, role = (protocol.MAY_I_GO, protocol.CAR) if i % 2 == 0 else (protocol.CHANGE_TO_RED, protocol.PERSON)
+        correlation_id = protocol.new_correlation_id()
+        now = time.perf_counter()
+        attempts[correlation_id] = (i, now if first_sent is None else first_sent, now)
+        router.deliver(transport.LocalMessage(to="bench_central@localhost", sender=sender.jid,
+                                              body=protocol.encode(kind, role, sender.jid, subject=sender.road.name, correlation_id=correlation_id,
+                                                                   sent_at=f"{time.time():.3f}")))
+
+    latencies = []
+    end_to_end = []
+    n_read = 0
+    n_sent = 0
+    async with central_fixture(env, senders, answers, [], queue_capacity=queue_capacity,
+                               request_deadline=None if queue_capacity is None else REQUEST_DEADLINE) as central:
+        started = time.perf_counter()
+        # Every 10 ms: the new requests of the flow, the retries that are due, and the answers received so far
+        while time.perf_counter() - started < duration or retries or len(attempts) > len(end_to_end) + central.busy_replies + central.expired:
+            now = time.perf_counter()
+            if now - started < duration:
+                due = int((now - started) * rate)
+                for i in range(n_sent, due):
+                    send(i)
+                n_sent = due
+
+            for retry in [retry for retry in retries if retry[0] <= now]:
+                retries.remove(retry)
+                send(retry[1], retry[2])
+
+            for arrival, msg in answers[n_read:]:
+                envelope = protocol.decode(msg.body)
+                i, first_sent, attempt_sent = attempts[envelope.correlation_id]
+                if envelope.kind == protocol.BUSY:
+                    retries.append((arrival + float(envelope.value), i, first_sent))
+                elif envelope.kind == protocol.COMMAND:
+                    latencies.append(arrival - attempt_sent)
+                    end_to_end.append(arrival - first_sent)
+            n_read = len(answers)
+            await asyncio.sleep(0.01)
+
+    return {"rate": rate,
+            "queue_capacity": queue_capacity,
+            "requests": n_sent,
+            "attempts": len(attempts),
+            "decisions": len(latencies),
+            "busy": central.busy_replies,
+            "busy_fraction": central.busy_replies / n_sent,
+            "expired": central.expired,
+            "expired_fraction": central.expired / n_sent,
+            "latency_p50_ms": percentile(latencies, 0.5) * 1e3,
+            "latency_p99_ms": percentile(latencies, 0.99) * 1e3,
+            "end_to_end_p50_ms": percentile(end_to_end, 0.5) * 1e3,
+            "end_to_end_p99_ms": percentile(end_to_end, 0.99) * 1e3}
+
+
+# Deadline of the requests in the spike benchmark, the timeout of the agents
+REQUEST_DEADLINE = 5
+
+
+# Usual traffic then a 10 times spike, with unbounded and bounded queues - with the bounds the p99 of the decisions stays at the usual level,
+# but only over the requests that got one: the busy fraction and the end-to-end latency (retries included) show what the refused senders pay
+def bench_overload(rates=(1000, 10000), capacities=(None, 1000), duration=5):
+    results = []
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for queue_capacity in capacities:
+            for rate in rates:
+                results.append(asyncio.run(central_spike(rate, queue_capacity, duration)))
+
+    return results
+
+# Emergencies with more and more cars in the city - the time to alert a road only depends on the cars on that road
+def bench_emergency_fanout(car_counts=(100, 1000, 10000), n_requests=1000):
+    results = []
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for n_cars in car_counts:
+            results.append(asyncio.run(central_flood("emergency", n_requests, n_cars=n_cars)))
+
+    return results
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Request/response round trips: n_agents cars each send n_requests "may i go?" one after the other and wait for the answer with the same correlation id,
+# while another agent sends them unrelated messages - they must all still be in the mailbox afterwards
+async def request_round_trips(n_agents, n_requests):
+    from agents import CentralCordinateAgent, RequestBehaviour
+
+    env = Environment(0)
+    protocol.request_stats.reset()
+    finished = []
+
+    class RequesterBehaviour(RequestBehaviour):
+        async def run(self):
+            for _ in range(n_requests):
+                await self.request("bench_central@localhost", protocol.MAY_I_GO, protocol.CAR, self.agent.jid, subject=self.agent.road.name)
+
+            unrelated = 0
+            while await self.receive_envelope(timeout=0.01) is not None:
+                unrelated += 1
+            finished.append(unrelated)
+            self.kill()
+
+    class Requester(transport.LocalAgent):
+        def __init__(self, jid, road):
+            super().__init__(jid, "bench")
+            self.road = road
+            self.position = 4
+
+        async def setup(self):
+            self.add_behaviour(RequesterBehaviour())
+
+    central = CentralCordinateAgent("bench_central@localhost", "bench", env, {})
+    await central.start(auto_register=True)
+
+    requesters = []
+    for i in range(n_agents):
+        requester = Requester(f"vehicle{i}@localhost", env.choose_zebra_crossing[i % len(env.choose_zebra_crossing)])
+        env.add_car_agent(requester)
+        await requester.start()
+        requesters.append(requester)
+
+    # One unrelated message to every requester while its requests are in flight
+    await asyncio.sleep(0.5)
+    for requester in requesters:
+        transport.router.deliver(transport.LocalMessage(to=requester.jid, sender="bench_noise@localhost",
+                                                        body=protocol.encode(protocol.EMERGENCY, protocol.CENTRAL, "bench_noise@localhost")))
+
+    while len(finished) < n_agents:
+        await asyncio.sleep(0.01)
+
+    for agent in requesters + [central]:
+        await agent.stop()
+
+    stats = protocol.request_stats
+    return {"agents": n_agents,
+            "requests": n_agents * n_requests,
+            "answered": stats.completed,
+            "timeouts": stats.timeouts,
+            "latency_p50_ms": stats.percentile(0.5) * 1e3,
+            "latency_p99_ms": stats.percentile(0.99) * 1e3,
+            "unrelated_kept": sum(finished)}
+
+
+def bench_requests(agent_counts=(10, 100), n_requests=3):
+    results = []
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for n_agents in agent_counts:
+            results.append(asyncio.run(request_round_trips(n_agents, n_requests)))
+
+    return results
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# End to end: vehicle-ticks (car/ambulance behaviour cycles) per wall-second of the full scenario on the headless engine
+def bench_scenario(scenario_files=("demo.json", "crowded_1000.json"), duration=600):
+    import headless
+    import scenario as scenarios
+
+    results = []
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for scenario_file in scenario_files:
+            scenario = scenarios.load_scenario(os.path.join(scenarios.SCENARIOS_DIR, scenario_file), duration=duration, seed=0)
+
+            start = time.perf_counter()
+            simulation = headless.run_headless(scenario)
+            elapsed = time.perf_counter() - start
+
+            results.append({"scenario": scenario["name"],
+                            "simulated_seconds": duration,
+                            "wall_seconds": elapsed,
+                            "vehicle_ticks_per_second": simulation.vehicle_ticks / elapsed})
+
+    return results
+
+
+# Agent startup/shutdown time of the real-time mode (local transport) for growing numbers of agents
+def bench_startup(sizes=(100, 1000), concurrency=64):
+    import scenario as scenarios
+
+    async def start_stop(scenario):
+        env = scenarios.build_environment(scenario)
+        agents, delays, _ = scenarios.build_agents(scenario, env)
+        startup = await scenarios.start_agents(agents, delays, concurrency)
+        shutdown = await scenarios.stop_agents(agents, concurrency)
+        return sum(len(group) for group in agents.values()), startup, scenarios.spawn_schedule(delays), shutdown
+
+    results = []
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for n_agents in sizes:
+            # 85% cars, 5% ambulances, 10% people
+            scenario = scenarios.load_scenario(scenarios.DEFAULT_SCENARIO, seed=0,
+                                               cars={"count": n_agents * 85 // 100},
+                                               ambulances={"count": n_agents * 5 // 100},
+                                               people={"count": n_agents * 10 // 100})
+            total, startup, schedule, shutdown = asyncio.run(start_stop(scenario))
+            results.append({"agents": total, "startup_seconds": startup, "spawn_schedule_seconds": schedule, "shutdown_seconds": shutdown})
+
+    return results
+
+# Cost of one vehicle event (events.vehicle.info) with the category disabled, on the console and to a JSON lines file on the background thread
+def bench_event_log(n_events=100000):
+    import events
+    import tempfile
+    import traces
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull:
+        for name, sink in (("disabled", None),
+                           ("console", events.ConsoleSink(devnull, buffer_size=1)),
+                           ("console_buffered", events.ConsoleSink(devnull, buffer_size=4096)),
+                           ("json_background", events.BackgroundSink(events.JsonLinesSink(os.path.join(directory, "events.jsonl")))),
+                           ("trace", traces.TraceSink(os.path.join(directory, "trace"))),
+                           ("trace_background", events.BackgroundSink(traces.TraceSink(os.path.join(directory, "trace_background"))))):
+            log = events.EventLog()
+            if sink is not None:
+                log.add_sink(sink)
+            channel = log.channel("vehicle")
+
+            start = time.perf_counter()
+            for i in range(n_events):
+                channel.info("moving", vehicle="car_1", position=i % 6, road="road_1")
+            emit_time = time.perf_counter() - start
+            log.close()
+            total_time = time.perf_counter() - start
+
+            results.append({"sink": name, "emit_ns": emit_time / n_events * 1e9, "total_ns": total_time / n_events * 1e9})
+
+    return results
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Parse and dispatch cost per message: the typed protocol (decode + dict lookup of the handler) against the old classification
+# (substring tests on the sender JID, then string compares of the body, then the traffic light number from the last character of the JID)
+# The typed bodies are the ones the agents send (road, correlation id, send time); "decode" is protocol.decode alone. Every time is the best of
+# "repeats" passes over the messages, so that a pause of the machine does not land on one format only
+def bench_protocol(n_messages=100000, repeats=5):
+    requests = [("vehicle1@localhost", protocol.MAY_I_GO, protocol.CAR, "car_1", "may i go?"),
+                ("ambulance1@localhost", protocol.COLOR, protocol.AMBULANCE, "ambulance_1", "color"),
+                ("ambulance1@localhost", protocol.EMERGENCY, protocol.AMBULANCE, "ambulance_1", "emergency"),
+                ("person1@localhost", protocol.CHANGE_TO_RED, protocol.PERSON, "person_1", "change to red"),
+                ("traffic_light1@localhost", protocol.CHANGED_TO_GREEN, protocol.TRAFFIC_LIGHT, "Traffic_Light_1", "changed to green")]
+
+    typed = [transport.LocalMessage(sender=sender, body=protocol.encode(kind, role, entity, subject="road_1", correlation_id=protocol.new_correlation_id(),
+                                                                        sent_at=f"{time.time():.3f}"))
+             for sender, kind, role, entity, _ in requests] * (n_messages // len(requests))
+    legacy = [transport.LocalMessage(sender=sender, body=body) for sender, _, _, _, body in requests] * (n_messages // len(requests))
+
+    handled = []
+    handler = handled.append
+    handlers = {kind: handler for kind in protocol.KIND_NAMES}
+    decode = protocol.decode
+
+    def run_typed():
+        for msg in typed:
+            envelope = decode(msg.body)
+            handlers[envelope.kind](envelope.entity)
+
+    def run_decode():
+        for msg in typed:
+            decode(msg.body)
+
+    def run_legacy():
+        for msg in legacy:
+            sender = str(msg.sender)
+            if "ambulance" in sender:
+                if msg.body == "emergency":
+                    handler(sender)
+                elif msg.body == "color":
+                    handler(sender)
+            elif "vehicle" in sender:
+                if msg.body == "may i go?":
+                    handler(sender)
+            elif "traffic_light" in sender:
+                if msg.body == "changed to green":
+                    handler(f"Traffic_Light_{int(sender.split('@')[0][-1])}")
+                elif msg.body == "changed to red":
+                    handler(f"Traffic_Light_{int(sender.split('@')[0][-1])}")
+            elif "person" in sender:
+                if msg.body == "change to red":
+                    handler(sender)
+
+    def best_time(run):
+        times = []
+        for _ in range(repeats):
+            handled.clear()
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    results = []
+    for name, run, messages in (("typed", run_typed, typed), ("decode", run_decode, typed), ("legacy", run_legacy, legacy)):
+        results.append({"format": name, "per_message_ns": best_time(run) / len(messages) * 1e9,
+                        "bytes_per_message": sum(len(msg.body) for msg in messages) / len(messages)})
+    return results
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Vehicle-ticks per second of the parallel mode (parallel.py) with 1, 2, 4, 8 workers on the same generated grid, and the speedup over 1 worker
+# The measured speedup is bounded by the number of cores (reported as "cores"): with fewer cores than workers the workers share them and the run
+# only pays for the per-tick barrier and the pipes, so it is below 1. "ideal_speedup" is the scaling of the tick work itself, measured on any machine:
+# the CPU time of the ticks with 1 worker over the CPU time of the slowest worker of every tick (the time of the ticks with one core per worker)
+def bench_parallel(worker_counts=(1, 2, 4, 8), grid=(32, 32), n_vehicles=20000, ticks=20):
+    from parallel import ParallelSimulation
+
+    road_network = network.generate_grid(*grid)
+    results = []
+    base = None
+    base_busy = None
+
+    for n_workers in worker_counts:
+        with ParallelSimulation(road_network, n_workers, seed=0) as simulation:
+            simulation.add_vehicles(n_vehicles - n_vehicles // 10, "car")
+            simulation.add_vehicles(n_vehicles // 10, "ambulance")
+            simulation.step() # Workers started and vehicles placed
+            simulation.busy_seconds = simulation.critical_seconds = 0.0
+
+            start = time.perf_counter()
+            simulation.run(ticks)
+            elapsed = time.perf_counter() - start
+
+        vehicle_ticks_per_second = n_vehicles * ticks / elapsed
+        base = base or vehicle_ticks_per_second
+        base_busy = base_busy or simulation.busy_seconds
+        results.append({"workers": n_workers, "cores": os.cpu_count(), "vehicle_ticks_per_second": vehicle_ticks_per_second,
+                        "speedup": vehicle_ticks_per_second / base, "ideal_speedup": base_busy / simulation.critical_seconds,
+                        "handoffs_per_tick": simulation.handoffs / (ticks + 1)})
+
+    return results
+
+# Replications per second of the batch runner (replications.py) on the crowded scenario, by number of worker processes
+def bench_replications(worker_counts=(1, 2, 4), n_replications=16, duration=300):
+    import replications
+    import scenario as scenarios
+
+    scenario = scenarios.load_scenario(os.path.join(scenarios.SCENARIOS_DIR, "crowded_1000.json"), duration=duration)
+    results = []
+    base = None
+
+    for n_workers in worker_counts:
+        start = time.perf_counter()
+        replications.run_replications(scenario, n_replications, n_workers=n_workers)
+        replications_per_second = n_replications / (time.perf_counter() - start)
+
+        base = base or replications_per_second
+        results.append({"workers": n_workers, "cores": os.cpu_count(), "replications_per_second": replications_per_second,
+                        "speedup": replications_per_second / base})
+
+    return results
+
+# Save/restore time and file size of the snapshots (snapshot.py): headless crowded scenario after a warm-up, and fleets of growing size
+def bench_snapshot(warmup=300, fleet_sizes=(10000, 100000, 1000000), grid=(64, 64)):
+    import snapshot
+    import scenario as scenarios
+    from headless import run_headless
+
+    results = []
+    scenario = scenarios.load_scenario(os.path.join(scenarios.SCENARIOS_DIR, "crowded_1000.json"), duration=warmup, seed=0)
+
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        path = os.path.join(directory, "state.snap")
+
+        simulation = run_headless(scenario)
+        start = time.perf_counter()
+        snapshot.save_headless(simulation, path)
+        saved = time.perf_counter()
+        snapshot.restore_headless(path, scenario)
+        restored = time.perf_counter()
+        results.append({"state": "headless", "agents": len(simulation.processes), "bytes": os.path.getsize(path),
+                        "save_ms": (saved - start) * 1e3, "restore_ms": (restored - saved) * 1e3})
+
+        try:
+            import fleet
+        except ImportError as error:
+            return results + [{"state": "fleet", "error": repr(error)}]
+
+        road_network = network.generate_grid(*grid)
+        for n_vehicles in fleet_sizes:
+            vehicles = fleet.VehicleFleet(road_network, seed=0)
+            vehicles.spawn(n_vehicles)
+            vehicles.step()
+
+            start = time.perf_counter()
+            snapshot.save_fleet(vehicles, path)
+            saved = time.perf_counter()
+            snapshot.restore_fleet(path, road_network)
+            restored = time.perf_counter()
+            results.append({"state": "fleet", "agents": n_vehicles, "bytes": os.path.getsize(path),
+                            "save_ms": (saved - start) * 1e3, "restore_ms": (restored - saved) * 1e3})
+
+    return results
+
+# Headless run of the crowded scenario without/with a trace (traces.py), then the scan and the replay of that trace
+def bench_trace(duration=300):
+    import events
+    import traces
+    import scenario as scenarios
+    from headless import run_headless
+
+    scenario = scenarios.load_scenario(os.path.join(scenarios.SCENARIOS_DIR, "crowded_1000.json"), duration=duration, seed=0)
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "trace")
+        for trace_path in (None, path):
+            events.configure(console_output=False, trace_path=trace_path)
+            start = time.perf_counter()
+            run_headless(scenario)
+            events.log.close()
+            results.append({"run": "traced" if trace_path else "untraced", "seconds": time.perf_counter() - start})
+        events.log.set_level(None, events.INFO)
+        events.configure()
+
+        with traces.TraceReader(path) as trace:
+            start = time.perf_counter()
+            trace.counts()
+            scanned = time.perf_counter()
+            traces.replay(trace, scenarios.build_environment(scenario))
+            replayed = time.perf_counter()
+            n_events = len(trace)
+
+        bytes_per_event = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / n_events
+        results.append({"run": "scan", "events": n_events, "bytes_per_event": bytes_per_event, "events_per_second": n_events / (scanned - start)})
+        results.append({"run": "replay", "events": n_events, "x_real_time": duration / (replayed - scanned)})
+
+    return results
+
+# Cost of one instrumentation point (metrics.py: start + elapsed into a histogram) with the metrics disabled and enabled
+def bench_metrics(n_points=200000):
+    import metrics
+
+    results = []
+    for state in ("disabled", "enabled"):
+        metrics.enable() if state == "enabled" else metrics.disable()
+        metrics.registry.reset()
+
+        start = time.perf_counter()
+        for _ in range(n_points):
+            started = metrics.start()
+            metrics.elapsed("behaviour_seconds", "car", started)
+        elapsed = time.perf_counter() - start
+
+        results.append({"metrics": state, "per_point_ns": elapsed / n_points * 1e9})
+
+    metrics.disable()
+    return results
+
+# Fixed cycle vs actuated signal control (coordination.ActuatedController) on the demo network with more cars: mean KPIs over seeded headless replications
+def bench_signal_control(car_counts=(20, 60, 200), n_replications=5, duration=1800):
+    import replications
+    import scenario as scenarios
+
+    results = []
+    for n_cars in car_counts:
+        scenario = scenarios.load_scenario(scenarios.DEFAULT_SCENARIO, duration=duration)
+        scenario.update(cars={"count": n_cars}, ambulances={"count": 2}, people={"count": 4})
+
+        for signal_control in ("fixed", "actuated"):
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                kpis = replications.aggregate(replications.run_replications(dict(scenario, signal_control=signal_control), n_replications, n_workers=1))
+            results.append({"cars": n_cars, "signal_control": signal_control, "vehicles_per_minute": kpis["vehicles_per_minute"]["mean"],
+                            "light_wait_mean": kpis["light_wait_mean"]["mean"], "stops_per_minute": kpis["stops_per_minute"]["mean"]})
+
+    return results
+
+# Evaluation rate of the signal-plan optimizer (optimizer.py): headless runs and plans per second by number of workers, and the cost of the best plan found
+def bench_optimizer(worker_counts=(1, 2, 4), n_plans=256, n_seeds=4, duration=300):
+    import optimizer
+    import scenario as scenarios
+
+    scenario = scenarios.load_scenario(scenarios.DEFAULT_SCENARIO, duration=duration)
+    results = []
+
+    for n_workers in worker_counts:
+        search = optimizer.Optimizer(scenario, n_seeds)
+        search.run(n_plans, n_workers)
+        results.append({"workers": n_workers, "cores": os.cpu_count(), "runs_per_second": search.runs_per_second(),
+                        "plans_per_second": search.evaluated / search.elapsed, "default_cost": search.cost(search.cache[search.default_plan.key()]),
+                        "best_cost": search.best[0][0]})
+
+    return results
+
+# Destination routing (routing.py): time to build a next-hop table, lookup cost, repair of the tables after a closure against building them again,
+# and the cost of the routing in a VehicleFleet tick (vehicles heading for n_destinations roads against random turns)
+def bench_routing(grid=(32, 32), n_tables=64, n_closures=20, n_lookups=100000, n_vehicles=100000, n_destinations=16, ticks=20):
+    import numpy as np
+    import fleet
+    import routing
+
+    road_network = network.generate_grid(*grid)
+    rng = random.Random(0)
+    table = routing.RoutingTable(road_network)
+    destinations = rng.sample(range(table.n_roads), n_tables)
+
+    start = time.perf_counter()
+    for destination in destinations:
+        table.compute(destination)
+    table_seconds = (time.perf_counter() - start) / n_tables
+
+    pairs = [(rng.randrange(table.n_roads), rng.choice(destinations)) for _ in range(n_lookups)]
+    start = time.perf_counter()
+    for road, destination in pairs:
+        table.next_road(road, destination)
+    lookup_seconds = (time.perf_counter() - start) / n_lookups
+
+    start = time.perf_counter()
+    for road in rng.sample(range(table.n_roads), n_closures):
+        table.close_road(road)
+    repair_seconds = (time.perf_counter() - start) / n_closures
+
+    results = [{"grid": f"{grid[0]}x{grid[1]}", "roads": table.n_roads, "table_ms": table_seconds * 1000, "lookup_ns": lookup_seconds * 1e9,
+                "closure_repair_ms": repair_seconds * 1000, "closure_rebuild_ms": table_seconds * n_tables * 1000,
+                "routes_repaired_per_closure": table.repaired / n_closures}]
+
+    for routed in (False, True):
+        vehicles = fleet.VehicleFleet(road_network, seed=0)
+        vehicles.spawn(n_vehicles)
+        if routed:
+            destination_roads = np.array(destinations[:n_destinations])
+            vehicles.set_destinations(np.arange(n_vehicles), destination_roads[vehicles.rng.integers(n_destinations, size=n_vehicles)])
+        # Warm-up: the vehicles reach the end of their first road (the tables of the destinations are built then)
+        for _ in range(2 * fleet.CELLS_PER_ROAD):
+            vehicles.step()
+
+        start = time.perf_counter()
+        for _ in range(ticks):
+            vehicles.step()
+        results.append({"vehicles": n_vehicles, "destinations": n_destinations if routed else 0, "tick_ms": (time.perf_counter() - start) / ticks * 1000})
+
+    return results
+
+# Intersection phases (phases.py): time to precompute the conflict/override tables of n_junctions 4-way (two phases) and 5-way (three phases) junctions
+# with one traffic light per approach, and the overrides resolved per second - checks that no override turns green two conflicting approaches
+def bench_phases(n_junctions=1000, n_overrides=100000):
+    from phases import PhaseTable
+
+    layouts = {4: [["N", "S"], ["E", "W"]], 5: [["A", "C"], ["B", "D"], ["E"]]}
+    results = []
+
+    for n_approaches, layout in layouts.items():
+        start = time.perf_counter()
+        table = PhaseTable()
+        traffic_light_names = []
+        for junction in range(n_junctions):
+            approaches = [f"Traffic_Light_{junction}_{name}" for phase in layout for name in phase]
+            table.add_junction(f"Intersection_{junction}", approaches, [[f"Traffic_Light_{junction}_{name}" for name in phase] for phase in layout])
+            traffic_light_names += approaches
+        build = time.perf_counter() - start
+
+        conflicting_greens = 0
+        for name in traffic_light_names:
+            new_colors = table.new_colors(name, "emergency")
+            conflicting_greens += sum(new_colors.get(other) == "green" for other in table.conflicting(name))
+
+        rng = random.Random(0)
+        overrides = [(rng.choice(traffic_light_names), rng.choice(("emergency", "person"))) for _ in range(n_overrides)]
+        start = time.perf_counter()
+        for name, event in overrides:
+            table.new_colors(name, event)
+        elapsed = time.perf_counter() - start
+
+        results.append({"approaches": n_approaches,
+                        "junctions": n_junctions,
+                        "build_us_per_junction": build / n_junctions * 1e6,
+                        "overrides_per_second": n_overrides / elapsed,
+                        "conflicting_greens": conflicting_greens})
+
+    return results
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Every benchmark, by name, with the smaller parameters used by --quick
+BENCHMARKS = {"occupancy": (bench_occupancy, {"sizes": (10, 100, 1000)}),
+              "is_vehicle_ahead": (bench_is_vehicle_ahead, {"sizes": (10, 100, 1000)}),
+              "change_road": (bench_change_road, {"sizes": (10, 100, 1000)}),
+              "transport": (bench_transport, {"n_messages": 2000}),
+              "network_loading": (bench_network_loading, {"grid_sizes": ((4, 4), (16, 16))}),
+              "fleet": (bench_fleet, {"sizes": (1000, 10000), "ticks": 10}),
+              "protocol": (bench_protocol, {"n_messages": 20000}),
+              "central": (bench_central, {"n_requests": 1000}),
+              "emergency_fanout": (bench_emergency_fanout, {"car_counts": (100, 1000), "n_requests": 200}),
+              "requests": (bench_requests, {"agent_counts": (10,), "n_requests": 2}),
+              "sharding": (bench_sharding, {"shard_counts": (1, 2), "n_requests": 4000}),
+              "event_log": (bench_event_log, {"n_events": 20000}),
+              "scenario": (bench_scenario, {"duration": 120}),
+              "startup": (bench_startup, {"sizes": (100,)}),
+              "parallel": (bench_parallel, {"worker_counts": (1, 2, 4), "grid": (16, 16), "n_vehicles": 2000, "ticks": 10}),
+              "replications": (bench_replications, {"worker_counts": (1, 2), "n_replications": 4, "duration": 60}),
+              "snapshot": (bench_snapshot, {"warmup": 60, "fleet_sizes": (10000, 100000)}),
+              "trace": (bench_trace, {"duration": 60}),
+              "metrics": (bench_metrics, {"n_points": 50000}),
+              "signal_control": (bench_signal_control, {"car_counts": (20,), "n_replications": 2, "duration": 600}),
+              "optimizer": (bench_optimizer, {"worker_counts": (1, 2), "n_plans": 32, "duration": 120}),
+              "priority": (bench_priority, {"background_counts": (0, 1000)}),
+              "overload": (bench_overload, {"rates": (500, 5000), "capacities": (None, 500), "duration": 3}),
+              "phases": (bench_phases, {"n_junctions": 100, "n_overrides": 10000}),
+              "routing": (bench_routing, {"grid": (16, 16), "n_tables": 16, "n_closures": 5, "n_lookups": 10000, "n_vehicles": 10000, "ticks": 5})}
+
+
+def run_benchmarks(names, quick=False):
+    report = {"python": sys.version.split()[0], "platform": platform.platform(), "timestamp": time.time(), "quick": quick, "benchmarks": {}}
+
+    for name in names:
+        function, quick_parameters = BENCHMARKS[name]
+        start = time.perf_counter()
+        results = function(**quick_parameters) if quick else function()
+        report["benchmarks"][name] = {"seconds": time.perf_counter() - start, "results": results}
+
+    return report
+
+
+def format_result(result):
+    return "  ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}" for key, value in result.items())
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks of the simulation hot paths")
+    parser.add_argument("names", nargs="*", metavar="name", help=f"benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for a fast regression check")
+    parser.add_argument("--json", default=None, help="write the results to this file (machine-readable)")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks {', '.join(unknown)}, expected some of {', '.join(BENCHMARKS)}")
+
+    report = run_benchmarks(args.names or list(BENCHMARKS), args.quick)
+
+    for name, benchmark in report["benchmarks"].items():
+        print(f"{name} ({benchmark['seconds']:.1f} s)")
+        for result in benchmark["results"]:
+            print(f"    {format_result(result)}")
+
+    if args.json is not None:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
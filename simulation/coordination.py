@@ -0,0 +1,292 @@
+import json
+from collections import deque
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Decision logic shared by the CentralCordinateAgent (real-time SPADE mode) and the headless engine, so that both modes decide the same way
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Cycle of the central, the same in both modes: it sleeps CENTRAL_SLEEP seconds, receives until no message arrived for RECEIVE_TIMEOUT seconds,
+# then handles what it received, the most urgent class first (see PriorityScheduler)
+CENTRAL_SLEEP = 1
+RECEIVE_TIMEOUT = 0.25
+
+# Longest time the central keeps receiving before it handles what it received - under a steady flow of requests the mailbox is never idle for 0.25 s
+RECEIVE_WINDOW = 1
+
+# Time an agent waits for the answer of the central before giving up, in seconds
+REQUEST_TIMEOUT = 5
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# List of the possible colors of the traffic lights (by cycle order)
+colors = ["green", "yellow", "red"]
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Next color of the fixed cycle green -> yellow -> red
+def next_color(color_name):
+    return colors[(colors.index(color_name) + 1) % len(colors)]
+
+
+# Command for a vehicle waiting at a traffic light with that color
+def command_for_light(color_name):
+    if color_name == "green":
+        return "move"
+    return "stop"
+
+
+# Command for a vehicle on a road without traffic light (road with a priority sign): it must give priority if there is any vehicle at position 5 on the roads it gives priority to (ex: road_5 and road_6)
+def command_for_priority_road(environment, road):
+    for other_road in environment.give_priority_to.get(road, []):
+        if environment.is_cell_occupied(other_road, 5):
+            return "give priority"
+    return "move"
+
+
+# Command for a person that wants to cross: returns the command and if the traffic light must be changed to red
+def command_for_person(color_name, emergency_pending):
+
+    # The traffic light is already red, the person can cross
+    if color_name == "red":
+        return "move", False
+
+    # The ambulance has priority, the person must wait
+    if emergency_pending:
+        return "wait", False
+
+    return "move", True
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Actuated signal control: every color lasts between a minimum and a maximum (in seconds) and the traffic light decides every second if it holds it,
+# from the queues of its roads and of the traffic lights of its intersection it conflicts with (the competing approaches, see phases.py)
+ACTUATED_BOUNDS = {"green": (3, 12), "yellow": (2, 2), "red": (3, 12)}
+
+
+class ActuatedController:
+    def __init__(self, environment, traffic_light_name, bounds=None):
+        self.environment = environment
+        self.traffic_light_name = traffic_light_name
+        self.bounds = bounds or ACTUATED_BOUNDS
+        self.competing = environment.phases.conflicting(traffic_light_name) # The traffic lights of its intersection it can not be green with
+
+    # Color for the next second, given the current one and how long it has lasted - the overrides (emergency/person) restart the count,
+    # so an override color also lasts at least its minimum
+    def decide(self, color_name, elapsed):
+        min_time, max_time = self.bounds[color_name]
+        if elapsed < min_time:
+            return color_name
+        if elapsed >= max_time or color_name == "yellow":
+            return next_color(color_name)
+
+        queue = self.environment.queue_length(self.traffic_light_name)
+        competing_queue = max((self.environment.queue_length(name) for name in self.competing), default=0)
+        served_first = queue > 0 and queue >= competing_queue
+
+        # Green is extended while its cars are the longest queue, red is cut short when they become it
+        if color_name == "green":
+            return color_name if served_first else next_color(color_name)
+        return next_color(color_name) if served_first else color_name
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Signal plan of the fixed cycle - the defaults are the original plan:
+#   - durations: seconds every color lasts, ex: {"green": 3, "yellow": 3, "red": 3}
+#   - offsets: extra seconds the first color of a traffic light lasts, to shift the cycles against each other, ex: {"Traffic_Light_2": 2}
+#   - initial_colors: color of a traffic light at the start (default: the one of the network), ex: {"Traffic_Light_1": "red"}
+#   - emergency_colors/person_colors: colors of the other traffic lights when one overrides its color (default: the phases of the intersection),
+#     ex: {"Traffic_Light_1": {"Traffic_Light_2": "red", "Traffic_Light_3": "yellow"}}
+# Saved as JSON, ex: main.py --headless --signal-plan plan.json (optimizer.py searches for the best plan of a scenario)
+DEFAULT_DURATIONS = {"green": 3, "yellow": 3, "red": 3}
+
+
+class SignalPlan:
+    def __init__(self, durations=None, offsets=None, initial_colors=None, emergency_colors=None, person_colors=None):
+        self.durations = dict(DEFAULT_DURATIONS, **(durations or {}))
+        self.offsets = dict(offsets or {})
+        self.initial_colors = dict(initial_colors or {})
+        self.emergency_colors = {name: dict(new_colors) for name, new_colors in (emergency_colors or {}).items()}
+        self.person_colors = {name: dict(new_colors) for name, new_colors in (person_colors or {}).items()}
+
+    # Colors of the other traffic lights when the sender changes to green ("emergency") or to red ("person") - from the phases of its intersection
+    # (phases.PhaseTable, ex: environment.phases) unless the plan has its own table for the sender
+    def new_colors(self, sender_traffic_light, event, phases=None):
+        if event == "emergency":
+            new_colors = self.emergency_colors.get(sender_traffic_light)
+        else:
+            new_colors = self.person_colors.get(sender_traffic_light)
+        if new_colors is not None:
+            return dict(new_colors)
+        return phases.new_colors(sender_traffic_light, event) if phases is not None else {}
+
+    def to_dict(self):
+        return {"durations": self.durations, "offsets": self.offsets, "initial_colors": self.initial_colors,
+                "emergency_colors": self.emergency_colors, "person_colors": self.person_colors}
+
+    @classmethod
+    def from_dict(cls, description):
+        return cls(**description)
+
+    # Same key for the same plan, whatever the order it was built in (cache of the optimizer)
+    def key(self):
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+
+# Plan of a scenario: None (the default plan), a SignalPlan, a dict or the path of a JSON file
+def load_signal_plan(description):
+    if description is None:
+        return SignalPlan()
+    if isinstance(description, SignalPlan):
+        return description
+    if isinstance(description, dict):
+        return SignalPlan.from_dict(description)
+    with open(description) as file:
+        return SignalPlan.from_dict(json.load(file))
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Local copy of the state of the traffic lights, kept up to date by the pushes of Environment.update_traffic_light
+# The central answers from it instead of asking the traffic light for its color (no round trip)
+class TrafficLightCache:
+    def __init__(self):
+        self.colors = {} # ex: "Traffic_Light_1": "red"
+        self.versions = {} # ex: "Traffic_Light_1": 3
+        self.lookups = 0 # Number of answers given from the cache
+
+    # Subscriber callback - ignores states older than the one already known
+    def update(self, traffic_light_name, color_name, version):
+        if version >= self.versions.get(traffic_light_name, -1):
+            self.colors[traffic_light_name] = color_name
+            self.versions[traffic_light_name] = version
+
+    def get(self, traffic_light_name):
+        self.lookups += 1
+        return self.colors.get(traffic_light_name)
+
+    def version(self, traffic_light_name):
+        return self.versions.get(traffic_light_name, -1)
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Emergencies received by the central in one cycle, coalesced by road: a road is alerted once (its traffic light and its cars), whatever the number of ambulances on it
+# The traffic lights with emergencies are indexed for the whole cycle (after the alerts too), so a person's request checks its intersection with a few lookups
+class EmergencyBatch:
+    def __init__(self):
+        self.roads = {} # ex: road_1: ["ambulance_1", "ambulance_3"]
+        self.traffic_lights = {} # Emergencies of the cycle by traffic light, ex: "Traffic_Light_1": 2
+        self.received = 0 # Number of emergencies added
+        self.coalesced = 0 # Number of emergencies that did not need an alert of their own
+
+    def add(self, ambulance):
+        ambulance_ids = self.roads.setdefault(ambulance.road, [])
+        if ambulance_ids:
+            self.coalesced += 1
+        ambulance_ids.append(ambulance.ambulance_id)
+        if ambulance.road.traffic_light != "No traffic light":
+            self.traffic_lights[ambulance.road.traffic_light] = self.traffic_lights.get(ambulance.road.traffic_light, 0) + 1
+        self.received += 1
+
+    # If any of the emergencies of the cycle is on a road with one of the traffic lights (any traffic light by default) - a person must wait for it
+    def pending_on_traffic_light(self, traffic_light_names=None):
+        if traffic_light_names is None:
+            return bool(self.traffic_lights)
+        return any(traffic_light_name in self.traffic_lights for traffic_light_name in traffic_light_names)
+
+    # Returns the emergencies not yet alerted, by road, and empties the batch (the traffic light index stays until end_cycle)
+    def take(self):
+        roads, self.roads = self.roads, {}
+        return roads
+
+    def end_cycle(self):
+        self.traffic_lights = {}
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Messages waiting for the central: one FIFO queue per priority class (0 first, see protocol.PRIORITY_CLASSES) - a message is only taken when every
+# more urgent queue is empty, so an emergency never waits behind the requests of the vehicles and people, whatever their number
+# Overload (ex: 10 times the usual traffic):
+#   - capacity of every class (None = unbounded): when its queue is full, put() refuses the oldest message of the class, the sender is told to retry later
+#     (load shedding) - the oldest is the closest to its deadline, the newest ones can still be answered in time
+#   - deadline of every class, in seconds (None = none): get() drops the messages that waited longer, their sender has already given up on the answer
+# so the central only spends its cycle on requests it can still answer in time, and the time to answer them does not grow with the traffic
+class PriorityScheduler:
+    def __init__(self, n_classes, capacities=None, deadlines=None):
+        self.queues = [deque() for _ in range(n_classes)]
+        self.capacities = list(capacities) if capacities is not None else [None] * n_classes
+        self.deadlines = list(deadlines) if deadlines is not None else [None] * n_classes
+        self.size = 0
+        self.shed = [0] * n_classes # Messages refused because their queue was full, by class
+        self.expired = [0] * n_classes # Messages dropped because they waited past their deadline, by class
+
+    def __len__(self):
+        return self.size
+
+    # Queues the message ("received" is the time its deadline counts from, ex: when its sender sent it) - returns the message refused to make room for it, None if the queue was not full
+    def put(self, priority_class, item, received=0.0):
+        queue = self.queues[priority_class]
+        capacity = self.capacities[priority_class]
+        queue.append((received, item))
+        if capacity is not None and len(queue) > capacity:
+            self.shed[priority_class] += 1
+            return queue.popleft()[1]
+        self.size += 1
+        return None
+
+    # Most urgent message that is still within its deadline at "now", ex: (0, (msg, envelope)) - IndexError if there is none
+    def get(self, now=0.0):
+        for priority_class, queue in enumerate(self.queues):
+            deadline = self.deadlines[priority_class]
+            while queue:
+                received, item = queue.popleft()
+                self.size -= 1
+                if deadline is not None and now - received > deadline:
+                    self.expired[priority_class] += 1
+                    continue
+                return priority_class, item
+        raise IndexError("get from an empty scheduler")
+
+    # Number of messages waiting in every class, ex: [0, 1, 25, 3]
+    def depths(self):
+        return [len(queue) for queue in self.queues]
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Partition of the intersections between several central coordinators (shards), ex: ["central1@localhost", "central2@localhost"]
+# Every intersection, with all of its traffic lights, is owned by exactly one shard (round robin by declaration order)
+class ShardMap:
+    def __init__(self, environment, central_jids):
+        self.central_jids = list(central_jids)
+        self.intersection_shard = {} # ex: "Intersection_1": "central1@localhost"
+        self.road_shard = {} # Roads that end at an intersection, ex: road_1: "central1@localhost"
+        self.traffic_light_shard = {} # ex: "Traffic_Light_1": "central1@localhost"
+        self.handoffs = 0 # Number of times an agent was moved to another shard
+
+        for index, intersection_name in enumerate(environment.intersection_roads):
+            central_jid = self.central_jids[index % len(self.central_jids)]
+            self.intersection_shard[intersection_name] = central_jid
+
+            for road in environment.intersection_roads[intersection_name]:
+                self.road_shard[road] = central_jid
+
+            for traffic_light_name in environment.intersection_traffic_lights[intersection_name]:
+                self.traffic_light_shard[traffic_light_name] = central_jid
+
+    # Central of the road - None if the road does not end at an intersection
+    def shard_for_road(self, road):
+        return self.road_shard.get(road)
+
+    def shard_for_traffic_light(self, traffic_light_name):
+        return self.traffic_light_shard.get(traffic_light_name, self.central_jids[0])
+
+    def traffic_lights_of(self, central_jid):
+        return [name for name, jid in self.traffic_light_shard.items() if jid == central_jid]
+
+    # Points the agent (vehicle or person) to the central of its road - on roads without intersection it keeps the current one
+    def route(self, agent):
+        central_jid = self.shard_for_road(agent.road)
+        if central_jid is not None and str(agent.central_jid) != central_jid:
+            if str(agent.central_jid) in self.central_jids:
+                self.handoffs += 1
+            agent.central_jid = central_jid
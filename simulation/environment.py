@@ -1,10 +1,15 @@
 import random
+import events
+from network import RoadNetwork, load_network
+from routing import RoutingTable, UNREACHABLE
+from phases import PhaseTable
 
 #--------------------------------------------------------------------------------------------------------------------------------------------------------------      
 
 class Road:
-    def __init__(self, name, traffic_light_name, zebra_crossing, traffic_sign):
+    def __init__(self, name, traffic_light_name, zebra_crossing, traffic_sign, index=None):
         self.name = name # road id, ex: road_1
+        self.index = index # Index of the road in the RoadNetwork, None for roads added by hand
         self.traffic_light = traffic_light_name # Traffic light id of the one associated to the road, ex: Traffic_Light_1
         self.zebra_crossing = zebra_crossing # Zebra crossing id of the one associated to the road, ex: Zebra_Crossing_1
         self.traffic_sign = traffic_sign # Traffic Signal id of the one associated to the road, ex: Priority
@@ -14,53 +19,93 @@ class Road:
 # Every road that has a traffic light associated, by default it is positioned at the end of the road: road[5]
 # Every road that has a zebra crossing associated, by default it is positioned at the end of the road: road[5]
 
+# Positions of a road where the vehicles wait for the traffic light (the stop line): they ask the central at 4, the traffic light is at 5
+QUEUE_POSITIONS = (4, 5)
+
 #--------------------------------------------------------------------------------------------------------------------------------------------------------------      
 
 class Environment:
 
-    def __init__(self):
+    def __init__(self, seed=None, network=None):
         self.car_agent = None
 
+        # Random generator used for every route choice, so that a run can be reproduced from its seed
+        self.seed = seed
+        self.random = random.Random(seed)
+
         self.cars = {} # Dictionary with all of the cars, ex: car_jid: CarAgent()
         self.ambulances = {} # Dictionary with all of the ambulances, ex: ambulance_jid: AmbulanceAgent()
         self.people = {} # Dictionary with all of the people, ex: person_jid: PersonAgent()
 
-        # Roads with traffic lights
-        self.road_1 = Road("road_1", "Traffic_Light_1", "Zebra_Crossing_1", "No traffic sign")  # the one on horizontal until the intersection - the one above
-        self.road_2 = Road("road_2", "Traffic_Light_1", "Zebra_Crossing_1", "No traffic sign")  # the one on horizontal until the intersection - the one below
-        self.road_3 = Road("road_3", "Traffic_Light_2", "Zebra_Crossing_2", "No traffic sign")  # the one on vertical until the intersection - the one on the left
-        self.road_4 = Road("road_4", "Traffic_Light_3", "Zebra_Crossing_3", "No traffic sign")  # the one on vertical until the intersection - the one on the right 
-        self.road_9 = Road("road_8", "No traffic light", "No Zebra Crossing", "Priority")  # the one on vertical on the right - the one below
+        # Occupancy index, per vehicle type: (road, position) -> jids of the vehicles in that cell
+        # (dicts used as insertion-ordered sets, so that iterating over them does not depend on the hash seed)
+        self.occupancy = {"car": {}, "ambulance": {}}
 
+        # Road index, per vehicle type: road -> jids of the vehicles on that road
+        self.road_occupancy = {"car": {}, "ambulance": {}}
 
-        # Roads without traffic lights
-        self.road_5 = Road("road_5", "No traffic light", "No Zebra Crossing", "No traffic sign")  # the one on horizontal from the intersection - the one above
-        self.road_6 = Road("road_6", "No traffic light", "No Zebra Crossing", "No traffic sign")  # the one on horizontal from the intersection - the one below
-        self.road_7 = Road("road_7", "No traffic light", "No Zebra Crossing", "No traffic sign")  # the one on vertical from the intersection - the one on the left
-        self.road_8 = Road("road_8", "No traffic light", "No Zebra Crossing", "No traffic sign")  # the one on vertical from the intersection - the one on the right 
+        # Road network (roads, traffic lights, zebra crossings, signs and turn options) - by default the three traffic lights demo
+        if network is None:
+            network = load_network()
+        elif not isinstance(network, RoadNetwork):
+            network = load_network(network)
+        self.network = network
 
-        self.road_10 = Road("road_8", "No traffic light", "No Zebra Crossing", "No traffic sign")  # the one on vertical on the right - the one above 
-        self.road_11 = Road("road_8", "No traffic light", "No Zebra Crossing", "No traffic sign")  # the one on horizontal on the right- the one above 
-        self.road_12 = Road("road_8", "No traffic light", "No Zebra Crossing", "No traffic sign")  # the one on horizontal on the right - the one above 
+        # One Road per road of the network, by index - also available as attributes by id, ex: self.road_1
+        self.roads = [Road(network.road_names[index], network.traffic_light_name_of(index), network.road_zebra_crossings[index], network.road_traffic_signs[index], index)
+                      for index in range(len(network.road_names))]
+        for road in self.roads:
+            if road.name.isidentifier():
+                setattr(self, road.name, road)
 
-        
-        self.traffic_lights = {"Traffic_Light_1": "red", 
-                               "Traffic_Light_2": "yellow", 
-                               "Traffic_Light_3": "green"}  # Default traffic light color name
+        self.traffic_lights = dict(zip(network.traffic_light_names, network.initial_colors))  # Default traffic light color name
+
+        # Version of the state of every traffic light - incremented on every change, ex: "Traffic_Light_1": 3
+        self.traffic_light_versions = {name: 0 for name in self.traffic_lights}
+
+        # Functions called on every traffic light change with (traffic_light_name, color_name, version), ex: the cache of the CentralCordinateAgent
+        self.traffic_light_subscribers = []
         
     
 
-        self.choose_road_after_intersection = {self.road_1: [self.road_5, self.road_7],
-                                                self.road_2: [self.road_6],
-                                                self.road_3: [self.road_8, self.road_6],
-                                                self.road_4: [self.road_7],
-                                                self.road_5: [self.road_11],
-                                                self.road_6: [self.road_12],
-                                                self.road_9: [self.road_10]} # Being on the "key road", the vehicle can choose were to go next (after de intersection)
+        # Being on the "key road", the vehicle can choose were to go next (after de intersection)
+        self.choose_road_after_intersection = {road: [self.roads[next_road] for next_road in network.next_of(road.index)]
+                                               for road in self.roads if network.next_of(road.index)}
         
-        self.choose_new_road = [self.road_1, self.road_2, self.road_3, self.road_4, self.road_9] # When the car reaches the end of a road, it can choose a new one to start all over - cicle
+        self.choose_new_road = [self.roads[road] for road in network.start_roads] # When the car reaches the end of a road, it can choose a new one to start all over - cicle
       
-        self.choose_zebra_crossing = [self.road_1, self.road_3, self.road_4] # When a person crosses a zebra crossing, he can choose a new one
+        self.choose_zebra_crossing = [self.roads[road] for road in network.zebra_crossing_roads] # When a person crosses a zebra crossing, he can choose a new one
+
+        # Roads with a priority sign -> roads they must give priority to
+        self.give_priority_to = {road: [self.roads[other_road] for other_road in network.priority_of(road.index)]
+                                 for road in self.roads if network.priority_of(road.index)}
+
+        # Intersections - the roads that end at each one and the traffic lights that control it
+        self.intersection_roads = {name: [] for name in network.intersection_names}
+        for road in self.roads:
+            if network.road_intersection[road.index] >= 0:
+                self.intersection_roads[network.intersection_names[network.road_intersection[road.index]]].append(road)
+        self.intersection_traffic_lights = {name: [network.traffic_light_names[light] for light in network.lights_of(index)] for index, name in enumerate(network.intersection_names)}
+        self.road_intersection = {road: name for name, roads in self.intersection_roads.items() for road in roads}
+        self.traffic_light_intersection = {traffic_light_name: name for name, traffic_light_names in self.intersection_traffic_lights.items() for traffic_light_name in traffic_light_names}
+
+        # Phases of every intersection, with their conflict tables (see phases.py) - colors of the other traffic lights when one overrides its color
+        self.phases = PhaseTable(network)
+
+        # Roads controlled by every traffic light (its approaches), ex: "Traffic_Light_1": [road_1, road_2]
+        self.traffic_light_roads = {name: [] for name in self.traffic_lights}
+        for road in self.roads:
+            if road.traffic_light in self.traffic_light_roads:
+                self.traffic_light_roads[road.traffic_light].append(road)
+
+        # Partition of the intersections by central coordinator (see coordination.ShardMap), None while there is only one central
+        self.shard_map = None
+
+        # Next-hop tables of the vehicles with a destination (see routing.py) - built per destination, the first time a vehicle heads for it
+        self.routing = RoutingTable(network)
+
+        # Destinations of the new trips of the vehicles with a destination: the roads that can be reached from an intersection
+        self.destination_roads = [road for road in self.roads if len(self.routing.previous_of(road.index))]
 
 
 
@@ -69,14 +114,71 @@ class Environment:
     def add_car_agent(self, car_agent):
         self.car_agent = car_agent
         self.cars[self.car_agent.jid] = self.car_agent 
+        self.index_vehicle(self.car_agent.jid, "car")
+        if self.shard_map is not None:
+            self.shard_map.route(self.car_agent)
 
     def add_ambulance_agent(self, ambulance_agent):
         self.ambulance_agent = ambulance_agent
         self.ambulances[self.ambulance_agent.jid] = self.ambulance_agent
+        self.index_vehicle(self.ambulance_agent.jid, "ambulance")
+        if self.shard_map is not None:
+            self.shard_map.route(self.ambulance_agent)
+
+    # Function to take a vehicle out of the environment, ex: when it is handed off to another region (see parallel.py)
+    def remove_vehicle(self, vehicle_jid, type_vehicle):
+        self.unindex_vehicle(vehicle_jid, type_vehicle)
+        return self.get_vehicles(type_vehicle).pop(vehicle_jid)
 
     def add_person_agent(self, person_agent):
         self.person_agent = person_agent
         self.people[self.person_agent.jid] = self.person_agent
+        if self.shard_map is not None:
+            self.shard_map.route(self.person_agent)
+
+
+
+
+    # Function to know how many cars are waiting for a traffic light: the cars at the stop line (positions 4 and 5) of the roads it controls -
+    # the cars still driving on the rest of the road are not queued yet
+    def queue_length(self, traffic_light_name):
+        return sum(len(self.vehicles_at(road, position, "car")) for road in self.traffic_light_roads.get(traffic_light_name, ()) for position in QUEUE_POSITIONS)
+
+
+
+
+    # Function to know if a road ends at an intersection (with traffic lights or a priority sign) - the vehicles must ask the central before crossing it
+    def ends_at_intersection(self, road):
+        return road in self.road_intersection
+
+
+
+
+    # Functions to add intersections/traffic lights besides the default ones
+    def add_traffic_light(self, traffic_light_name, color_name):
+        self.traffic_lights[traffic_light_name] = color_name
+        self.traffic_light_versions[traffic_light_name] = 0
+        for callback in self.traffic_light_subscribers:
+            callback(traffic_light_name, color_name, 0)
+
+    def add_intersection(self, intersection_name, roads, traffic_light_names, phases=None):
+        self.intersection_roads[intersection_name] = list(roads)
+        for road in roads:
+            self.road_intersection[road] = intersection_name
+        self.intersection_traffic_lights[intersection_name] = list(traffic_light_names)
+        for traffic_light_name in traffic_light_names:
+            self.traffic_light_intersection[traffic_light_name] = intersection_name
+        self.phases.add_junction(intersection_name, traffic_light_names, phases)
+
+
+
+
+    # Function to split the intersections between several central coordinators - every agent is routed to the central that owns its road
+    def set_shard_map(self, shard_map):
+        self.shard_map = shard_map
+        for agents in (self.cars, self.ambulances, self.people):
+            for agent in agents.values():
+                self.shard_map.route(agent)
 
 
 
@@ -85,13 +187,31 @@ class Environment:
     def update_traffic_light(self, traffic_light_name, color_name, event):
         
         self.traffic_lights[traffic_light_name] = color_name
-        if event is not None:
+        self.traffic_light_versions[traffic_light_name] += 1
+
+        # Pushes the new state to the subscribers
+        for callback in self.traffic_light_subscribers:
+            callback(traffic_light_name, color_name, self.traffic_light_versions[traffic_light_name])
+
+        if event == "emergency":
+            events.traffic_light.info("changed_emergency", traffic_light=traffic_light_name, color=color_name)
+
+        elif event == "person":
+            events.traffic_light.info("changed_person", traffic_light=traffic_light_name, color=color_name)
 
-            if event == "emergency":
-                print(f"{traffic_light_name} is now {color_name} due to an emergency")
+        else:
+            events.traffic_light.debug("changed", traffic_light=traffic_light_name, color=color_name)
 
-            elif event == "person":
-                print(f"{traffic_light_name} is now {color_name} due to the zebra crossing")
+
+
+    # Function to subscribe to the changes of the traffic lights - the callback first receives the current state of every traffic light
+    def subscribe_traffic_lights(self, callback):
+        self.traffic_light_subscribers.append(callback)
+        for traffic_light_name, color_name in self.traffic_lights.items():
+            callback(traffic_light_name, color_name, self.traffic_light_versions[traffic_light_name])
+
+    def unsubscribe_traffic_lights(self, callback):
+        self.traffic_light_subscribers.remove(callback)
 
 
 
@@ -104,69 +224,143 @@ class Environment:
 
     # Funtions to choose a new zebra crossing/road
     def change_zebra_crossing (self, person_jid):
-        self.people[person_jid].road = random.choice(self.choose_zebra_crossing)
+        self.people[person_jid].road = self.random.choice(self.choose_zebra_crossing)
+        if self.shard_map is not None:
+            self.shard_map.route(self.people[person_jid])
 
     def change_road(self, vehicle_jid, vehicle_id, road, type_vehicle):
 
-        if type_vehicle == "car":
-            current_position = self.cars[vehicle_jid].position
-        
-        else: #type_vehicle == "ambulance"
-            current_position = self.ambulances[vehicle_jid].position
-
-        if current_position == 5:
-
-            # Reaching the intersection, the vehicle chooses one of the possible roads
-            if road.name in ["road_1", "road_2", "road_3", "road_4"]:
-                if type_vehicle == "car":
-                    self.cars[vehicle_jid].position = 0
-                    self.cars[vehicle_jid].road = random.choice(self.choose_road_after_intersection[self.cars[vehicle_jid].road])
-                    print(f"{vehicle_id}: reached an intersection, choosing a new road: {self.cars[vehicle_jid].road.name}")
-
-                else: # type_vehicle == "ambulance"
-                    self.ambulances[vehicle_jid].position = 0
-                    self.ambulances[vehicle_jid].road = random.choice(self.choose_road_after_intersection[self.ambulances[vehicle_jid].road])
-                    print(f"{vehicle_id}: reached an intersection, choosing a new road: {self.ambulances[vehicle_jid].road.name}")
-            
+        vehicle = self.get_vehicles(type_vehicle)[vehicle_jid]
+
+        if vehicle.position == 5:
+
+            # Reaching the end of its destination the trip is over, the vehicle starts a new one from a new road to a new destination
+            if getattr(vehicle, "destination", None) is road:
+                self.set_vehicle_location(vehicle_jid, type_vehicle, self.random.choice(self.choose_new_road), 0)
+                self.start_trip(vehicle)
+                events.vehicle.info("arrived", vehicle=vehicle_id, road=road.name, destination=vehicle.destination.name)
+
+            # Reaching the end of a road with turn options (ex: the intersection), the vehicle chooses one of the possible roads (the next hop of its route, if it has a destination)
+            elif road in self.choose_road_after_intersection:
+                self.set_vehicle_location(vehicle_jid, type_vehicle, self.next_road(vehicle), 0)
+                events.vehicle.info("new_road_intersection", vehicle=vehicle_id, road=vehicle.road.name)
+
             # Reaching the end of the "trip" the car chooses a new road to start all over
             else:
-                if type_vehicle == "car": 
-                    self.cars[vehicle_jid].position = 0
-                    self.cars[vehicle_jid].road = random.choice(self.choose_new_road)
-                
-                else: #type_vehicle == "ambulance"
-                    self.ambulances[vehicle_jid].position = 0
-                    self.ambulances[vehicle_jid].road = random.choice(self.choose_new_road)
+                self.set_vehicle_location(vehicle_jid, type_vehicle, self.random.choice(self.choose_new_road), 0)
+                events.vehicle.info("new_road_end", vehicle=vehicle_id, road=road.name)
+
+    # Function to choose the road after the intersection: the next hop to the destination, a random turn option for the vehicles without one (or without a route)
+    def next_road(self, vehicle):
+        destination = getattr(vehicle, "destination", None)
+        if destination is not None:
+            next_road = self.routing.next_road(vehicle.road.index, destination.index)
+            if next_road != UNREACHABLE:
+                return self.roads[next_road]
+        return self.random.choice(self.choose_road_after_intersection[vehicle.road])
+
+    # Function to give a vehicle a new trip from its current road, ex: destination=self.road_7 - a random destination by default
+    def start_trip(self, vehicle, destination=None):
+        vehicle.origin = vehicle.road
+        vehicle.destination = destination if destination is not None else self.random.choice(self.destination_roads)
+
+    # Functions to close/reopen a road and to weight the roads by their number of vehicles - only the vehicles with a destination avoid them
+    # (see routing.py: only the tables of the routes the change can affect are rebuilt)
+    def close_road(self, road):
+        self.routing.close_road(road.index)
+        events.vehicle.info("road_closed", road=road.name)
+
+    def open_road(self, road):
+        self.routing.open_road(road.index)
+        events.vehicle.info("road_opened", road=road.name)
+
+    # Weight of a road = 1 + factor * vehicles on it / 6 positions, only updated when it changes by at least "tolerance" (so that the tables are not rebuilt for every car)
+    def reweight_by_congestion(self, factor=1.0, tolerance=0.5):
+        weights = self.routing.weights
+        for road in self.roads:
+            if weights[road.index] == float("inf"):
+                continue
+            weight = 1.0 + factor * (len(self.vehicles_on_road(road, "car")) + len(self.vehicles_on_road(road, "ambulance"))) / 6
+            if abs(weight - weights[road.index]) >= tolerance:
+                self.routing.set_weight(road.index, weight)
+
+    # Function to move a vehicle one position forward, choosing a new road first if it is at the end of the current one
+    def move_vehicle(self, vehicle_jid, vehicle_id, type_vehicle):
+        vehicle = self.get_vehicles(type_vehicle)[vehicle_jid]
+        self.change_road(vehicle_jid, vehicle_id, vehicle.road, type_vehicle)
+        self.set_vehicle_location(vehicle_jid, type_vehicle, vehicle.road, vehicle.position + 1)
+
+
+
+
+    # Functions to keep the occupancy index up to date
+    def get_vehicles(self, type_vehicle):
+        if type_vehicle == "car":
+            return self.cars
+        return self.ambulances
+
+    def index_vehicle(self, vehicle_jid, type_vehicle):
+        vehicle = self.get_vehicles(type_vehicle)[vehicle_jid]
+        self.occupancy[type_vehicle].setdefault((vehicle.road, vehicle.position), {})[vehicle_jid] = None
+        self.road_occupancy[type_vehicle].setdefault(vehicle.road, {})[vehicle_jid] = None
 
-                print(f"{vehicle_id}: reached the end of the road, choosing a new road: {road.name}")
+    def unindex_vehicle(self, vehicle_jid, type_vehicle):
+        vehicle = self.get_vehicles(type_vehicle)[vehicle_jid]
+
+        # Empty cells/roads are removed so that the index only grows with the number of vehicles
+        cell = self.occupancy[type_vehicle].get((vehicle.road, vehicle.position))
+        if cell is not None:
+            cell.pop(vehicle_jid, None)
+            if not cell:
+                del self.occupancy[type_vehicle][(vehicle.road, vehicle.position)]
+
+        on_road = self.road_occupancy[type_vehicle].get(vehicle.road)
+        if on_road is not None:
+            on_road.pop(vehicle_jid, None)
+            if not on_road:
+                del self.road_occupancy[type_vehicle][vehicle.road]
+
+    # Every change of road/position of a vehicle must go through here so that the index stays consistent
+    def set_vehicle_location(self, vehicle_jid, type_vehicle, road, position):
+        vehicle = self.get_vehicles(type_vehicle)[vehicle_jid]
+        self.unindex_vehicle(vehicle_jid, type_vehicle)
+        vehicle.road = road
+        vehicle.position = position
+        self.index_vehicle(vehicle_jid, type_vehicle)
+
+        # Hand-off to the central that owns the new road
+        if self.shard_map is not None:
+            self.shard_map.route(vehicle)
+
+
+
+
+    # Functions to query the occupancy index
+    def vehicles_at(self, road, position, type_vehicle):
+        # Returns the jids of the vehicles of that type on that cell
+        return self.occupancy[type_vehicle].get((road, position), ())
+
+    def vehicles_on_road(self, road, type_vehicle):
+        # Returns the jids of the vehicles of that type on that road
+        return self.road_occupancy[type_vehicle].get(road, ())
+
+    def is_cell_occupied(self, road, position, types_vehicle=("car", "ambulance")):
+        for type_vehicle in types_vehicle:
+            if (road, position) in self.occupancy[type_vehicle]:
+                return True
+        return False
 
 
 
 
     # Function to verify if there is some vehicle ahead
     def is_vehicle_ahead(self, vehicle_jid, type_vehicle):
-        
-        # Checks if theres any sort of vehicle ahead
-        if type_vehicle == "car": 
-            current_position = self.cars[vehicle_jid].position
-
-            # Check if there is any ambulance in front of it
-            for ambulance_jid, ambulance in self.ambulances.items():
-                if ambulance.road == self.cars[vehicle_jid].road and ambulance.position == current_position + 1:
-                    return True
-            
-            # Check if there is any car in front of it
-            for other_car_jid, other_car in self.cars.items():
-                if other_car_jid != vehicle_jid and other_car.road == self.cars[vehicle_jid].road and other_car.position == current_position + 1:
-                    return True
-            return False
+
+        vehicle = self.get_vehicles(type_vehicle)[vehicle_jid]
+
+        # A car stops for any sort of vehicle ahead
+        if type_vehicle == "car":
+            return self.is_cell_occupied(vehicle.road, vehicle.position + 1)
 
         # Is an ambulance - only checks if there is an ambulance ahead
-        else: 
-            current_position = self.ambulances[vehicle_jid].position
-
-            # Check if there is any ambulance in front of it
-            for other_ambulance_jid, other_ambulance in self.ambulances.items():
-                if other_ambulance_jid != vehicle_jid and other_ambulance.road == self.ambulances[vehicle_jid].road and other_ambulance.position == current_position + 1:
-                    return True
-            return False
\ No newline at end of file
+        return self.is_cell_occupied(vehicle.road, vehicle.position + 1, ("ambulance",))
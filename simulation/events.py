@@ -0,0 +1,296 @@
+import sys
+import json
+import time
+import queue
+import atexit
+import threading
+from functools import partial
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Structured event log used by the agents, the environment and the headless engine instead of print():
+#   - every event is a record (time, category, level, kind, fields), ex: (12.0, "vehicle", INFO, "moving", {"vehicle": "car_1", "position": 3, "road": "road_1"})
+#   - each category has its own level; the debug/info/warning functions of a disabled level are a no-op, so disabled events cost one empty call
+#   - the records go to the sinks, which write them in batches: ConsoleSink (the text we used to print), JsonLinesSink (one JSON object per line)
+#   - BackgroundSink moves the writing of another sink to a thread, so the event loop never waits on the disk/terminal
+# Usage: events.vehicle.info("moving", vehicle=car_id, position=position, road=road.name)
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+OFF = 100
+
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "off": OFF}
+LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARNING: "warning"}
+
+CATEGORIES = ("agent", "vehicle", "traffic_light", "central", "person")
+
+# Console text of every (category, kind) - the events without a template are not shown on the console
+TEMPLATES = {("agent", "traffic_light_started"): "{traffic_light} started",
+             ("agent", "central_started"): "CentralCordinateAgent started",
+             ("agent", "car_started"): "CarAgent: {vehicle} started",
+             ("agent", "ambulance_started"): "AmbulanceAgent: {vehicle} started",
+             ("agent", "person_started"): "Person Agent: {person} started",
+             ("agent", "invalid_message"): "{to}: ignoring a message from {sender}: {error}",
+             ("agent", "request_timeout"): "{agent}: no answer to the {request} request {correlation_id}",
+             ("agent", "behaviour_failed"): "{agent}: {behaviour} stopped on {error}, the agent is dead",
+
+             ("vehicle", "moving"): "{vehicle}: Moving to position {position} on {road}.",
+             ("vehicle", "vehicle_ahead"): "{vehicle}: Waiting, there's a vehicle ahead on {road}.",
+             ("vehicle", "ambulance_ahead"): "{vehicle}: Waiting, there's an ambulance ahead on {road}.",
+             ("vehicle", "emergency_stop"): "{vehicle}: Stopping due to an emergency on {road}.",
+             ("vehicle", "stopping"): "{vehicle}: Stopping.",
+             ("vehicle", "giving_priority"): "{vehicle}: Giving priority.",
+             ("vehicle", "green_light"): "Emergency at {vehicle}: Traffic Light green. Going forward, be careful.",
+             ("vehicle", "new_road_intersection"): "{vehicle}: reached an intersection, choosing a new road: {road}",
+             ("vehicle", "new_road_end"): "{vehicle}: reached the end of the road, choosing a new road: {road}",
+
+             ("traffic_light", "changed"): "{traffic_light} is now {color}",
+             ("traffic_light", "changed_emergency"): "{traffic_light} is now {color} due to an emergency",
+             ("traffic_light", "changed_person"): "{traffic_light} is now {color} due to the zebra crossing",
+
+             ("central", "emergency_traffic_light"): "Emergency at {ambulance}. Changing traffic light {traffic_light} to green. All the cars on {road} must stop",
+             ("central", "emergency"): "Emergency at {ambulance}. All the cars on {road} must stop.",
+             ("central", "change_to_red"): "Changing {traffic_light} to red.",
+             ("central", "decision"): "{central}: {request} from {sender} -> {command}",
+             ("central", "unexpected_message"): "{central}: unexpected {request} message from {sender}",
+
+             ("person", "approaching"): "{person} approaching a zebra crossing on {road}.",
+             ("person", "crossing"): "Central Agent responded with: {command}. {person} crossing the street.",
+             ("person", "waiting"): "Central Agent responded with: {command}. {person} waiting."}
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def disabled(kind, **fields):
+    pass
+
+
+# Events of one category - debug/info/warning are rebound to the log or to disabled() whenever the level or the sinks change
+class Channel:
+    def __init__(self, log, category, level=INFO):
+        self.log = log
+        self.category = category
+        self.level = level
+        self.update()
+
+    def set_level(self, level):
+        self.level = level
+        self.update()
+
+    def enabled(self, level=INFO):
+        return bool(self.log.sinks) and level >= self.level
+
+    def update(self):
+        for level, name in LEVEL_NAMES.items():
+            setattr(self, name, partial(self.log.emit, self.category, level) if self.enabled(level) else disabled)
+
+
+class EventLog:
+    def __init__(self, clock=time.time):
+        self.clock = clock # Time of the events, ex: the virtual clock of the headless engine
+        self.sinks = []
+        self.channels = {category: Channel(self, category) for category in CATEGORIES}
+        self.emitted = 0
+
+    def channel(self, category):
+        return self.channels[category]
+
+    def set_clock(self, clock):
+        self.clock = clock
+
+    # Level of one category, or of all of them (category=None), ex: set_level("vehicle", WARNING)
+    def set_level(self, category, level):
+        for channel in self.channels.values() if category is None else [self.channels[category]]:
+            channel.set_level(level)
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        self.update()
+        return sink
+
+    def remove_sink(self, sink):
+        self.sinks.remove(sink)
+        sink.close()
+        self.update()
+
+    def update(self):
+        for channel in self.channels.values():
+            channel.update()
+
+    def emit(self, category, level, kind, **fields):
+        self.emitted += 1
+        record = (self.clock(), category, level, kind, fields)
+        for sink in self.sinks:
+            sink.emit(record)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+        self.sinks = []
+        self.update()
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Sinks: keep the records and write them "buffer_size" at a time
+class BufferedSink:
+    def __init__(self, buffer_size=1):
+        self.buffer_size = buffer_size
+        self.buffer = []
+
+    def emit(self, record):
+        self.buffer.append(record)
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            records, self.buffer = self.buffer, []
+            self.write(records)
+
+    def close(self):
+        self.flush()
+
+    def write(self, records):
+        raise NotImplementedError
+
+
+# The console output of the simulation - one line per event with a template
+class ConsoleSink(BufferedSink):
+    def __init__(self, stream=None, buffer_size=1, level=DEBUG):
+        super().__init__(buffer_size)
+        self.stream = stream # None = sys.stdout at the time of writing (so redirect_stdout works)
+        self.level = level # Events below this level are not shown, ex: the debug events enabled for a trace
+
+    def write(self, records):
+        lines = [TEMPLATES[category, kind].format(**fields) for _, category, level, kind, fields in records
+                 if (category, kind) in TEMPLATES and level >= self.level]
+        if lines:
+            stream = self.stream or sys.stdout
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+
+
+# One JSON object per line, ex: {"time": 12.0, "category": "vehicle", "level": "info", "kind": "moving", "vehicle": "car_1", "position": 3, "road": "road_1"}
+class JsonLinesSink(BufferedSink):
+    def __init__(self, path, buffer_size=1024):
+        super().__init__(buffer_size)
+        self.file = open(path, "w")
+
+    def write(self, records):
+        self.file.write("".join(json.dumps({"time": t, "category": category, "level": LEVEL_NAMES[level], "kind": kind, **fields}) + "\n"
+                                for t, category, level, kind, fields in records))
+
+    def close(self):
+        super().close()
+        if not self.file.closed:
+            self.file.close()
+
+
+# Runs another sink on a thread: emit() only puts the record in a queue, the thread writes whatever has accumulated in one batch
+# If the sink fails (ex: disk full) the thread stops and flush() raises the error instead of waiting for it forever
+class BackgroundSink:
+    def __init__(self, sink):
+        self.sink = sink
+        self.queue = queue.SimpleQueue()
+        self.error = None # Exception that stopped the thread
+        self.thread = threading.Thread(target=self.run, name="event-log", daemon=True)
+        self.thread.start()
+
+    def emit(self, record):
+        self.queue.put(record)
+
+    # Waits until the thread has written every record emitted so far
+    def flush(self):
+        done = threading.Event()
+        self.queue.put(done)
+        while not done.wait(0.1):
+            if not self.thread.is_alive():
+                raise RuntimeError(f"The event log thread of {type(self.sink).__name__} stopped: {self.error!r}") from self.error
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def run(self):
+        try:
+            self.write_batches()
+        except Exception as error: # Raised by the next flush()
+            self.error = error
+
+    def write_batches(self):
+        while True:
+            batch = [self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get())
+
+            for item in batch:
+                if item is None or isinstance(item, threading.Event):
+                    self.sink.flush()
+                    if item is None:
+                        self.sink.close()
+                        return
+                    item.set()
+                else:
+                    self.sink.emit(item)
+
+            self.sink.flush()
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Log of the process, with the console output on by default
+log = EventLog()
+console = log.add_sink(ConsoleSink())
+atexit.register(log.close)
+
+agent = log.channel("agent")
+vehicle = log.channel("vehicle")
+traffic_light = log.channel("traffic_light")
+central = log.channel("central")
+person = log.channel("person")
+
+
+# "[category=]level" -> (category or None, level), ex: "vehicle=off" -> ("vehicle", OFF) - ValueError for an unknown category or level
+def parse_level(spec):
+    category, _, level = spec.rpartition("=")
+    if category and category not in CATEGORIES:
+        raise ValueError(f"unknown category {category!r} (one of {', '.join(CATEGORIES)})")
+    if level not in LEVELS:
+        raise ValueError(f"unknown level {level!r} (one of {', '.join(LEVELS)})")
+    return category or None, LEVELS[level]
+
+
+# Command line setup, ex: configure(["info", "vehicle=off"], "events.jsonl", console_output=False)
+# A trace (see traces.py) records the debug events too - the console keeps showing the info ones unless a debug level is asked for
+# console_background: the console is written by a thread (real-time mode: no write to stdout on the event loop of the agents)
+def configure(levels=(), path=None, console_output=True, console_buffer_size=1, trace_path=None, console_background=False):
+    global console
+
+    console_level = DEBUG
+    if trace_path is not None:
+        log.set_level(None, DEBUG)
+        console_level = INFO
+
+    for spec in levels:
+        category, level = parse_level(spec)
+        log.set_level(category, level)
+        if level == DEBUG:
+            console_level = DEBUG
+
+    if console is not None:
+        log.remove_sink(console)
+        console = None
+    if console_output:
+        console_sink = ConsoleSink(buffer_size=console_buffer_size, level=console_level)
+        console = log.add_sink(BackgroundSink(console_sink) if console_background else console_sink)
+
+    if path is not None:
+        log.add_sink(BackgroundSink(JsonLinesSink(path)))
+
+    if trace_path is not None:
+        from traces import TraceSink
+        log.add_sink(BackgroundSink(TraceSink(trace_path)))
@@ -0,0 +1,212 @@
+import numpy as np
+from routing import RoutingTable, UNREACHABLE
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Batched vehicle state (struct of arrays) for large fleets: instead of one agent per vehicle, the road, position, type and status of every vehicle
+# live in NumPy arrays and a whole tick is a few vectorized operations.
+# One tick is one cycle of CarBehaviour/AmbulanceBehaviour.run for every vehicle, with the same rules:
+#   - a vehicle moves one position forward if the cell ahead is free (cars stop for any vehicle, ambulances only for ambulances)
+#   - moving from the last position (5) it takes one of the turn options of its road, or a new start road if there are none (Environment.change_road)
+#   - a vehicle with a destination takes the next hop of its route instead (routing.py), and a new start road and destination when it gets there
+#   - a car that reaches position 4 on a road that ends at an intersection "asks the central": green light/free priority road -> one more position
+#   - two cars (or two ambulances) never share a cell: a vehicle enters its next road only if position 1 is free of its type at the end of the tick,
+#     and a car only goes on to the last position if no car is there - the per-agent version checks neither, its vehicles seldom move at the same time
+# Every vehicle decides on the state at the start of the tick (parallel update), the per-agent version decides one vehicle at a time.
+
+CAR = 0
+AMBULANCE = 1
+
+# Status of the vehicle after the last tick
+MOVED = 0
+WAITING = 1 # There is a vehicle ahead
+STOPPED = 2 # Light not green at position 4
+GIVING_PRIORITY = 3 # Priority sign at position 4 with vehicles on the roads it gives priority to
+
+LAST_POSITION = 5
+CELLS_PER_ROAD = LAST_POSITION + 1
+
+COLOR_CODES = {"green": 0, "yellow": 1, "red": 2}
+GREEN = COLOR_CODES["green"]
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class VehicleFleet:
+    def __init__(self, network, seed=None):
+        self.network = network # RoadNetwork with the CSR tables
+        self.rng = np.random.default_rng(seed)
+        self.n_roads = len(network.road_names)
+
+        # Road tables (see network.py)
+        self.next_offsets = np.array(network.next_offsets, dtype=np.int64)
+        self.next_roads = np.array(network.next_roads, dtype=np.int64)
+        self.out_degree = np.diff(self.next_offsets)
+        self.start_roads = np.array(network.start_roads, dtype=np.int64)
+        self.road_light = np.array(network.road_traffic_light, dtype=np.int64)
+        self.ends_at_intersection = np.array(network.road_intersection, dtype=np.int64) >= 0
+
+        # Pairs (road with priority sign, road it gives priority to)
+        priority_offsets = np.array(network.priority_offsets, dtype=np.int64)
+        self.priority_source = np.repeat(np.arange(self.n_roads), np.diff(priority_offsets))
+        self.priority_target = np.array(network.priority_roads, dtype=np.int64)
+
+        # Color of every traffic light, by index
+        self.light_colors = np.array([COLOR_CODES[color] for color in network.initial_colors], dtype=np.int8)
+
+        # Vehicle state, by vehicle index
+        self.road = np.empty(0, dtype=np.int64)
+        self.position = np.empty(0, dtype=np.int64)
+        self.kind = np.empty(0, dtype=np.int8)
+        self.status = np.empty(0, dtype=np.int8)
+        self.destination = np.empty(0, dtype=np.int64) # Road index, -1 = random turns
+
+        # Next-hop tables and the destinations of the new trips - created by the first set_destinations
+        # The tables of those destinations are copied into one matrix (destination, road) -> next hop, so the hops of a tick are one indexing
+        self.routing = None
+        self.destination_roads = np.empty(0, dtype=np.int64) # Sorted
+        self.hop_matrix = np.empty((0, self.n_roads), dtype=np.int32)
+        self.hop_generation = -1
+
+    def __len__(self):
+        return len(self.road)
+
+    # Adds vehicles of one type at position 0 of the given roads (indexes), returns their vehicle indexes
+    def add_vehicles(self, roads, kind=CAR):
+        roads = np.asarray(roads, dtype=np.int64)
+        first = len(self.road)
+        self.road = np.concatenate([self.road, roads])
+        self.position = np.concatenate([self.position, np.zeros(len(roads), dtype=np.int64)])
+        self.kind = np.concatenate([self.kind, np.full(len(roads), kind, dtype=np.int8)])
+        self.status = np.concatenate([self.status, np.full(len(roads), MOVED, dtype=np.int8)])
+        self.destination = np.concatenate([self.destination, np.full(len(roads), -1, dtype=np.int64)])
+        return np.arange(first, len(self.road))
+
+    # Gives the vehicles (indexes) a destination (road indexes) - the destinations given so far are also the ones of their next trips
+    def set_destinations(self, indexes, destinations):
+        if self.routing is None:
+            self.routing = RoutingTable(self.network)
+        destinations = np.broadcast_to(np.asarray(destinations, dtype=np.int64), np.shape(indexes))
+        self.destination[indexes] = destinations
+        self.destination_roads = np.union1d(self.destination_roads, destinations)
+
+    # Adds n vehicles on random start roads
+    def spawn(self, n, kind=CAR):
+        return self.add_vehicles(self.start_roads[self.rng.integers(len(self.start_roads), size=n)], kind)
+
+    # Copies the cars/ambulances of an Environment (roads, positions and destinations) into the fleet
+    @classmethod
+    def from_environment(cls, environment, seed=None):
+        fleet = cls(environment.network, seed)
+        for vehicles, kind in ((environment.cars, CAR), (environment.ambulances, AMBULANCE)):
+            indexes = fleet.add_vehicles([vehicle.road.index for vehicle in vehicles.values()], kind)
+            fleet.position[indexes] = [vehicle.position for vehicle in vehicles.values()]
+            routed = [(index, vehicle.destination.index) for index, vehicle in zip(indexes, vehicles.values()) if getattr(vehicle, "destination", None) is not None]
+            if routed:
+                fleet.set_destinations(*zip(*routed))
+        fleet.sync_traffic_lights(environment.traffic_lights)
+        return fleet
+
+    # Updates the light colors, ex: from Environment.traffic_lights
+    def sync_traffic_lights(self, traffic_lights):
+        for traffic_light_name, color_name in traffic_lights.items():
+            self.light_colors[self.network.traffic_light_index[traffic_light_name]] = COLOR_CODES[color_name]
+
+    # Next hop of every (road, destination), UNREACHABLE where there is no route - the matrix is copied again after a closure/reweight of the roads
+    def next_hops(self, roads, destinations):
+        if self.hop_generation != self.routing.generation or len(self.hop_matrix) != len(self.destination_roads):
+            self.hop_matrix = np.stack([np.frombuffer(self.routing.table(destination), dtype="i") for destination in self.destination_roads.tolist()])
+            self.hop_generation = self.routing.generation
+        return self.hop_matrix[np.searchsorted(self.destination_roads, destinations), roads]
+
+    # Number of vehicles per cell (road * CELLS_PER_ROAD + position)
+    def cell_occupancy(self, mask=None):
+        cells = self.road * CELLS_PER_ROAD + self.position
+        if mask is not None:
+            cells = cells[mask]
+        return np.bincount(cells, minlength=self.n_roads * CELLS_PER_ROAD)
+
+    def step(self):
+        is_car = self.kind == CAR
+        at_end = self.position == LAST_POSITION
+
+        # Leader detection: the cell ahead (at the last position it is the entry of the next road, checked once the turns are known)
+        ahead = np.where(at_end, 0, self.road * CELLS_PER_ROAD + self.position + 1)
+        vehicles_in = self.cell_occupancy()
+        ambulances_in = self.cell_occupancy(~is_car)
+        occupied_any = vehicles_in[ahead] > 0
+        occupied_ambulance = ambulances_in[ahead] > 0
+        blocked = ~at_end & np.where(is_car, occupied_any, occupied_ambulance)
+        moving = ~blocked
+
+        # Turn sampling for the vehicles that leave their road (replaces the random.choice of change_road)
+        turning = np.flatnonzero(moving & at_end)
+        if len(turning):
+            roads = self.road[turning]
+            degree = self.out_degree[roads]
+            choice = (self.rng.random(len(turning)) * degree).astype(np.int64)
+            has_next = degree > 0
+            next_road = self.next_roads[np.where(has_next, self.next_offsets[roads] + choice, 0)] if len(self.next_roads) else np.zeros(len(turning), dtype=np.int64)
+            new_start = self.start_roads[self.rng.integers(len(self.start_roads), size=len(turning))]
+
+            # Vehicles with a destination: the next hop of the route (the random turn if there is none), a new trip at the end of the destination
+            destinations = self.destination[turning]
+            routed = np.flatnonzero(destinations >= 0)
+            arrived = np.zeros(len(turning), dtype=bool)
+            if len(routed):
+                hops = self.next_hops(roads[routed], destinations[routed])
+                next_road[routed] = np.where(hops != UNREACHABLE, hops, next_road[routed])
+                arrived[routed[roads[routed] == destinations[routed]]] = True
+                has_next[arrived] = False
+            new_road = np.where(has_next, next_road, new_start)
+
+            # A vehicle enters its new road at position 1 only if no vehicle of its type ends the tick there (the ones already on the road go first,
+            # then the lowest index) - otherwise it waits at the end of its road, so that two cars/two ambulances never share a cell
+            # At the end of the tick the entry cell has the vehicles that were there and are blocked, and the ones of position 0 that move
+            # (the vehicles of a type in one cell move together, so the counts of the start of the tick are enough)
+            entry = new_road * CELLS_PER_ROAD + 1
+            before, at, after = vehicles_in[entry - 1], vehicles_in[entry], vehicles_in[entry + 1]
+            ambulances_before, ambulances_at, ambulances_after = ambulances_in[entry - 1], ambulances_in[entry], ambulances_in[entry + 1]
+            cars_at_entry = (at - ambulances_at) * (after > 0) + (before - ambulances_before) * (at == 0)
+            ambulances_at_entry = ambulances_at * (ambulances_after > 0) + ambulances_before * (ambulances_at == 0)
+            kinds = self.kind[turning]
+            free = np.where(kinds == CAR, cars_at_entry, ambulances_at_entry) == 0
+
+            _, first = np.unique(kinds.astype(np.int64) * len(vehicles_in) + entry, return_index=True)
+            admitted = np.zeros(len(turning), dtype=bool)
+            admitted[first] = free[first]
+
+            moving[turning[~admitted]] = False
+            turning, new_road, arrived = turning[admitted], new_road[admitted], arrived[admitted]
+            if arrived.any():
+                self.destination[turning[arrived]] = self.destination_roads[self.rng.integers(len(self.destination_roads), size=int(arrived.sum()))]
+            self.road[turning] = new_road
+            self.position[turning] = 0
+
+        self.position[moving] += 1
+        self.status = np.where(moving, MOVED, WAITING).astype(np.int8)
+
+        # Cars at position 4 before an intersection: light check / priority check, like the "may i go?" answered by the central
+        asking = np.flatnonzero(is_car & (self.position == 4) & self.ends_at_intersection[self.road])
+        if len(asking):
+            roads = self.road[asking]
+            lights = self.road_light[roads]
+            lit = lights >= 0
+            green = lit & (self.light_colors[np.where(lit, lights, 0)] == GREEN)
+
+            must_give_priority = np.zeros(self.n_roads, dtype=bool)
+            if len(self.priority_source):
+                occupied_last = np.bincount(self.road[self.position == LAST_POSITION], minlength=self.n_roads) > 0
+                must_give_priority = np.bincount(self.priority_source, weights=occupied_last[self.priority_target], minlength=self.n_roads) > 0
+
+            allowed = np.where(lit, green, ~must_give_priority[roads])
+            self.status[asking[~allowed & lit]] = STOPPED
+            self.status[asking[~allowed & ~lit]] = GIVING_PRIORITY
+
+            # The last position must be free of cars, ex: the car ahead waits to enter its next road
+            car_at_end = np.zeros(self.n_roads, dtype=bool)
+            car_at_end[self.road[is_car & (self.position == LAST_POSITION)]] = True
+            free = ~car_at_end[roads]
+            self.position[asking[allowed & free]] = LAST_POSITION
+            self.status[asking[allowed & ~free]] = WAITING
+
+        return moving
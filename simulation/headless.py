@@ -0,0 +1,584 @@
+import heapq
+from collections import deque
+import coordination
+import events
+import protocol
+import scenario as scenarios
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Headless engine: runs the same Environment and decision logic (coordination.py) as the SPADE agents, but without XMPP and on a virtual clock.
+# Every behaviour is a generator that mirrors the run() of the corresponding agent behaviour:
+#   - "yield 3" is the equivalent of "await asyncio.sleep(3)", but it only advances the virtual clock
+#   - "msg = yield Receive(1)" is the equivalent of "msg = await self.receive(timeout=1)"
+# The agents send their requests to the central and wait for its answer as the agents do, the central answers them on its cycle (see HeadlessCentral).
+
+# JID of the central of the headless engine
+CENTRAL_JID = "central@headless"
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class Receive:
+    def __init__(self, timeout):
+        self.timeout = timeout # Maximum (virtual) time to wait for a message, in seconds
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Waiting times as a histogram of 1 s buckets (the last one takes everything longer) - the memory does not grow with the length of the run
+class WaitStats:
+    def __init__(self, max_wait=600):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (max_wait + 1)
+
+    def add(self, wait):
+        self.count += 1
+        self.total += wait
+        self.buckets[min(int(wait), len(self.buckets) - 1)] += 1
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    # Upper bound of the bucket of the percentile, ex: percentile(0.95) = 12 means 95% of the waits were shorter than 12 s
+    def percentile(self, fraction):
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return bucket + 1
+        return len(self.buckets)
+
+
+# KPIs of a headless run:
+#   - light_wait/priority_wait: time a car spends at position 4 of a road that ends at an intersection before crossing it (position 5)
+#   - ambulance_clearance: time from an ambulance reaching position 4 to entering its next road
+#   - pedestrian_wait: time from a person approaching a zebra crossing to crossing it
+#   - served: cars and ambulances that crossed an intersection
+#   - stops: "stop" answers to the cars waiting at a traffic light
+class Kpis:
+    def __init__(self):
+        self.light_wait = WaitStats()
+        self.priority_wait = WaitStats()
+        self.ambulance_clearance = WaitStats()
+        self.pedestrian_wait = WaitStats()
+        self.served = 0
+        self.stops = 0 # "stop" answers to the cars at a red/yellow light
+
+    def car_crossed(self, road, wait):
+        self.served += 1
+        if road.traffic_light != "No traffic light":
+            self.light_wait.add(wait)
+        else:
+            self.priority_wait.add(wait)
+
+    def ambulance_cleared(self, clearance):
+        self.served += 1
+        self.ambulance_clearance.add(clearance)
+
+    # Summary of the run, ex: {"light_wait_mean": 4.2, "light_wait_p95": 9, ..., "vehicles_per_minute": 31.0}
+    def summary(self, duration):
+        summary = {}
+        for name in ("light_wait", "priority_wait", "ambulance_clearance", "pedestrian_wait"):
+            stats = getattr(self, name)
+            summary[f"{name}_mean"] = stats.mean()
+            summary[f"{name}_p95"] = stats.percentile(0.95)
+        summary["vehicles_per_minute"] = self.served / (duration / 60) if duration else None
+        summary["stops_per_minute"] = self.stops / (duration / 60) if duration else None
+        return summary
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class HeadlessSimulation:
+    def __init__(self, environment, signal_control="fixed", signal_plan=None):
+        self.environment = environment # Reference to the simulation environment
+        self.signal_control = signal_control # "fixed" cycle or "actuated" by the queues (see coordination.ActuatedController)
+        self.signal_plan = signal_plan or coordination.SignalPlan() # Durations/offsets/override colors of the fixed cycle
+        self.now = 0.0 # Virtual clock, in seconds
+        self.events = [] # Heap with the scheduled events: (time, sequence, jid, value, token)
+        self.sequence = 0 # Tie-breaker so that events at the same time run by scheduling order - makes the runs deterministic
+        self.processes = {} # Behaviour (generator) of every agent, ex: jid: car_behaviour(...)
+        self.inboxes = {} # Messages not yet received by every agent, ex: jid: deque(["emergency"])
+        self.waiting = {} # Agents blocked on a Receive, ex: jid: token of its timeout event
+        self.traffic_light_jids = {} # Traffic light id -> JID, ex: "Traffic_Light_1": "traffic_light1@localhost"
+        self.vehicle_ticks = 0 # Number of cycles run by the car/ambulance behaviours
+        self.kpis = Kpis()
+        self.light_changed_at = {} # Virtual time of the last color change of every traffic light, ex: "Traffic_Light_1": 42.0
+        environment.subscribe_traffic_lights(self.traffic_light_changed)
+        self.central = HeadlessCentral(self)
+        self.spawn(CENTRAL_JID, central_behaviour(self, self.central))
+        events.log.set_clock(lambda: self.now) # The events get the virtual time
+
+    # Functions to add the agents to the simulation
+    def add_car_agent(self, car, delay=0):
+        self.environment.add_car_agent(car)
+        self.spawn(car.jid, car_behaviour(self, car), delay)
+
+    def add_ambulance_agent(self, ambulance, delay=0):
+        self.environment.add_ambulance_agent(ambulance)
+        self.spawn(ambulance.jid, ambulance_behaviour(self, ambulance), delay)
+
+    def add_person_agent(self, person, delay=0):
+        self.environment.add_person_agent(person)
+        self.spawn(person.jid, person_behaviour(self, person), delay)
+
+    # elapsed: seconds of the current color already passed (restored snapshots), or minus the offset of the plan
+    def add_traffic_light_agent(self, traffic_light, elapsed=0):
+        self.traffic_light_jids[traffic_light.traffic_light_name] = traffic_light.jid
+        behaviour = actuated_traffic_light_behaviour if self.signal_control == "actuated" else traffic_light_behaviour
+        self.spawn(traffic_light.jid, behaviour(self, traffic_light, elapsed))
+
+    def traffic_light_changed(self, traffic_light_name, color_name, version):
+        self.light_changed_at[traffic_light_name] = self.now
+
+    # The behaviour starts after "delay" (virtual) seconds
+    def spawn(self, jid, process, delay=0):
+        self.processes[jid] = process
+        self.inboxes[jid] = deque()
+        self.schedule(delay, jid, None)
+
+    def schedule(self, delay, jid, value, token=None):
+        self.sequence += 1
+        heapq.heappush(self.events, (self.now + delay, self.sequence, jid, value, token))
+
+    # Delivers a message to an agent, waking it up if it is blocked on a Receive
+    def send(self, to, body):
+        events.agent.debug("message", to=to, request=body)
+        if to in self.waiting:
+            del self.waiting[to]
+            self.schedule(0, to, body)
+        else:
+            self.inboxes[to].append(body)
+
+    # Takes the first message "body" out of the inbox of the agent, ex: an emergency received while it waited for an answer - False if there is none
+    def take_message(self, jid, body):
+        try:
+            self.inboxes[jid].remove(body)
+        except ValueError:
+            return False
+        return True
+
+    # Resumes the behaviour of an agent until its next sleep/receive
+    def resume(self, jid, value):
+        command = self.processes[jid].send(value)
+
+        if isinstance(command, Receive):
+            if self.inboxes[jid]:
+                self.schedule(0, jid, self.inboxes[jid].popleft())
+            else:
+                # The token identifies this wait, so that the timeout is ignored if a message arrives first
+                self.sequence += 1
+                token = self.sequence
+                self.waiting[jid] = token
+                self.schedule(command.timeout, jid, None, token)
+        else:
+            self.schedule(command, jid, None)
+
+    # Runs the simulation until the virtual clock reaches "until" seconds
+    def run(self, until):
+        while self.events and self.events[0][0] <= until:
+            time, _, jid, value, token = heapq.heappop(self.events)
+
+            # Timeout of a Receive that was already answered by a message
+            if token is not None:
+                if self.waiting.get(jid) != token:
+                    continue
+                del self.waiting[jid]
+
+            self.now = time
+            self.resume(jid, value)
+
+        self.now = until
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Central coordinator of the headless engine - same cycle as the CentralBehaviour (see coordination.CENTRAL_SLEEP): it sleeps, receives the requests
+# until the mailbox is idle, then handles them the most urgent class first, with the same decisions and from the same traffic light cache:
+#   - the emergencies are coalesced by road and alerted before the first request of another class (EmergencyBatch)
+#   - a person waits if an emergency of the cycle is at its intersection
+#   - the may i go?/color requests are answered at the end of the cycle, once per traffic light/priority road
+# Messages: requests "kind|jid" (kind from protocol.py, jid of the sender, or the traffic light for CHANGED_TO_GREEN/CHANGED_TO_RED), answers "answer:value"
+class HeadlessCentral:
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self.environment = simulation.environment
+        self.traffic_light_cache = coordination.TrafficLightCache()
+        self.environment.subscribe_traffic_lights(self.traffic_light_cache.update)
+        self.message_queue = coordination.PriorityScheduler(len(protocol.PRIORITY_CLASS_NAMES))
+        self.emergency_batch = coordination.EmergencyBatch()
+        self.state_requests = {} # Requests answered at the end of the cycle, ex: ("traffic_light", "Traffic_Light_1"): [(MAY_I_GO, "car1@localhost")]
+        self.decisions = 0 # Number of answers sent to vehicles and people
+        self.handlers = {protocol.MAY_I_GO: self.may_i_go,
+                         protocol.COLOR: self.color,
+                         protocol.EMERGENCY: self.emergency,
+                         protocol.CHANGE_TO_RED: self.change_to_red,
+                         protocol.CHANGED_TO_GREEN: self.traffic_light_changed,
+                         protocol.CHANGED_TO_RED: self.traffic_light_changed}
+
+    def answer(self, jid, value):
+        self.simulation.send(jid, f"answer:{value}")
+        self.decisions += 1
+
+    # "may i go?" from a car - answered at the end of the cycle
+    def may_i_go(self, kind, jid):
+        car = self.environment.cars[jid]
+        if car.road.traffic_light != "No traffic light":
+            self.state_requests.setdefault(("traffic_light", car.road.traffic_light), []).append((kind, jid))
+        else:
+            self.state_requests.setdefault(("priority", car.road), []).append((kind, jid))
+
+    # "color" from an ambulance - answered at the end of the cycle
+    def color(self, kind, jid):
+        ambulance = self.environment.ambulances[jid]
+        self.state_requests.setdefault(("traffic_light", ambulance.road.traffic_light), []).append((kind, jid))
+
+    # "emergency" from an ambulance - alerted once per road
+    def emergency(self, kind, jid):
+        self.emergency_batch.add(self.environment.ambulances[jid])
+
+    # "changed to green"/"changed to red" from a traffic light
+    def traffic_light_changed(self, kind, traffic_light_name):
+        event = "emergency" if kind == protocol.CHANGED_TO_GREEN else "person"
+        for other_traffic_light, new_color in self.simulation.signal_plan.new_colors(traffic_light_name, event, self.environment.phases).items():
+            self.simulation.send(self.simulation.traffic_light_jids[other_traffic_light], f"{new_color}:{event}")
+
+    # "change to red" from a person - the person waits for an ambulance of the cycle at the intersection
+    def change_to_red(self, kind, jid):
+        person = self.environment.people[jid]
+        traffic_light_name = person.road.traffic_light
+        color_name = self.traffic_light_cache.get(traffic_light_name)
+        if color_name not in coordination.colors:
+            return
+
+        intersection_traffic_lights = self.environment.intersection_traffic_lights.get(self.environment.traffic_light_intersection.get(traffic_light_name), [traffic_light_name])
+        command, change_to_red = coordination.command_for_person(color_name, self.emergency_batch.pending_on_traffic_light(intersection_traffic_lights))
+
+        if change_to_red:
+            self.simulation.send(self.simulation.traffic_light_jids[traffic_light_name], "person")
+            events.central.info("change_to_red", traffic_light=traffic_light_name)
+
+        self.answer(jid, command)
+
+    def alert_emergencies(self):
+        for road, ambulance_ids in self.emergency_batch.take().items():
+            ambulance_id = ", ".join(ambulance_ids)
+            if road.traffic_light != "No traffic light":
+                self.simulation.send(self.simulation.traffic_light_jids[road.traffic_light], "emergency")
+                events.central.info("emergency_traffic_light", ambulance=ambulance_id, traffic_light=road.traffic_light, road=road.name)
+            else:
+                events.central.info("emergency", ambulance=ambulance_id, road=road.name)
+
+            for car_jid in list(self.environment.vehicles_on_road(road, "car")):
+                self.simulation.send(car_jid, "emergency")
+
+    def answer_state_requests(self):
+        state_requests, self.state_requests = self.state_requests, {}
+
+        for (state, key), requests in state_requests.items():
+            if state == "traffic_light":
+                color_name = self.traffic_light_cache.get(key)
+                command = coordination.command_for_light(color_name)
+                for kind, jid in requests:
+                    if kind == protocol.MAY_I_GO:
+                        self.answer(jid, command)
+                    elif color_name in coordination.colors:
+                        self.answer(jid, color_name)
+            else:
+                command = coordination.command_for_priority_road(self.environment, key)
+                for kind, jid in requests:
+                    self.answer(jid, command)
+
+    # Handles the requests received in the cycle
+    def handle(self):
+        while self.message_queue:
+            priority_class, (kind, jid) = self.message_queue.get()
+            if priority_class != protocol.EMERGENCY_CLASS and self.emergency_batch.roads:
+                self.alert_emergencies()
+            self.handlers[kind](kind, jid)
+
+        self.alert_emergencies()
+        self.answer_state_requests()
+        self.emergency_batch.end_cycle()
+
+
+def central_behaviour(simulation, central):
+    while True:
+        yield coordination.CENTRAL_SLEEP
+
+        msg = yield Receive(coordination.RECEIVE_TIMEOUT)
+        window_end = simulation.now + coordination.RECEIVE_WINDOW
+        while msg is not None:
+            kind, jid = msg.split("|")
+            kind = int(kind)
+            central.message_queue.put(protocol.PRIORITY_CLASSES.get(kind, protocol.PEDESTRIAN_CLASS), (kind, jid))
+            if simulation.now > window_end:
+                break
+            msg = yield Receive(coordination.RECEIVE_TIMEOUT)
+
+        central.handle()
+
+
+# Sends a request to the central and waits for its answer, like RequestBehaviour.request: the other messages received meanwhile go back to the inbox,
+# the next Receive gets them first - returns the value of the answer, None without an answer within REQUEST_TIMEOUT (used with "yield from")
+def request(simulation, jid, kind):
+    simulation.send(CENTRAL_JID, f"{kind}|{jid}")
+    deadline = simulation.now + coordination.REQUEST_TIMEOUT
+    deferred = []
+    answer = None
+
+    while True:
+        msg = yield Receive(deadline - simulation.now)
+        if msg is None:
+            break
+        if msg.startswith("answer:"):
+            answer = msg[len("answer:"):]
+            break
+        deferred.append(msg)
+
+    simulation.inboxes[jid].extendleft(reversed(deferred))
+    return answer
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Headless agents - they only keep the state the environment needs
+
+class HeadlessTrafficLightAgent:
+    def __init__(self, jid, traffic_light_name):
+        self.jid = jid
+        self.traffic_light_name = traffic_light_name # Traffic Light id, ex: "Traffic_Light_1"
+
+class HeadlessCarAgent:
+    def __init__(self, jid, car_id, road, destination=None):
+        self.jid = jid
+        self.car_id = car_id # Unique identifier for the car, ex: car_1
+        self.road = road
+        self.position = 0 # Default position
+        self.origin = road # Start road of the current trip
+        self.destination = destination # None = random turns
+
+class HeadlessAmbulanceAgent:
+    def __init__(self, jid, ambulance_id, road, destination=None):
+        self.jid = jid
+        self.ambulance_id = ambulance_id # Unique identifier, ex: ambulance_1
+        self.road = road
+        self.position = 0 # Default position
+        self.origin = road # Start road of the current trip
+        self.destination = destination # None = random turns
+
+class HeadlessPersonAgent:
+    def __init__(self, jid, person_id, road):
+        self.jid = jid
+        self.person_id = person_id # Unique identifier, ex: person_1
+        self.road = road # The road where the zebra crossing the person is interested is at
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Behaviours - same steps and (virtual) sleeps as the run() of the SPADE behaviours
+
+# elapsed < 0 (the offset of the plan): the first color lasts that much longer
+def traffic_light_behaviour(simulation, traffic_light, elapsed=0):
+    environment = simulation.environment
+    name = traffic_light.traffic_light_name
+    durations = simulation.signal_plan.durations
+
+    while True:
+        current_color_name = environment.get_traffic_light(name)
+
+        msg = yield Receive(max(1 - elapsed, 0))
+
+        if msg == "emergency":
+            simulation.send(CENTRAL_JID, f"{protocol.CHANGED_TO_GREEN}|{name}")
+            yield 2
+            environment.update_traffic_light(name, "green", "emergency")
+
+        elif msg == "person":
+            simulation.send(CENTRAL_JID, f"{protocol.CHANGED_TO_RED}|{name}")
+            yield 2
+            environment.update_traffic_light(name, "red", "person")
+
+        # (new_color:event) message
+        elif msg is not None:
+            new_color_name, event_type = msg.split(":")
+            environment.update_traffic_light(name, new_color_name, event_type)
+
+        # The rest of the duration of the color (the receive took the first second)
+        yield max(durations[current_color_name] - 1 - max(elapsed - 1, 0), 0)
+        elapsed = 0
+        environment.update_traffic_light(name, coordination.next_color(current_color_name), None)
+
+
+# Same messages as the fixed cycle, but the color changes when the ActuatedController decides it (checked every second)
+# The phase timer is the time since the last change of the color (light_changed_at), so it also restarts after an override
+def actuated_traffic_light_behaviour(simulation, traffic_light, elapsed=0):
+    environment = simulation.environment
+    name = traffic_light.traffic_light_name
+    controller = coordination.ActuatedController(environment, name)
+
+    while True:
+        msg = yield Receive(1)
+
+        if msg == "emergency":
+            simulation.send(CENTRAL_JID, f"{protocol.CHANGED_TO_GREEN}|{name}")
+            yield 2
+            environment.update_traffic_light(name, "green", "emergency")
+
+        elif msg == "person":
+            simulation.send(CENTRAL_JID, f"{protocol.CHANGED_TO_RED}|{name}")
+            yield 2
+            environment.update_traffic_light(name, "red", "person")
+
+        # (new_color:event) message
+        elif msg is not None:
+            new_color_name, event_type = msg.split(":")
+            environment.update_traffic_light(name, new_color_name, event_type)
+
+        current_color_name = environment.get_traffic_light(name)
+        new_color_name = controller.decide(current_color_name, simulation.now - simulation.light_changed_at[name])
+        if new_color_name != current_color_name:
+            environment.update_traffic_light(name, new_color_name, None)
+
+
+def car_behaviour(simulation, car):
+    environment = simulation.environment
+    waiting_since = None # Time the car reached position 4 before an intersection (KPIs)
+
+    while True:
+        simulation.vehicle_ticks += 1
+
+        if not environment.is_vehicle_ahead(car.jid, "car"):
+            yield 3
+            environment.move_vehicle(car.jid, car.car_id, "car")
+            events.vehicle.info("moving", vehicle=car.car_id, position=car.position, road=car.road.name)
+
+            if waiting_since is not None and car.position == 5:
+                simulation.kpis.car_crossed(car.road, simulation.now - waiting_since)
+                waiting_since = None
+        else:
+            events.vehicle.info("vehicle_ahead", vehicle=car.car_id, road=car.road.name)
+
+        msg = yield Receive(1)
+        if msg == "emergency":
+            events.vehicle.info("emergency_stop", vehicle=car.car_id, road=car.road.name)
+
+        if car.position == 4:
+            if environment.ends_at_intersection(car.road):
+                if waiting_since is None:
+                    waiting_since = simulation.now
+
+                command = yield from request(simulation, car.jid, protocol.MAY_I_GO)
+
+                # An emergency on the car's road that arrived meanwhile has priority over the answer
+                if simulation.take_message(car.jid, "emergency"):
+                    events.vehicle.info("emergency_stop", vehicle=car.car_id, road=car.road.name)
+
+                elif command == "move":
+                    environment.move_vehicle(car.jid, car.car_id, "car")
+                    events.vehicle.info("moving", vehicle=car.car_id, position=car.position, road=car.road.name)
+                    simulation.kpis.car_crossed(car.road, simulation.now - waiting_since)
+                    waiting_since = None
+
+                elif command == "stop":
+                    events.vehicle.info("stopping", vehicle=car.car_id, road=car.road.name)
+                    simulation.kpis.stops += 1
+
+                elif command == "give priority":
+                    events.vehicle.info("giving_priority", vehicle=car.car_id, road=car.road.name)
+
+        yield 3
+
+
+def ambulance_behaviour(simulation, ambulance):
+    environment = simulation.environment
+    approaching_since = None # Time the ambulance reached position 4 before an intersection (KPIs)
+
+    while True:
+        simulation.vehicle_ticks += 1
+
+        if not environment.is_vehicle_ahead(ambulance.jid, "ambulance"):
+            yield 2
+            road = ambulance.road
+            environment.move_vehicle(ambulance.jid, ambulance.ambulance_id, "ambulance")
+            events.vehicle.info("moving", vehicle=ambulance.ambulance_id, position=ambulance.position, road=ambulance.road.name)
+
+            if ambulance.position == 4 and environment.ends_at_intersection(ambulance.road):
+                approaching_since = simulation.now
+            elif approaching_since is not None and ambulance.road is not road:
+                simulation.kpis.ambulance_cleared(simulation.now - approaching_since)
+                approaching_since = None
+        else:
+            events.vehicle.info("ambulance_ahead", vehicle=ambulance.ambulance_id, road=ambulance.road.name)
+
+        if ambulance.position == 4:
+            if ambulance.road.traffic_light != "No traffic light":
+
+                # Without an answer the traffic light is treated as red - the emergency is never refused
+                color_name = yield from request(simulation, ambulance.jid, protocol.COLOR)
+                if color_name in ["red", "yellow", None]:
+                    simulation.send(CENTRAL_JID, f"{protocol.EMERGENCY}|{ambulance.jid}")
+                    yield 2
+                else:
+                    events.vehicle.info("green_light", vehicle=ambulance.ambulance_id, road=ambulance.road.name)
+
+            else:
+                simulation.send(CENTRAL_JID, f"{protocol.EMERGENCY}|{ambulance.jid}")
+                yield 2
+
+        yield 2
+
+
+def person_behaviour(simulation, person):
+    environment = simulation.environment
+    waiting_since = None # Time the person reached the current zebra crossing (KPIs)
+
+    while True:
+        events.person.info("approaching", person=person.person_id, road=person.road.name)
+        if waiting_since is None:
+            waiting_since = simulation.now
+
+        # Without an answer the person waits
+        command = (yield from request(simulation, person.jid, protocol.CHANGE_TO_RED)) or "wait"
+
+        if command == "move":
+            events.person.info("crossing", person=person.person_id, road=person.road.name, command=command)
+            simulation.kpis.pedestrian_wait.add(simulation.now - waiting_since)
+            waiting_since = None
+            environment.change_zebra_crossing(person.jid)
+        else:
+            events.person.info("waiting", person=person.person_id, road=person.road.name, command=command)
+
+        yield 20
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Creates the agents of a scenario (see scenario.py) on the headless engine
+# road_network: already loaded network of the scenario (ex: loaded once by the optimizer for all of its runs)
+def build_simulation(scenario, road_network=None):
+    env = scenarios.build_environment(scenario, road_network)
+    signal_plan = coordination.load_signal_plan(scenario["signal_plan"])
+    simulation = HeadlessSimulation(env, scenario["signal_control"], signal_plan)
+
+    for spec in scenarios.plan_agents(scenario, env):
+        if spec["type"] == "traffic_light":
+            simulation.add_traffic_light_agent(HeadlessTrafficLightAgent(spec["jid"], spec["id"]), -signal_plan.offsets.get(spec["id"], 0))
+
+        elif spec["type"] == "car":
+            simulation.add_car_agent(HeadlessCarAgent(spec["jid"], spec["id"], spec["road"], spec["destination"]), spec["delay"])
+
+        elif spec["type"] == "ambulance":
+            simulation.add_ambulance_agent(HeadlessAmbulanceAgent(spec["jid"], spec["id"], spec["road"], spec["destination"]), spec["delay"])
+
+        else: # spec["type"] == "person"
+            simulation.add_person_agent(HeadlessPersonAgent(spec["jid"], spec["id"], spec["road"]), spec["delay"])
+
+    return simulation
+
+
+def run_headless(scenario=None, road_network=None):
+    if scenario is None:
+        scenario = scenarios.load_scenario()
+
+    simulation = build_simulation(scenario, road_network)
+    simulation.run(scenario["duration"])
+    return simulation
@@ -1,110 +1,140 @@
-
 import asyncio
-from environment import Environment
-from agents import CarAgent, TrafficLightAgent, CentralCordinateAgent, AmbulanceAgent, PersonAgent
-
-async def main():
-    # XMPP credentials for your agents
-    car_jid_1 = "vehicle1@localhost"
-    car_jid_2 = "vehicle2@localhost"
-    car_jid_3 = "vehicle3@localhost"
-    car_jid_4 = "vehicle4@localhost"
-
-    person_jid_1 = "person1@localhost"
-    person_jid_2 = "person2@localhost"
-
-    ambulance_jid_1 = "ambulance1@localhost"
-    ambulance_jid_2 = "ambulance2@localhost"
-
-    traffic_light_jid_1 = "traffic_light1@localhost"
-    traffic_light_jid_2 = "traffic_light2@localhost"
-    traffic_light_jid_3 = "traffic_light3@localhost"
-
-    central_jid = "central@localhost"
-
-    password = "060303"  # Change to your desired password
-    
-
-    # Instantiate the environment
-    env = Environment()  
-
-
-    # Instantiate the agents with their JID and password
-    car_agent_1 = CarAgent(car_jid_1, password, env, "car_1", env.road_1, central_jid)
-    car_agent_2 = CarAgent(car_jid_2, password, env, "car_2", env.road_2, central_jid)
-    car_agent_3 = CarAgent(car_jid_3, password, env, "car_3", env.road_3, central_jid)
-    car_agent_4 = CarAgent(car_jid_4, password, env, "car_4", env.road_4, central_jid)
-
-    ambulance_agent_1 = AmbulanceAgent(ambulance_jid_1, password, env, "ambulance_1", env.road_1, central_jid)
-    ambulance_agent_2 = AmbulanceAgent(ambulance_jid_2, password, env, "ambulance_2", env.road_4, central_jid)
-
-    traffic_light_agent_1 = TrafficLightAgent(traffic_light_jid_1, password, env, "Traffic_Light_1", central_jid)
-    traffic_light_agent_2 = TrafficLightAgent(traffic_light_jid_2, password, env, "Traffic_Light_2", central_jid)
-    traffic_light_agent_3 = TrafficLightAgent(traffic_light_jid_3, password, env, "Traffic_Light_3", central_jid)
+import argparse
+import os
+import time
+import events
+import metrics
+import scenario as scenarios
 
-    central_agent = CentralCordinateAgent(central_jid, password, env, traffic_light_jid_1, traffic_light_jid_2, traffic_light_jid_3)
+async def main(scenario, transport_backend=None):
+    # The transport backend must be chosen before the agents are imported
+    if transport_backend is not None:
+        os.environ["SIM_TRANSPORT"] = transport_backend
 
-    person_agent_1 = PersonAgent(person_jid_1, password, central_jid, env, "person_1", env.road_1)
-    person_agent_2 = PersonAgent(person_jid_2, password, central_jid, env, "person_2", env.road_4)
-
-
-
-    # Add the car_agents to the environment
-    env.add_car_agent(car_agent_1)
-    env.add_car_agent(car_agent_2) 
-    env.add_car_agent(car_agent_3) 
-    env.add_car_agent(car_agent_4) 
-
-    env.add_ambulance_agent(ambulance_agent_1)
-    env.add_ambulance_agent(ambulance_agent_2)
-    
-    env.add_person_agent(person_agent_1)
-    env.add_person_agent(person_agent_2)
+    # The agents are only needed (and imported) in the real-time mode
+    import transport
+    import protocol
 
+    # Instantiate the environment and the agents of the scenario
+    env = scenarios.build_environment(scenario)
+    agents, delays, shard_map = scenarios.build_agents(scenario, env)
+    n_agents = sum(len(group) for group in agents.values())
 
 
     # Start the agents
-    await car_agent_1.start(auto_register=True)
-    await car_agent_2.start(auto_register=True)
-    await car_agent_3.start(auto_register=True)
-    await car_agent_4.start(auto_register=True)
-
-    await ambulance_agent_1.start(auto_register=True)
-    await ambulance_agent_2.start(auto_register=True)
-
-    await traffic_light_agent_1.start(auto_register=True)
-    await traffic_light_agent_2.start(auto_register=True)
-    await traffic_light_agent_3.start(auto_register=True)
-
-    await central_agent.start(auto_register=True)
-
-    await person_agent_1.start(auto_register=True)
-    await person_agent_2.start(auto_register=True)
+    time_to_first_tick = await scenarios.start_agents(agents, delays, scenario["startup_concurrency"])
+    events.log.flush()
+    print(f"{n_agents} agents started, time to first tick: {time_to_first_tick:.3f} s (spawn schedule: {scenarios.spawn_schedule(delays):.1f} s)")
 
+    transport.stats.reset()
+    protocol.request_stats.reset()
+    metrics.registry.reset()
 
     try:
-        await asyncio.sleep(60)
+        await asyncio.sleep(scenario["duration"])
     except asyncio.CancelledError:
         pass 
 
 
     # Stop the agents
-    await car_agent_1.stop()
-    await car_agent_2.stop()
-    await car_agent_3.stop()
-    await car_agent_4.stop()
-
-    await ambulance_agent_1.stop()
-    await ambulance_agent_2.stop()
-
-    await traffic_light_agent_1.stop()
-    await traffic_light_agent_2.stop()
-    await traffic_light_agent_3.stop()
-
-    await central_agent.stop()
+    shutdown_time = await scenarios.stop_agents(agents, scenario["startup_concurrency"])
+    events.log.flush()
+    print(f"{n_agents} agents stopped in {shutdown_time:.3f} s")
+
+    print(transport.stats.report())
+    print(protocol.request_stats.report())
+    print(f"Decisions per central: {[central_agent.decisions for central_agent in agents['central']]}, hand-offs: {shard_map.handoffs}, "
+          f"light lookups saved: {sum(central_agent.lookups_saved for central_agent in agents['central'])}, "
+          f"busy: {sum(central_agent.busy_replies for central_agent in agents['central'])}, expired: {sum(central_agent.expired for central_agent in agents['central'])}")
+    metrics.close()
+
+
+# Runs the same scenario on the headless engine (virtual clock, no XMPP), from the start or from a snapshot (see snapshot.py)
+def main_headless(scenario, restore_path=None, snapshot_path=None):
+    from headless import run_headless
+    import snapshot
+
+    start = time.perf_counter()
+    if restore_path is None:
+        simulation = run_headless(scenario)
+    else:
+        simulation = snapshot.restore_headless(restore_path, scenario)
+        print(f"Restored {restore_path} at {simulation.now:.0f} s in {time.perf_counter() - start:.3f} s")
+        simulation.run(simulation.now + scenario["duration"])
+    events.log.flush()
+    print(f"Simulated {simulation.now:.0f} s in {time.perf_counter() - start:.3f} s")
+
+    if snapshot_path is not None:
+        snapshot.save_headless(simulation, snapshot_path)
+        print(f"Saved the state at {simulation.now:.0f} s to {snapshot_path}")
+
+
+# Runs the vehicles of the scenario on n_workers processes, one per region of the road network (see parallel.py)
+def main_parallel(scenario, n_workers):
+    from parallel import ParallelSimulation, TICK_SECONDS
+
+    road_network = scenarios.load_scenario_network(scenario)
+    ticks = int(scenario["duration"] // TICK_SECONDS)
+
+    start = time.perf_counter()
+    with ParallelSimulation(road_network, n_workers, scenario["seed"]) as simulation:
+        for type_vehicle, key in (("car", "cars"), ("ambulance", "ambulances")):
+            spec = scenario[key]
+            simulation.add_vehicles(spec["count"], type_vehicle, [road_network.road_index[name] for name in spec.get("roads", [])])
+        simulation.run(ticks)
+        vehicles_per_region = simulation.close()
+
+    print(f"Simulated {ticks} ticks ({ticks * TICK_SECONDS} s) on {n_workers} workers in {time.perf_counter() - start:.3f} s, "
+          f"vehicles per region: {vehicles_per_region}, hand-offs: {simulation.handoffs}")
+
+
+# argparse type of --log-level: the spec as given, once its category and level are known - argparse reports the error otherwise
+def log_level(spec):
+    try:
+        events.parse_level(spec)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error))
+    return spec
 
-    await person_agent_1.stop()
-    await person_agent_2.stop()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description="Multi-Agent Traffic Control Simulation")
+    parser.add_argument("--scenario", default=scenarios.DEFAULT_SCENARIO, help="scenario file (default: scenarios/demo.json)")
+    parser.add_argument("--headless", action="store_true", help="run on the virtual clock, without the XMPP server")
+    parser.add_argument("--parallel", type=int, default=None, metavar="N", help="run the vehicles on N worker processes, one per region of the road network")
+    parser.add_argument("--restore", default=None, metavar="SNAPSHOT", help="headless: start from a saved state and simulate --duration more seconds")
+    parser.add_argument("--save-snapshot", default=None, metavar="SNAPSHOT", help="headless: save the state at the end of the run")
+    parser.add_argument("--duration", type=float, default=None, help="simulated time, in seconds")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the route choices")
+    parser.add_argument("--shards", type=int, default=None, help="number of central coordinators, the intersections are split between them")
+    parser.add_argument("--signal-control", choices=["fixed", "actuated"], default=None, help="fixed color cycle or actuated by the queues (default: the scenario's, fixed)")
+    parser.add_argument("--signal-plan", default=None, metavar="FILE", help="durations/offsets/override colors of the fixed cycle (JSON, ex: written by optimizer.py)")
+    parser.add_argument("--queue-capacity", type=int, default=None, help="real-time: requests of the vehicles/people the central queues per cycle and class, the others are answered busy (default: 1000)")
+    parser.add_argument("--concurrency", type=int, default=None, help="maximum number of agents starting/stopping at the same time")
+    parser.add_argument("--transport", choices=["xmpp", "local"], default=None, help="message transport of the real-time mode (default: SIM_TRANSPORT or xmpp)")
+    parser.add_argument("--log-level", action="append", type=log_level, default=[], metavar="[CATEGORY=]LEVEL",
+                        help=f"level of the events (debug, info, warning, off) of one category ({', '.join(events.CATEGORIES)}) or of all, ex: --log-level vehicle=off")
+    parser.add_argument("--log-file", default=None, help="also write the events to this file, as JSON lines (written by a background thread)")
+    parser.add_argument("--trace", default=None, metavar="DIRECTORY", help="record every event (movements, light changes, decisions, messages) in a columnar trace, see traces.py")
+    parser.add_argument("--metrics", default=None, metavar="FILE", help="real-time: collect metrics (latencies, queue depth, counters) and write them to this JSON file periodically")
+    parser.add_argument("--metrics-interval", type=float, default=10, help="seconds between two writes of the metrics file")
+    parser.add_argument("--metrics-port", type=int, default=None, help="real-time: collect metrics and serve them in the Prometheus text format at http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--quiet", action="store_true", help="no event output on the console")
+    args = parser.parse_args()
+
+    # The headless engine writes the console in batches - there is no one waiting for the lines in real time
+    # The real-time mode writes it on a thread, so that the agents' event loop never waits for stdout
+    events.configure(args.log_level, args.log_file, console_output=not args.quiet, console_buffer_size=4096, console_background=not (args.headless or args.parallel),
+                     trace_path=args.trace)
+    metrics.configure(args.metrics, args.metrics_interval, args.metrics_port)
+
+    scenario = scenarios.load_scenario(args.scenario, duration=args.duration, seed=args.seed, shards=args.shards, startup_concurrency=args.concurrency,
+                                      signal_control=args.signal_control, signal_plan=args.signal_plan,
+                                      queue_capacity=args.queue_capacity)
+
+    if args.parallel:
+        main_parallel(scenario, args.parallel)
+    elif args.headless:
+        main_headless(scenario, args.restore, args.save_snapshot)
+    else:
+        asyncio.run(main(scenario, args.transport))
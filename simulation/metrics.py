@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import bisect
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Metrics of the real-time mode, to see where the time goes:
+#   - histograms: durations in exponential buckets (0.1 ms to ~100 s), ex: one run() of every behaviour, the answer to every kind of request
+#   - gauges: last and maximum value, ex: depth of the message queue of the central
+#   - counters, ex: messages received by role of the sender
+# Every metric has one label, ex: observe("request_seconds", "may i go?", 0.012)
+# Disabled by default: start/elapsed/observe/gauge/increment are bound to no-op functions, so the instrumented code costs one empty call per point.
+# Export (see configure): a JSON snapshot file rewritten every "interval" seconds and/or a Prometheus text endpoint at http://127.0.0.1:<port>/metrics
+# Usage: started = metrics.start() ... metrics.elapsed("behaviour_seconds", "car", started)
+
+# Name -> (type, label name, help)
+DEFINITIONS = {"behaviour_seconds": ("histogram", "behaviour", "Duration of one run() of the behaviours, sleeps included"),
+               "request_seconds": ("histogram", "kind", "Time from a request to its answer"),
+               "central_handler_seconds": ("histogram", "kind", "Time the central takes to handle a message, by kind"),
+               "traffic_light_handler_seconds": ("histogram", "kind", "Time a traffic light takes to handle a message (answer/color change), by kind"),
+               "central_wait_seconds": ("histogram", "class", "Time a message waits in the queue of the central before it is handled, by priority class"),
+               "lock_hold_seconds": ("histogram", "central", "Time the central holds its lock to process the queue"),
+               "central_queue_depth": ("gauge", "central", "Messages queued by the central in its last cycle"),
+               "messages_received": ("counter", "role", "Messages received, by role of the sender"),
+               "central_busy_replies": ("counter", "class", "Requests the central refused with a busy/retry-after answer because their queue was full, by priority class"),
+               "central_expired": ("counter", "class", "Requests the central dropped because they waited in its queue past their deadline, by priority class"),
+               "request_timeouts": ("counter", "kind", "Requests without an answer before the deadline")}
+
+# Upper bounds of the histogram buckets, in seconds (the last bucket takes everything longer)
+BUCKETS = [0.0001 * 2 ** exponent for exponent in range(21)]
+
+PREFIX = "traffic_sim_"
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+
+    # Upper bound of the bucket of the percentile, ex: 0.0128 - None if there is no value
+    def percentile(self, fraction):
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + [float("inf")], self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return None
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.total, "p50": self.percentile(0.5), "p99": self.percentile(0.99), "buckets": self.counts}
+
+
+class Gauge:
+    def __init__(self):
+        self.value = 0
+        self.max = 0
+
+    def set(self, value):
+        self.value = value
+        if value > self.max:
+            self.max = value
+
+    def to_dict(self):
+        return {"value": self.value, "max": self.max}
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {} # (name, label) -> Histogram/Gauge/count
+        self.started = time.time()
+
+    def reset(self):
+        self.metrics = {}
+        self.started = time.time()
+
+    def observe(self, name, label, value):
+        histogram = self.metrics.get((name, label))
+        if histogram is None:
+            histogram = self.metrics[name, label] = Histogram()
+        histogram.observe(value)
+
+    def elapsed(self, name, label, started):
+        self.observe(name, label, time.perf_counter() - started)
+
+    def gauge(self, name, label, value):
+        gauge = self.metrics.get((name, label))
+        if gauge is None:
+            gauge = self.metrics[name, label] = Gauge()
+        gauge.set(value)
+
+    def increment(self, name, label, amount=1):
+        self.metrics[name, label] = self.metrics.get((name, label), 0) + amount
+
+    # Copy of the metrics - the exporters run on other threads while the event loop keeps updating them
+    def items(self):
+        while True:
+            try:
+                return sorted(self.metrics.items())
+            except RuntimeError: # The dict changed size during the copy
+                continue
+
+    # ex: {"uptime": 12.5, "metrics": {"request_seconds": {"may i go?": {"count": 3, ...}}, "messages_received": {"car": 40}}}
+    def snapshot(self):
+        metrics = {}
+        for (name, label), metric in self.items():
+            metrics.setdefault(name, {})[label] = metric if isinstance(metric, int) else metric.to_dict()
+        return {"time": time.time(), "uptime": time.time() - self.started, "metrics": metrics}
+
+    def prometheus(self):
+        lines = []
+        seen = set()
+        for (name, label), metric in self.items():
+            metric_type, label_name, help_text = DEFINITIONS.get(name, ("untyped", "label", name))
+            full_name = PREFIX + name
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {full_name} {help_text}")
+                lines.append(f"# TYPE {full_name} {metric_type}")
+
+            labels = f'{label_name}="{escape(label)}"'
+            if metric_type == "histogram":
+                cumulative = 0
+                for bound, count in zip(BUCKETS, metric.counts):
+                    cumulative += count
+                    lines.append(f'{full_name}_bucket{{{labels},le="{bound!r}"}} {cumulative}')
+                lines.append(f'{full_name}_bucket{{{labels},le="+Inf"}} {metric.count}')
+                lines.append(f"{full_name}_sum{{{labels}}} {metric.total}")
+                lines.append(f"{full_name}_count{{{labels}}} {metric.count}")
+            elif metric_type == "gauge":
+                lines.append(f"{full_name}{{{labels}}} {metric.value}")
+            else:
+                lines.append(f"{full_name}{{{labels}}} {metric}")
+        return "\n".join(lines) + "\n"
+
+
+def escape(label):
+    return str(label).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Exporters - daemon threads
+
+class SnapshotWriter:
+    def __init__(self, registry, path, interval):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="metrics-snapshot", daemon=True)
+        self.thread.start()
+
+    # Written next to the file and renamed, so that a reader never sees half a snapshot
+    def write(self):
+        with open(self.path + ".tmp", "w") as file:
+            json.dump(self.registry.snapshot(), file, indent=1)
+        os.replace(self.path + ".tmp", self.path)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.write()
+
+
+class PrometheusEndpoint:
+    def __init__(self, registry, port, host="127.0.0.1"):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+registry = Registry()
+exporters = []
+
+
+def disabled_start():
+    return 0.0
+
+
+def disabled(name, label, value=1):
+    pass
+
+
+def enabled():
+    return observe is not disabled
+
+
+def enable():
+    global start, elapsed, observe, gauge, increment
+    start = time.perf_counter
+    elapsed = registry.elapsed
+    observe = registry.observe
+    gauge = registry.gauge
+    increment = registry.increment
+
+
+def disable():
+    global start, elapsed, observe, gauge, increment
+    start = disabled_start
+    elapsed = observe = gauge = increment = disabled
+
+
+disable()
+
+
+# Command line setup, ex: configure("metrics.json", interval=10, port=9108) - the metrics stay disabled without a path or a port
+def configure(path=None, interval=10, port=None):
+    close()
+    if path is None and port is None:
+        disable()
+        return
+
+    enable()
+    if path is not None:
+        exporters.append(SnapshotWriter(registry, path, interval))
+    if port is not None:
+        exporters.append(PrometheusEndpoint(registry, port))
+
+
+# Stops the exporters (the snapshot file gets the final values)
+def close():
+    while exporters:
+        exporters.pop().close()
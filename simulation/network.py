@@ -0,0 +1,161 @@
+import os
+import json
+from array import array
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Road network loaded from a description file (JSON) into integer-indexed tables:
+#   - every road, traffic light and intersection gets an index (its position in the file)
+#   - the roads a vehicle can take at the end of each road are kept as CSR adjacency: next_roads[next_offsets[i]:next_offsets[i + 1]]
+#   - per-road lookups (traffic light, intersection) are arrays with -1 meaning "none"
+
+NETWORKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "networks")
+DEFAULT_NETWORK = os.path.join(NETWORKS_DIR, "three_lights.json")
+
+NO_TRAFFIC_LIGHT = "No traffic light"
+NO_ZEBRA_CROSSING = "No Zebra Crossing"
+NO_TRAFFIC_SIGN = "No traffic sign"
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class RoadNetwork:
+    def __init__(self, data):
+        self.name = data.get("name", "network")
+
+        roads = data["roads"]
+        self.road_names = [road["id"] for road in roads] # Road index -> id, ex: 0: "road_1"
+        self.road_index = {name: index for index, name in enumerate(self.road_names)}
+        if len(self.road_index) != len(self.road_names):
+            raise ValueError(f"Network {self.name}: duplicated road ids")
+
+        self.traffic_light_names = list(data.get("traffic_lights", {})) # Traffic light index -> id
+        self.traffic_light_index = {name: index for index, name in enumerate(self.traffic_light_names)}
+        self.initial_colors = [data["traffic_lights"][name] for name in self.traffic_light_names]
+
+        self.road_zebra_crossings = [road.get("zebra_crossing", NO_ZEBRA_CROSSING) for road in roads]
+        self.road_traffic_signs = [road.get("traffic_sign", NO_TRAFFIC_SIGN) for road in roads]
+        self.road_comments = [road.get("comment", "") for road in roads]
+        self.road_traffic_light = array("i", (self.lookup_traffic_light(road["traffic_light"], f"road {road['id']}")
+                                              if road.get("traffic_light", NO_TRAFFIC_LIGHT) != NO_TRAFFIC_LIGHT else -1 for road in roads))
+
+        # CSR adjacency of the roads that can be taken at the end of each road
+        self.next_offsets = array("i", [0])
+        self.next_roads = array("i")
+        for road in roads:
+            self.next_roads.extend(self.lookup_road(name, f"road {road['id']}") for name in road.get("next", []))
+            self.next_offsets.append(len(self.next_roads))
+
+        # CSR of the roads a road with a priority sign must give priority to (vehicles at their last position)
+        self.priority_offsets = array("i", [0])
+        self.priority_roads = array("i")
+        for road in roads:
+            self.priority_roads.extend(self.lookup_road(name, f"road {road['id']}") for name in road.get("give_priority_to", []))
+            self.priority_offsets.append(len(self.priority_roads))
+
+        self.start_roads = array("i", (self.lookup_road(name, "start_roads") for name in data.get("start_roads", [])))
+        self.zebra_crossing_roads = array("i", (self.lookup_road(name, "zebra_crossing_roads") for name in data.get("zebra_crossing_roads", [])))
+
+        # Intersections: the roads that end there and the traffic lights that control them (CSR), i.e. its approaches
+        # and its phases, the traffic lights that can be green together, in cycle order (None: one phase per traffic light, see phases.py)
+        intersections = data.get("intersections", [])
+        self.intersection_names = [intersection["id"] for intersection in intersections]
+        self.road_intersection = array("i", [-1]) * len(self.road_names)
+        self.intersection_light_offsets = array("i", [0])
+        self.intersection_lights = array("i")
+        self.intersection_phases = []
+        for index, intersection in enumerate(intersections):
+            for name in intersection.get("roads", []):
+                self.road_intersection[self.lookup_road(name, f"intersection {intersection['id']}")] = index
+            self.intersection_lights.extend(self.lookup_traffic_light(name, f"intersection {intersection['id']}") for name in intersection.get("traffic_lights", []))
+            self.intersection_light_offsets.append(len(self.intersection_lights))
+            phases = intersection.get("phases")
+            self.intersection_phases.append([[self.lookup_traffic_light(name, f"intersection {intersection['id']}") for name in phase] for phase in phases]
+                                            if phases is not None else None)
+
+    # Index of a road named by another road/intersection - it must be one of the "roads" of the network
+    def lookup_road(self, name, where):
+        index = self.road_index.get(name)
+        if index is None:
+            raise ValueError(f"Network {self.name}: {where} has the road {name!r}, which is not in the roads of the network")
+        return index
+
+    # Index of a traffic light named by a road/intersection - it must be one of the "traffic_lights" of the network
+    def lookup_traffic_light(self, name, where):
+        index = self.traffic_light_index.get(name)
+        if index is None:
+            raise ValueError(f"Network {self.name}: {where} has the traffic light {name!r}, which is not in the traffic lights of the network")
+        return index
+
+    # Lookups by index
+    def next_of(self, road):
+        return self.next_roads[self.next_offsets[road]:self.next_offsets[road + 1]]
+
+    def priority_of(self, road):
+        return self.priority_roads[self.priority_offsets[road]:self.priority_offsets[road + 1]]
+
+    def lights_of(self, intersection):
+        return self.intersection_lights[self.intersection_light_offsets[intersection]:self.intersection_light_offsets[intersection + 1]]
+
+    def traffic_light_name_of(self, road):
+        if self.road_traffic_light[road] < 0:
+            return NO_TRAFFIC_LIGHT
+        return self.traffic_light_names[self.road_traffic_light[road]]
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def load_network(path=DEFAULT_NETWORK):
+    with open(path) as file:
+        return RoadNetwork(json.load(file))
+
+
+# Description (same format as the JSON files) of a rows x cols grid: one intersection per node, one road per direction between neighbour nodes
+# Every road ends at the intersection of its destination node, controlled by that node's horizontal (H) or vertical (V) traffic light
+def grid_description(rows, cols):
+    roads = []
+    traffic_lights = {}
+    node_roads_in = {}
+    node_roads_out = {}
+
+    for r in range(rows):
+        for c in range(cols):
+            traffic_lights[f"Traffic_Light_{r}_{c}_H"] = "green"
+            traffic_lights[f"Traffic_Light_{r}_{c}_V"] = "red"
+
+    for r in range(rows):
+        for c in range(cols):
+            for dr, dc, axis in ((0, 1, "H"), (0, -1, "H"), (1, 0, "V"), (-1, 0, "V")):
+                r2, c2 = r + dr, c + dc
+                if 0 <= r2 < rows and 0 <= c2 < cols:
+                    name = f"road_{r}_{c}_to_{r2}_{c2}"
+                    roads.append({"id": name,
+                                  "traffic_light": f"Traffic_Light_{r2}_{c2}_{axis}",
+                                  "zebra_crossing": f"Zebra_Crossing_{r2}_{c2}_{axis}",
+                                  "from": (r, c), "to": (r2, c2)})
+                    node_roads_out.setdefault((r, c), []).append(name)
+                    node_roads_in.setdefault((r2, c2), []).append(name)
+
+    # At the end of a road a vehicle can take any road leaving the node except going back
+    for road in roads:
+        r, c = road["from"]
+        road["next"] = [name for name in node_roads_out.get(road["to"], []) if not name.endswith(f"_to_{r}_{c}")]
+
+    intersections = [{"id": f"Intersection_{r}_{c}",
+                      "roads": node_roads_in.get((r, c), []),
+                      "traffic_lights": [f"Traffic_Light_{r}_{c}_H", f"Traffic_Light_{r}_{c}_V"],
+                      "phases": [[f"Traffic_Light_{r}_{c}_H"], [f"Traffic_Light_{r}_{c}_V"]]}
+                     for r in range(rows) for c in range(cols)]
+
+    for road in roads:
+        del road["from"]
+        del road["to"]
+
+    return {"name": f"grid_{rows}x{cols}",
+            "traffic_lights": traffic_lights,
+            "roads": roads,
+            "start_roads": [road["id"] for road in roads],
+            "zebra_crossing_roads": [road["id"] for road in roads],
+            "intersections": intersections}
+
+
+def generate_grid(rows, cols):
+    return RoadNetwork(grid_description(rows, cols))
@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+import multiprocessing
+import events
+import scenario as scenarios
+from coordination import colors, SignalPlan
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Offline signal-plan optimizer: searches the durations of the colors, the offsets between the traffic lights, their initial colors and the colors of the
+# override tables (emergency/person, see coordination.SignalPlan) that minimize a cost over short seeded runs of a scenario on the headless engine.
+#   - every plan is run with the same seeds (common random numbers), so two plans are compared on the same traffic
+#   - the runs are spread over a pool of processes, every worker loads the road network once and only sends back the mean KPIs of the plan
+#   - the mean KPIs of every plan evaluated are cached by plan (and in a JSON file with --cache), a plan is never run twice
+#   - search: the default plan and random plans, then generations of mutations (1 to 3 genes) of the best plans found so far, with a few random plans
+# Usage: python optimizer.py --plans 2000 --seeds 4 --duration 300 --output plan.json, then: python main.py --headless --signal-plan plan.json
+
+# Choices of every gene (seconds) - a yellow is never shorter than 2 s
+DURATION_CHOICES = {"green": range(2, 10), "yellow": range(2, 5), "red": range(2, 10)}
+OFFSET_CHOICES = range(0, 9)
+
+# Cost of the mean KPIs of a plan - lower is better (a KPI not observed in the runs counts as 0)
+OBJECTIVES = {"throughput": lambda kpis: -kpis["vehicles_per_minute"],
+              "light_wait": lambda kpis: kpis["light_wait_mean"],
+              "ambulance": lambda kpis: kpis["ambulance_clearance_mean"],
+              # Seconds waited by cars at the traffic lights, ambulances and people, minus the vehicles served per minute
+              "balanced": lambda kpis: kpis["light_wait_mean"] + kpis["ambulance_clearance_mean"] + kpis["pedestrian_wait_mean"] - kpis["vehicles_per_minute"]}
+
+# Share of the plans of a generation that are random instead of mutations (keeps the search from getting stuck around the first good plans)
+RANDOM_SHARE = 0.1
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Genes of the plans of a network, ex: ("duration", "green"), ("offset", "Traffic_Light_2"), ("emergency", "Traffic_Light_1", "Traffic_Light_3")
+# The override tables only set the other traffic lights of the same intersection
+class SearchSpace:
+    def __init__(self, environment):
+        self.traffic_light_names = list(environment.traffic_lights)
+        self.others = {name: [other for other in environment.intersection_traffic_lights.get(environment.traffic_light_intersection.get(name), []) if other != name]
+                       for name in self.traffic_light_names}
+
+        self.genes = [("duration", color_name) for color_name in colors]
+        self.genes += [(gene, name) for gene in ("offset", "initial") for name in self.traffic_light_names]
+        self.genes += [(event, name, other) for event in ("emergency", "person") for name in self.traffic_light_names for other in self.others[name]]
+
+    def choices(self, gene):
+        if gene[0] == "duration":
+            return DURATION_CHOICES[gene[1]]
+        if gene[0] == "offset":
+            return OFFSET_CHOICES
+        return colors
+
+    # The default plan with its override tables written out, so that its mutations only change one color
+    def default_plan(self, environment):
+        plan = SignalPlan(initial_colors=dict(environment.traffic_lights))
+        for name in self.traffic_light_names:
+            plan.emergency_colors[name] = plan.new_colors(name, "emergency", environment.phases)
+            plan.person_colors[name] = plan.new_colors(name, "person", environment.phases)
+        return plan
+
+    def set(self, plan, gene, value):
+        if gene[0] == "duration":
+            plan.durations[gene[1]] = value
+        elif gene[0] == "offset":
+            plan.offsets[gene[1]] = value
+        elif gene[0] == "initial":
+            plan.initial_colors[gene[1]] = value
+        else:
+            table = plan.emergency_colors if gene[0] == "emergency" else plan.person_colors
+            table.setdefault(gene[1], {})[gene[2]] = value
+
+    def random_plan(self, rng):
+        plan = SignalPlan()
+        for gene in self.genes:
+            self.set(plan, gene, rng.choice(self.choices(gene)))
+        return plan
+
+    def mutate(self, plan, rng, n_genes=1):
+        plan = SignalPlan.from_dict(json.loads(plan.key()))
+        for gene in rng.sample(self.genes, min(n_genes, len(self.genes))):
+            self.set(plan, gene, rng.choice(self.choices(gene)))
+        return plan
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# State of a worker: the scenario, its road network (loaded once) and the seeds of the runs
+worker = {}
+
+
+def init_worker(scenario, seeds):
+    events.configure(console_output=False)
+    worker.update(scenario=scenario, network=scenarios.load_scenario_network(scenario), seeds=seeds)
+
+
+# Runs the plan with every seed, returns (key, mean KPIs), ex: ('{"durations": ...}', {"light_wait_mean": 4.2, ...})
+def evaluate_plan(key):
+    from headless import run_headless
+
+    scenario = worker["scenario"]
+    summaries = []
+    for seed in worker["seeds"]:
+        simulation = run_headless(dict(scenario, seed=seed, signal_control="fixed", signal_plan=json.loads(key)), worker["network"])
+        summaries.append(simulation.kpis.summary(scenario["duration"]))
+
+    kpis = {}
+    for kpi in summaries[0]:
+        values = [summary[kpi] for summary in summaries if summary[kpi] is not None]
+        kpis[kpi] = statistics.fmean(values) if values else 0.0
+    return key, kpis
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class Optimizer:
+    def __init__(self, scenario, n_seeds=4, base_seed=0, objective="balanced", population=16, search_seed=0, cache=None):
+        self.scenario = scenario
+        self.seeds = [base_seed + index for index in range(n_seeds)]
+        self.cost = OBJECTIVES[objective]
+        self.population = population
+        self.random = random.Random(f"{search_seed}-optimizer")
+
+        environment = scenarios.build_environment(dict(scenario, signal_plan=None))
+        self.space = SearchSpace(environment)
+        self.default_plan = self.space.default_plan(environment)
+
+        self.cache = {} if cache is None else cache # Plan key -> mean KPIs
+        self.best = [] # The best plans so far, ex: [(cost, key)] sorted by cost
+        self.runs = 0 # Headless runs done (plans evaluated * seeds)
+        self.evaluated = 0 # Plans evaluated in this search
+        self.cache_hits = 0 # Plans of the search found in the cache
+        self.elapsed = 0.0
+
+    # Settings that must be the same for the cached KPIs to be valid
+    def settings(self):
+        return {"scenario": self.scenario["name"], "network": str(self.scenario["network"]), "duration": self.scenario["duration"], "seeds": self.seeds,
+                "cars": self.scenario["cars"], "ambulances": self.scenario["ambulances"], "people": self.scenario["people"]}
+
+    def record(self, key, kpis):
+        self.best.append((self.cost(kpis), key))
+        self.best.sort()
+        del self.best[self.population:]
+
+    # Next plans to run: mutations of the best plans and a few random ones (the first generation is the default plan and random plans)
+    def generation(self, size):
+        keys = []
+        for _ in range(size * 20):
+            if len(keys) == size:
+                break
+            if not self.best and not keys:
+                plan = self.default_plan
+            elif not self.best or self.random.random() < RANDOM_SHARE:
+                plan = self.space.random_plan(self.random)
+            else:
+                parent = SignalPlan.from_dict(json.loads(self.random.choice(self.best)[1]))
+                plan = self.space.mutate(parent, self.random, self.random.randint(1, 3))
+
+            key = plan.key()
+            if key in keys:
+                continue
+            if key in self.cache:
+                # Already run (in this search or a previous one with the same cache) - it still takes part in the selection
+                if all(key != best_key for _, best_key in self.best):
+                    self.cache_hits += 1
+                    self.record(key, self.cache[key])
+                continue
+            keys.append(key)
+        return keys
+
+    # Searches n_plans new plans, returns [(cost, plan)] of the best ones
+    def run(self, n_plans, n_workers=None, progress=None):
+        start = time.perf_counter()
+        elapsed_before = self.elapsed
+        batch_size = max(self.population * 2, 1)
+
+        events.log.flush()
+        pool = None if n_workers == 1 else multiprocessing.Pool(n_workers, initializer=init_worker, initargs=(self.scenario, self.seeds))
+        if pool is None:
+            init_worker(self.scenario, self.seeds)
+
+        try:
+            while self.evaluated < n_plans:
+                keys = self.generation(min(batch_size, n_plans - self.evaluated))
+                if not keys:
+                    break # Every plan the search can reach is already in the cache
+                results = map(evaluate_plan, keys) if pool is None else pool.imap_unordered(evaluate_plan, keys, chunksize=max(len(keys) // (4 * (n_workers or os.cpu_count())), 1))
+                for key, kpis in results:
+                    self.cache[key] = kpis
+                    self.record(key, kpis)
+                    self.evaluated += 1
+                    self.runs += len(self.seeds)
+                self.elapsed = elapsed_before + time.perf_counter() - start
+                if progress is not None:
+                    progress(self)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        return [(cost, SignalPlan.from_dict(json.loads(key))) for cost, key in self.best]
+
+    def runs_per_second(self):
+        return self.runs / self.elapsed if self.elapsed else 0.0
+
+
+def load_cache(path, settings):
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        cache = json.load(file)
+    return cache["plans"] if cache["settings"] == settings else {}
+
+
+def save_cache(path, settings, cache):
+    with open(path + ".tmp", "w") as file:
+        json.dump({"settings": settings, "plans": cache}, file)
+    os.replace(path + ".tmp", path)
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline search of the signal plan (durations, offsets, override colors) of a scenario on the headless engine")
+    parser.add_argument("--scenario", default=scenarios.DEFAULT_SCENARIO, help="scenario file (default: scenarios/demo.json)")
+    parser.add_argument("--plans", type=int, default=500, help="number of new plans to evaluate")
+    parser.add_argument("--seeds", type=int, default=4, help="runs per plan, with the seeds --seed, --seed + 1, ...")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first run of every plan")
+    parser.add_argument("--search-seed", type=int, default=0, help="seed of the random and mutated plans")
+    parser.add_argument("--duration", type=float, default=300, help="simulated time of every run, in seconds")
+    parser.add_argument("--objective", choices=sorted(OBJECTIVES), default="balanced", help="cost to minimize (default: balanced)")
+    parser.add_argument("--population", type=int, default=16, help="number of best plans the mutations start from")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: one per core)")
+    parser.add_argument("--cache", default=None, metavar="FILE", help="KPIs of the plans already evaluated (JSON), read at the start and written at the end")
+    parser.add_argument("--output", default=None, metavar="FILE", help="write the best plan to this file (for main.py --signal-plan)")
+    args = parser.parse_args()
+
+    scenario = scenarios.load_scenario(args.scenario, duration=args.duration)
+    optimizer = Optimizer(scenario, args.seeds, args.seed, args.objective, args.population, args.search_seed)
+    optimizer.cache = load_cache(args.cache, optimizer.settings())
+
+    def progress(optimizer):
+        print(f"{optimizer.evaluated} plans, {optimizer.runs_per_second():.1f} runs/s, best cost {optimizer.best[0][0]:.3f}", file=sys.stderr)
+
+    best = optimizer.run(args.plans, args.workers, progress)
+
+    if args.cache is not None:
+        save_cache(args.cache, optimizer.settings(), optimizer.cache)
+
+    print(f"{optimizer.evaluated} plans ({optimizer.runs} runs of {scenario['duration']:.0f} s) in {optimizer.elapsed:.1f} s: "
+          f"{optimizer.runs_per_second():.1f} runs/s, {optimizer.evaluated / optimizer.elapsed:.1f} plans/s, {optimizer.cache_hits} cache hits", file=sys.stderr)
+
+    default_key = optimizer.default_plan.key()
+    if default_key in optimizer.cache:
+        print(f"default plan: cost {optimizer.cost(optimizer.cache[default_key]):.3f}")
+    for cost, plan in best[:5]:
+        kpis = optimizer.cache[plan.key()]
+        print(f"cost {cost:.3f}: durations {plan.durations}, offsets {plan.offsets}, light wait {kpis['light_wait_mean']:.2f} s, "
+              f"ambulance clearance {kpis['ambulance_clearance_mean']:.2f} s, {kpis['vehicles_per_minute']:.1f} vehicles/min")
+
+    if args.output is not None and best:
+        with open(args.output, "w") as file:
+            json.dump(best[0][1].to_dict(), file, indent=2)
@@ -0,0 +1,251 @@
+import time
+import random
+import multiprocessing
+from collections import deque
+import events
+from coordination import colors
+from environment import Environment
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Parallel mode: the road network is split into regions and every region is simulated by a worker process with its own Environment.
+# The simulation goes by ticks - one tick is one cycle of CarBehaviour/AmbulanceBehaviour for every vehicle (like fleet.py):
+#   - a vehicle moves one position forward if the cell ahead is free (Environment.is_vehicle_ahead/move_vehicle)
+#   - a car at position 4 before an intersection crosses if its light is green or, on a road with a priority sign, if the roads it gives priority to are free
+#   - a vehicle that change_road takes to a road of another region is handed off: it leaves its region at the end of the tick and enters the other one at the start of the next,
+#     before the vehicles of that region move - the entry cell is reserved for it, and if a vehicle of the region took it during the hand-off tick
+#     (it could not see the vehicle coming), the vehicle waits at the entry of the road (position 0) instead of sharing the cell
+#   - the only state a region needs from the others (the vehicles at position 5 of the roads it gives priority to) is synchronized once per tick
+#   - the traffic lights follow the fixed cycle, one color every light_period ticks, so every region knows every color without messages
+# The route choices use one random generator per region (seeded from the seed and the region), so a run depends on the number of workers.
+
+# Simulated seconds per tick - the time a car takes to move one position
+TICK_SECONDS = 3
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Region of every road (by index): the roads in breadth-first order over the turn options (in both directions), cut into n_regions blocks of the same size
+# Neighbour roads end up in the same region, so few vehicles cross a boundary on every tick
+def partition_roads(network, n_regions):
+    n_roads = len(network.road_names)
+
+    neighbours = [[] for _ in range(n_roads)]
+    for road in range(n_roads):
+        for next_road in network.next_of(road):
+            neighbours[road].append(next_road)
+            neighbours[next_road].append(road)
+
+    order = []
+    seen = bytearray(n_roads)
+    for start in range(n_roads):
+        if seen[start]:
+            continue
+        seen[start] = 1
+        queue = deque([start])
+        while queue:
+            road = queue.popleft()
+            order.append(road)
+            for other_road in neighbours[road]:
+                if not seen[other_road]:
+                    seen[other_road] = 1
+                    queue.append(other_road)
+
+    region_of_road = [0] * n_roads
+    for rank, road in enumerate(order):
+        region_of_road[road] = rank * n_regions // n_roads
+    return region_of_road
+
+
+# Roads of other regions that the roads of a region give priority to - their position 5 is the boundary state the region needs, ex: {12, 40}
+def watched_roads(network, region_of_road, region):
+    return {other_road for road in range(len(region_of_road)) if region_of_road[road] == region
+            for other_road in network.priority_of(road) if region_of_road[other_road] != region}
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class RegionVehicle:
+    def __init__(self, jid, road, position=0):
+        self.jid = jid # Also used as the vehicle id, ex: "car17"
+        self.road = road
+        self.position = position
+        self.central_jid = None
+
+
+# The part of the simulation that runs in one worker
+class Region:
+    def __init__(self, network, region_of_road, region, seed=None, light_period=2):
+        self.environment = Environment(f"{seed}-{region}", network)
+        self.region_of_road = region_of_road
+        self.region = region
+        self.light_period = light_period
+        self.initial_colors = {name: colors.index(color_name) for name, color_name in self.environment.traffic_lights.items()}
+
+        # Roads of this region that other regions give priority to - published every tick
+        self.published = sorted({other_road for road in range(len(region_of_road)) if region_of_road[road] != region
+                                 for other_road in network.priority_of(road) if region_of_road[other_road] == region})
+
+        self.boundary = set() # Roads of other regions (watched by this one) with a vehicle at position 5
+
+    def add_vehicles(self, vehicles):
+        environment = self.environment
+        for jid, type_vehicle, road, position in vehicles:
+            road = environment.roads[road]
+            # Same rule as is_vehicle_ahead: a car does not share a cell with any vehicle, an ambulance with an ambulance
+            if position > 0 and environment.is_cell_occupied(road, position, ("car", "ambulance") if type_vehicle == "car" else ("ambulance",)):
+                position = 0
+            vehicle = RegionVehicle(jid, road, position)
+            if type_vehicle == "car":
+                environment.add_car_agent(vehicle)
+            else:
+                environment.add_ambulance_agent(vehicle)
+
+    def update_traffic_lights(self, tick):
+        if tick % self.light_period == 0:
+            for traffic_light_name, initial_color in self.initial_colors.items():
+                self.environment.update_traffic_light(traffic_light_name, colors[(initial_color + tick // self.light_period) % len(colors)], None)
+
+    # Same decision as the central for a "may i go?", with the boundary state for the roads of other regions
+    def may_cross(self, road):
+        environment = self.environment
+        if road.traffic_light != "No traffic light":
+            return environment.traffic_lights[road.traffic_light] == "green"
+        return not any(environment.is_cell_occupied(other_road, 5) or other_road.index in self.boundary for other_road in environment.give_priority_to.get(road, []))
+
+    # One tick: returns the vehicles handed off to other regions, the published boundary state, the number of vehicles simulated and the CPU seconds it took
+    # (CPU time, so that it does not count the time the worker waited for a core)
+    def step(self, tick, arrivals, boundary):
+        started = time.process_time()
+        environment = self.environment
+        self.add_vehicles(arrivals)
+        self.boundary = boundary
+        self.update_traffic_lights(tick)
+
+        departures = []
+        stepped = 0
+
+        for type_vehicle, vehicles in (("car", environment.cars), ("ambulance", environment.ambulances)):
+            for jid, vehicle in list(vehicles.items()):
+                stepped += 1
+
+                if not environment.is_vehicle_ahead(jid, type_vehicle):
+                    environment.move_vehicle(jid, jid, type_vehicle)
+
+                if type_vehicle == "car" and vehicle.position == 4 and environment.ends_at_intersection(vehicle.road) and self.may_cross(vehicle.road):
+                    environment.move_vehicle(jid, jid, type_vehicle)
+
+                # Hand-off to the region of the new road
+                if self.region_of_road[vehicle.road.index] != self.region:
+                    environment.remove_vehicle(jid, type_vehicle)
+                    departures.append((jid, type_vehicle, vehicle.road.index, vehicle.position))
+
+        published = [road for road in self.published if environment.is_cell_occupied(environment.roads[road], 5)]
+        return departures, published, stepped, time.process_time() - started
+
+
+# Main loop of a worker process: ("add", vehicles) / ("tick", (tick, arrivals, boundary)) / ("stop", None)
+def run_region(connection, network, region_of_road, region, seed, light_period):
+    events.configure(console_output=False)
+    region_simulation = Region(network, region_of_road, region, seed, light_period)
+
+    while True:
+        command, payload = connection.recv()
+        if command == "tick":
+            connection.send(region_simulation.step(*payload))
+        elif command == "add":
+            region_simulation.add_vehicles(payload)
+        else: # command == "stop", with the vehicles still on their way to the region
+            region_simulation.add_vehicles(payload)
+            connection.send(len(region_simulation.environment.cars) + len(region_simulation.environment.ambulances))
+            break
+
+    connection.close()
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Coordinator: starts one worker per region, sends every tick (with the arriving vehicles and the boundary state) and collects the results - the tick is a barrier
+class ParallelSimulation:
+    def __init__(self, network, n_workers, seed=None, light_period=2):
+        self.network = network
+        self.n_workers = n_workers
+        self.region_of_road = partition_roads(network, n_workers)
+        self.watched = [watched_roads(network, self.region_of_road, region) for region in range(n_workers)]
+        self.random = random.Random(f"{seed}-parallel") # Start roads of the new vehicles
+
+        self.tick = 0
+        self.arrivals = [[] for _ in range(n_workers)] # Vehicles that enter every region at the next tick, ex: ("car3", "car", 17, 1)
+        self.boundary = set()
+        self.n_vehicles = 0
+        self.vehicle_ticks = 0
+        self.handoffs = 0
+        self.busy_seconds = 0.0 # CPU time the workers spent on the ticks, all together
+        self.critical_seconds = 0.0 # CPU time of the slowest worker of every tick, all together - the time of the ticks with one core per worker
+
+        # The workers get a copy of the process (fork) where possible - the console output so far must not be written again by them
+        events.log.flush()
+        context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+        self.connections = []
+        self.processes = []
+        for region in range(n_workers):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(target=run_region, args=(worker_connection, network, self.region_of_road, region, seed, light_period), daemon=True)
+            process.start()
+            worker_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # Adds vehicles of one type ("car" or "ambulance") at position 0 of the given road indexes, or of random start roads
+    def add_vehicles(self, n_vehicles, type_vehicle="car", roads=None):
+        start_roads = roads if roads else self.network.start_roads
+        new_vehicles = [[] for _ in range(self.n_workers)]
+
+        for index in range(n_vehicles):
+            road = start_roads[index % len(start_roads)] if roads else self.random.choice(start_roads)
+            self.n_vehicles += 1
+            new_vehicles[self.region_of_road[road]].append((f"{type_vehicle}{self.n_vehicles}", type_vehicle, road, 0))
+
+        for connection, vehicles in zip(self.connections, new_vehicles):
+            connection.send(("add", vehicles))
+
+    def step(self):
+        for region, connection in enumerate(self.connections):
+            connection.send(("tick", (self.tick, self.arrivals[region], self.boundary & self.watched[region])))
+
+        self.arrivals = [[] for _ in range(self.n_workers)]
+        self.boundary = set()
+        slowest = 0.0
+        for connection in self.connections:
+            departures, published, stepped, seconds = connection.recv()
+            for departure in departures:
+                self.arrivals[self.region_of_road[departure[2]]].append(departure)
+            self.handoffs += len(departures)
+            self.boundary.update(published)
+            self.vehicle_ticks += stepped
+            self.busy_seconds += seconds
+            slowest = max(slowest, seconds)
+        self.critical_seconds += slowest
+
+        self.tick += 1
+
+    def run(self, ticks):
+        for _ in range(ticks):
+            self.step()
+
+    # Stops the workers, returns the number of vehicles every region had at the end - the vehicles handed off at the last tick included
+    def close(self):
+        if not self.processes:
+            return []
+
+        for connection, arrivals in zip(self.connections, self.arrivals):
+            connection.send(("stop", arrivals))
+        self.arrivals = [[] for _ in range(self.n_workers)]
+        counts = [connection.recv() for connection in self.connections]
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        return counts
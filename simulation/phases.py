@@ -0,0 +1,122 @@
+# Intersection phases: every junction declares its approaches (its traffic lights, one per group of roads it controls) and its phases, the sets of
+# approaches that can be green together, in the order of the cycle, ex: [["Traffic_Light_1"], ["Traffic_Light_2"], ["Traffic_Light_3"]]
+# (default: one phase per traffic light, in the order of the intersection). Everything is precomputed into bitmasks over the approaches (bit i = approach i):
+#   - phase_masks[p]: approaches of phase p
+#   - compatible[a]: approaches that share a phase with approach a, conflicts[a]: the ones that never do (they must not be green at the same time)
+#   - compatible_phases[a]: phases approach a is green in (bitmask over the phases)
+#   - overrides[event][a]: (green, yellow) masks of the junction when approach a overrides its color, the other approaches are red:
+#       - "emergency" (a changes to green for an ambulance): its first phase is green, the rest of the phase before it clears on yellow
+#       - "person" (a changes to red for a person): the closest phase before a's that does not contain a is green, the one before that clears on yellow
+# so the colors of the other traffic lights after an override are one lookup and a few bit tests, whatever the size of the junction,
+# ex: Traffic_Light_1 changes to green -> {"Traffic_Light_2": "red", "Traffic_Light_3": "yellow"}
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class Junction:
+    def __init__(self, name, approaches, phases=None):
+        self.name = name
+        self.approaches = list(approaches) # Traffic light names, ex: ["Traffic_Light_1", "Traffic_Light_2", "Traffic_Light_3"]
+        self.approach_index = {approach: index for index, approach in enumerate(self.approaches)}
+        if len(self.approach_index) != len(self.approaches):
+            raise ValueError(f"Intersection {name}: duplicated traffic lights")
+
+        if phases is None:
+            phases = [[approach] for approach in self.approaches]
+        self.phase_masks = []
+        for phase in phases:
+            mask = 0
+            for approach in phase:
+                if approach not in self.approach_index:
+                    raise ValueError(f"Intersection {name}: phase {list(phase)} has {approach}, which is not one of its traffic lights")
+                mask |= 1 << self.approach_index[approach]
+            self.phase_masks.append(mask)
+
+        self.all_mask = (1 << len(self.approaches)) - 1
+        self.compatible_phases = [0] * len(self.approaches)
+        self.compatible = [0] * len(self.approaches)
+        for phase, mask in enumerate(self.phase_masks):
+            for approach in range(len(self.approaches)):
+                if mask >> approach & 1:
+                    self.compatible_phases[approach] |= 1 << phase
+                    self.compatible[approach] |= mask
+        for approach, phase_mask in enumerate(self.compatible_phases):
+            if not phase_mask:
+                raise ValueError(f"Intersection {name}: {self.approaches[approach]} is in no phase")
+        self.conflicts = [self.all_mask & ~mask for mask in self.compatible]
+
+        self.overrides = {"emergency": [self.emergency_override(approach) for approach in range(len(self.approaches))],
+                          "person": [self.person_override(approach) for approach in range(len(self.approaches))]}
+
+    # Index of the first phase of the approach (lowest bit of its phases)
+    def first_phase(self, approach):
+        phase_mask = self.compatible_phases[approach]
+        return (phase_mask & -phase_mask).bit_length() - 1
+
+    def emergency_override(self, approach):
+        phase = self.first_phase(approach)
+        green = self.phase_masks[phase]
+        yellow = self.phase_masks[phase - 1] & ~green
+        return green, yellow
+
+    def person_override(self, approach):
+        bit = 1 << approach
+        phase = self.first_phase(approach)
+        for step in range(1, len(self.phase_masks)):
+            previous = (phase - step) % len(self.phase_masks)
+            if not self.phase_masks[previous] & bit:
+                green = self.phase_masks[previous]
+                yellow = self.phase_masks[previous - 1] & ~green & ~bit
+                return green, yellow
+        # The approach is in every phase: every other approach stops with it
+        return 0, 0
+
+    # Colors of the other approaches when "approach" (traffic light name) overrides its color for the event, ex: {"Traffic_Light_2": "red", ...}
+    def new_colors(self, approach, event):
+        sender = self.approach_index[approach]
+        green, yellow = self.overrides[event][sender]
+        return {name: "green" if green >> index & 1 else "yellow" if yellow >> index & 1 else "red"
+                for index, name in enumerate(self.approaches) if index != sender}
+
+    def in_conflict(self, approach, other_approach):
+        return bool(self.conflicts[self.approach_index[approach]] >> self.approach_index[other_approach] & 1)
+
+    # Traffic lights that must not be green while this one is, ex: the competing queues of the actuated control
+    def conflicting(self, approach):
+        conflicts = self.conflicts[self.approach_index[approach]]
+        return [name for index, name in enumerate(self.approaches) if conflicts >> index & 1]
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# The junctions of a road network, by traffic light
+class PhaseTable:
+    def __init__(self, network=None):
+        self.junctions = {} # ex: "Intersection_1": Junction
+        self.traffic_light_junction = {} # ex: "Traffic_Light_1": Junction
+
+        if network is not None:
+            for index, name in enumerate(network.intersection_names):
+                approaches = [network.traffic_light_names[light] for light in network.lights_of(index)]
+                phases = network.intersection_phases[index]
+                if phases is not None:
+                    phases = [[network.traffic_light_names[light] for light in phase] for phase in phases]
+                self.add_junction(name, approaches, phases)
+
+    def add_junction(self, name, approaches, phases=None):
+        junction = Junction(name, approaches, phases)
+        self.junctions[name] = junction
+        for approach in junction.approaches:
+            self.traffic_light_junction[approach] = junction
+        return junction
+
+    # Colors of the other traffic lights of the junction when one changes to green ("emergency") or to red ("person") - empty for a traffic light alone
+    def new_colors(self, traffic_light_name, event):
+        junction = self.traffic_light_junction.get(traffic_light_name)
+        if junction is None:
+            return {}
+        return junction.new_colors(traffic_light_name, event)
+
+    def conflicting(self, traffic_light_name):
+        junction = self.traffic_light_junction.get(traffic_light_name)
+        if junction is None:
+            return []
+        return junction.conflicting(traffic_light_name)
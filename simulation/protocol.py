@@ -0,0 +1,155 @@
+import itertools
+from collections import namedtuple, deque
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Messages exchanged by the agents. Every body is one line with 8 fields separated by "|":
+#   kind|role|entity|subject|value|event|correlation_id|sent_at, ex: "1|car|car_1|road_1|||a3|1760790000.125"
+#   - kind: what the message is (MAY_I_GO, COMMAND, ...), as a number - the central dispatches on it with one dict lookup
+#   - role: type of the sender (car, ambulance, person, traffic_light, central) - no more guessing from the JID
+#   - entity: id of the sender, ex: "car_1", "Traffic_Light_12"
+#   - subject: what the message is about, ex: the road of the car or the traffic light to change
+#   - value: the answer/new state, ex: "move", "green"
+#   - event: the reason of a color change ("emergency" or "person")
+#   - correlation_id: set by the requests and copied to their answer
+#   - sent_at: set by the requests, wall-clock time (time.time()) they were sent - the central drops the ones that waited past their deadline since then,
+#     the time spent in its mailbox included
+# Empty fields are empty strings.
+
+# Kinds
+MAY_I_GO = 1 # car -> central, subject: road
+COLOR = 2 # ambulance -> central, subject: traffic light
+EMERGENCY = 3 # ambulance -> central (subject: road), central -> traffic light/cars on the road
+CHANGE_TO_RED = 4 # person -> central, subject: traffic light
+CHANGED_TO_GREEN = 5 # traffic light -> central, the traffic light changes to green due to an emergency
+CHANGED_TO_RED = 6 # traffic light -> central, the traffic light changes to red due to a person
+SET_COLOR = 7 # central -> traffic light, value: color, event: reason
+PERSON_CROSSING = 8 # central -> traffic light, it must change to red for a person
+COMMAND = 9 # central -> car/person, value: "move", "stop", "give priority" or "wait"
+COLOR_REPLY = 10 # central/traffic light -> ambulance/central, value: color
+BUSY = 11 # central -> car/ambulance/person, the central is overloaded and did not handle the request, value: seconds to wait before asking again, ex: "2"
+
+KIND_NAMES = {MAY_I_GO: "may i go?", COLOR: "color", EMERGENCY: "emergency", CHANGE_TO_RED: "change to red",
+              CHANGED_TO_GREEN: "changed to green", CHANGED_TO_RED: "changed to red", SET_COLOR: "set color",
+              PERSON_CROSSING: "person", COMMAND: "command", COLOR_REPLY: "color reply",
+              BUSY: "busy"}
+
+# Priority classes of the requests to the central, in the order it handles them: the emergencies, the coordination of the traffic lights, the vehicles, the people
+EMERGENCY_CLASS = 0
+SIGNAL_CLASS = 1
+VEHICLE_CLASS = 2
+PEDESTRIAN_CLASS = 3
+
+PRIORITY_CLASS_NAMES = ["emergency", "signal", "vehicle", "pedestrian"]
+
+# Kind -> priority class (anything else goes last)
+PRIORITY_CLASSES = {EMERGENCY: EMERGENCY_CLASS, CHANGED_TO_GREEN: SIGNAL_CLASS, CHANGED_TO_RED: SIGNAL_CLASS,
+                    MAY_I_GO: VEHICLE_CLASS, COLOR: VEHICLE_CLASS, CHANGE_TO_RED: PEDESTRIAN_CLASS}
+
+# Roles
+CAR = "car"
+AMBULANCE = "ambulance"
+PERSON = "person"
+TRAFFIC_LIGHT = "traffic_light"
+CENTRAL = "central"
+
+ROLES = frozenset((CAR, AMBULANCE, PERSON, TRAFFIC_LIGHT, CENTRAL))
+
+# Kind as written in the body -> kind, ex: "1": MAY_I_GO
+KIND_CODES = {str(kind): kind for kind in KIND_NAMES}
+
+SEPARATOR = "|"
+N_FIELDS = 8
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class ProtocolError(ValueError):
+    pass
+
+
+# Decoded message - a tuple, so that decoding is one split and one tuple
+Envelope = namedtuple("Envelope", ["kind", "role", "entity", "subject", "value", "event", "correlation_id", "sent_at"], defaults=["", "", "", "", ""])
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+_correlation_ids = itertools.count(1)
+
+# Unique (within the process) id for a request, ex: "1f"
+def new_correlation_id():
+    return format(next(_correlation_ids), "x")
+
+
+def encode(kind, role, entity, subject="", value="", event="", correlation_id="", sent_at=""):
+    body = f"{kind}|{role}|{entity}|{subject}|{value}|{event}|{correlation_id}|{sent_at}"
+    if body.count(SEPARATOR) != N_FIELDS - 1:
+        raise ProtocolError(f"A field of {body!r} contains the separator {SEPARATOR!r}")
+    return body
+
+
+# One split, one set lookup, one dict lookup and one tuple - what is wrong with an invalid body is only worked out when raising (see invalid)
+def decode(body, _new=tuple.__new__):
+    try:
+        fields = body.split(SEPARATOR)
+        if len(fields) != N_FIELDS or fields[1] not in ROLES:
+            raise ProtocolError(invalid(body))
+        fields[0] = KIND_CODES[fields[0]]
+    except (AttributeError, TypeError, KeyError):
+        raise ProtocolError(invalid(body)) from None
+    return _new(Envelope, fields)
+
+
+# Why a body cannot be decoded, for the error
+def invalid(body):
+    if not isinstance(body, str):
+        return f"Body {body!r} is not a string"
+    fields = body.split(SEPARATOR)
+    if len(fields) != N_FIELDS:
+        return f"Body {body!r} has {len(fields)} fields, expected {N_FIELDS}"
+    if fields[0] not in KIND_CODES:
+        return f"Body {body!r} has the unknown kind {fields[0]!r}, expected one of {sorted(KIND_NAMES)}"
+    return f"Body {body!r} has the unknown role {fields[1]!r}, expected one of {sorted(ROLES)}"
+
+
+# Time the request was sent, for its deadline - "default" if the sender did not say (or not as a number)
+def sent_time(envelope, default):
+    try:
+        return float(envelope.sent_at)
+    except ValueError:
+        return default
+
+
+# The answer to a request keeps its correlation id, ex: reply(request, COMMAND, CENTRAL, "central@localhost", value="move")
+def reply(request, kind, role, entity, subject="", value="", event=""):
+    return encode(kind, role, entity, subject, value, event, request.correlation_id)
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Round trip time of the requests (from the send to the answer with the same correlation id), to report the tail latency of a run
+class RequestStats:
+    def __init__(self, window=10000):
+        self.completed = 0
+        self.timeouts = 0
+        self.latencies = deque(maxlen=window) # Latencies of the last "window" answered requests, in seconds
+
+    def reset(self):
+        self.completed = 0
+        self.timeouts = 0
+        self.latencies.clear()
+
+    def record(self, latency):
+        self.completed += 1
+        self.latencies.append(latency)
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def report(self):
+        if not self.latencies:
+            return f"Requests: {self.completed} answered, {self.timeouts} timed out"
+        return (f"Requests: {self.completed} answered, {self.timeouts} timed out, latency p50 {self.percentile(0.5) * 1e3:.1f} ms, "
+                f"p99 {self.percentile(0.99) * 1e3:.1f} ms, max {max(self.latencies) * 1e3:.1f} ms")
+
+request_stats = RequestStats()
@@ -0,0 +1,123 @@
+import sys
+import json
+import math
+import time
+import argparse
+import statistics
+import multiprocessing
+import events
+import scenario as scenarios
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Batch runner: many independent replications of a scenario on the headless engine, spread over a pool of processes.
+#   - replication i runs with seed = base seed + i, so any replication can be run again alone with: main.py --headless --seed <seed>
+#   - every replication has its own random generators (route choices of the Environment, spawn choices of plan_agents), seeded from its seed
+#   - a worker only sends back the KPI summary of the replication (headless.Kpis) - the simulation is freed before the next one
+# The KPIs are aggregated over the replications as mean, standard deviation and 95% confidence interval of the mean.
+
+# Two-sided 95% quantiles of the Student t distribution, by degrees of freedom (the normal 1.96 beyond the table)
+T_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+        11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131, 16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086,
+        21: 2.080, 22: 2.074, 23: 2.069, 24: 2.064, 25: 2.060, 26: 2.056, 27: 2.052, 28: 2.048, 29: 2.045, 30: 2.042,
+        40: 2.021, 60: 2.000, 120: 1.980}
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Between two rows of the table, the row with fewer degrees of freedom: a slightly wider interval, never a narrower one
+def t_quantile(degrees_of_freedom):
+    if degrees_of_freedom > max(T_95):
+        return 1.96
+    return T_95[max(table_degrees for table_degrees in T_95 if table_degrees <= degrees_of_freedom)]
+
+
+# Mean and 95% confidence interval of the values of one KPI (the replications where it was not observed are left out)
+def confidence_interval(values):
+    values = [value for value in values if value is not None]
+    if not values:
+        return {"n": 0, "mean": None, "std": None, "ci_low": None, "ci_high": None}
+
+    mean = statistics.fmean(values)
+    if len(values) == 1:
+        return {"n": 1, "mean": mean, "std": None, "ci_low": None, "ci_high": None}
+
+    # The same value in every replication: the seed does not change it, there is no interval to estimate
+    std = statistics.stdev(values)
+    if std == 0:
+        return {"n": len(values), "mean": mean, "std": 0.0, "ci_low": None, "ci_high": None, "constant": True}
+
+    half_width = t_quantile(len(values) - 1) * std / math.sqrt(len(values))
+    return {"n": len(values), "mean": mean, "std": std, "ci_low": mean - half_width, "ci_high": mean + half_width}
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def init_worker():
+    events.configure(console_output=False)
+
+
+# Runs one replication, returns its KPI summary, ex: {"seed": 3, "light_wait_mean": 4.2, ...}
+def run_replication(scenario):
+    from headless import run_headless
+
+    simulation = run_headless(scenario)
+    return {"seed": scenario["seed"], **simulation.kpis.summary(scenario["duration"])}
+
+
+def run_replications(scenario, n_replications, base_seed=0, n_workers=None):
+    replications = [dict(scenario, seed=base_seed + index) for index in range(n_replications)]
+
+    # Replication results can come in any order - they are sorted by seed so that the report does not depend on the number of workers
+    if n_workers == 1:
+        init_worker()
+        results = [run_replication(replication) for replication in replications]
+    else:
+        events.log.flush()
+        with multiprocessing.Pool(n_workers, initializer=init_worker) as pool:
+            results = list(pool.imap_unordered(run_replication, replications))
+
+    return sorted(results, key=lambda result: result["seed"])
+
+
+# KPI name -> confidence interval over the replications
+def aggregate(results):
+    kpis = [key for key in results[0] if key != "seed"] if results else []
+    return {kpi: confidence_interval([result[kpi] for result in results]) for kpi in kpis}
+
+
+def format_interval(kpi, interval):
+    if interval["mean"] is None:
+        return f"{kpi}: not observed"
+    if interval.get("constant"):
+        return f"{kpi}: {interval['mean']:.2f} in every replication, not a measured variation (n={interval['n']})"
+    if interval["ci_low"] is None:
+        return f"{kpi}: {interval['mean']:.2f} (n=1)"
+    return f"{kpi}: {interval['mean']:.2f} [{interval['ci_low']:.2f}, {interval['ci_high']:.2f}] (n={interval['n']})"
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seeded replications of a scenario on the headless engine, with KPI confidence intervals")
+    parser.add_argument("--scenario", default=scenarios.DEFAULT_SCENARIO, help="scenario file (default: scenarios/demo.json)")
+    parser.add_argument("--replications", type=int, default=20, help="number of replications")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first replication, the others use the next seeds")
+    parser.add_argument("--duration", type=float, default=None, help="simulated time of every replication, in seconds")
+    parser.add_argument("--signal-plan", default=None, metavar="FILE", help="signal plan of the fixed cycle (JSON, ex: written by optimizer.py)")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes (default: one per core)")
+    parser.add_argument("--json", default=None, help="write the replications and the aggregated KPIs to this file")
+    args = parser.parse_args()
+
+    scenario = scenarios.load_scenario(args.scenario, duration=args.duration, signal_plan=args.signal_plan)
+
+    start = time.perf_counter()
+    results = run_replications(scenario, args.replications, args.seed, args.workers)
+    elapsed = time.perf_counter() - start
+    kpis = aggregate(results)
+
+    print(f"{len(results)} replications of {scenario['name']} ({scenario['duration']:.0f} s each) in {elapsed:.2f} s "
+          f"({len(results) / elapsed:.1f} replications/s)", file=sys.stderr)
+    for kpi, interval in kpis.items():
+        print(format_interval(kpi, interval))
+
+    if args.json is not None:
+        with open(args.json, "w") as file:
+            json.dump({"scenario": scenario["name"], "duration": scenario["duration"], "replications": results, "kpis": kpis}, file, indent=2)
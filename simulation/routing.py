@@ -0,0 +1,185 @@
+import heapq
+from array import array
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Destination routing: next-hop tables over the road graph (one node per road, one edge per turn option at its end)
+#   - cost of a route: the sum of the weights of the roads it enters (1 per road by default, every road has the same positions), ex: raised by congestion
+#   - one table per destination road: next_hop[road] = the road to take at the end of "road" on the cheapest route to the destination (-1: none/unreachable)
+#     built by one Dijkstra from the destination over the reversed turn options, the first time it is needed (precompute() builds every table up front)
+#   - a lookup is one dict access and one array index, ex: routing.next_road(road_index, destination_index)
+#   - closing/reweighting a road repairs the tables in place instead of building them again, only the roads whose route can change are recomputed:
+#       - more expensive or closed: the roads whose route goes through it (its subtree in the table), from their other turn options
+#       - cheaper or reopened: the roads that get a cheaper route through it, found going back from it while the cost improves
+
+UNREACHABLE = -1
+CLOSED = float("inf")
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class RoutingTable:
+    def __init__(self, network, weights=None):
+        self.network = network
+        self.n_roads = len(network.road_names)
+        self.weights = list(weights) if weights is not None else [1.0] * self.n_roads
+
+        # Reversed turn options (CSR): the roads that turn into every road, ex: previous_of(road_5) -> [road_1, road_2]
+        counts = [0] * self.n_roads
+        for next_road in network.next_roads:
+            counts[next_road] += 1
+        self.previous_offsets = array("i", [0])
+        for count in counts:
+            self.previous_offsets.append(self.previous_offsets[-1] + count)
+        self.previous_roads = array("i", [0]) * len(network.next_roads)
+        filled = list(self.previous_offsets[:-1])
+        for road in range(self.n_roads):
+            for next_road in network.next_of(road):
+                self.previous_roads[filled[next_road]] = road
+                filled[next_road] += 1
+
+        self.tables = {} # Destination road -> (next hop of every road, cost of every road), ex: 7: (array("i", [4, -1, ...]), [2.0, inf, ...])
+        self.generation = 0 # Incremented every time a closure/reweight changes a table, so that the copies of the tables know they are out of date (see fleet.py)
+        self.computed = 0 # Number of tables built
+        self.repaired = 0 # Number of (destination, road) routes recomputed after a closure/reweight
+
+    def previous_of(self, road):
+        return self.previous_roads[self.previous_offsets[road]:self.previous_offsets[road + 1]]
+
+    # Dijkstra from the destination over the reversed turn options - ties go to the road popped first (lowest cost, then lowest index), so the routes are deterministic
+    def compute(self, destination):
+        next_hop = array("i", [UNREACHABLE]) * self.n_roads
+        cost = [CLOSED] * self.n_roads
+        cost[destination] = 0.0
+        heap = [(0.0, destination)]
+
+        while heap:
+            road_cost, road = heapq.heappop(heap)
+            if road_cost > cost[road]:
+                continue
+            new_cost = road_cost + self.weights[road]
+            if new_cost == CLOSED:
+                continue
+            for previous_road in self.previous_of(road):
+                if new_cost < cost[previous_road]:
+                    cost[previous_road] = new_cost
+                    next_hop[previous_road] = road
+                    heapq.heappush(heap, (new_cost, previous_road))
+
+        self.tables[destination] = next_hop, cost
+        self.computed += 1
+        return next_hop, cost
+
+    def table(self, destination):
+        table = self.tables.get(destination)
+        if table is None:
+            table = self.compute(destination)
+        return table[0]
+
+    def precompute(self):
+        for destination in range(self.n_roads):
+            if destination not in self.tables:
+                self.compute(destination)
+
+    # Road to take at the end of "road" to go to "destination" (indexes), UNREACHABLE if there is no route
+    def next_road(self, road, destination):
+        table = self.tables.get(destination)
+        if table is None:
+            table = self.compute(destination)
+        return table[0][road]
+
+    # Every road of the route, ex: [0, 4, 7] - empty if there is no route
+    def route(self, origin, destination):
+        roads = [origin]
+        while roads[-1] != destination:
+            next_road = self.next_road(roads[-1], destination)
+            if next_road == UNREACHABLE:
+                return []
+            roads.append(next_road)
+        return roads
+
+    #--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+    def set_weight(self, road, weight):
+        old_weight = self.weights[road]
+        if weight == old_weight:
+            return
+        self.weights[road] = weight
+
+        repaired = 0
+        for next_hop, cost in self.tables.values():
+            if weight > old_weight:
+                repaired += self.repair_increase(next_hop, cost, road)
+            else:
+                repaired += self.repair_decrease(next_hop, cost, road)
+
+        if repaired:
+            self.repaired += repaired
+            self.generation += 1
+
+    # The road got more expensive: the roads whose route goes through it lose their route and get the best one among their turn options
+    # that do not go through it, then the cheaper routes spread between them (Dijkstra restricted to them) - returns the number of roads recomputed
+    def repair_increase(self, next_hop, cost, road):
+        affected = [previous_road for previous_road in self.previous_of(road) if next_hop[previous_road] == road]
+        if not affected:
+            return 0
+
+        in_subtree = set(affected)
+        for affected_road in affected: # The list grows while it is read - breadth-first over the subtree
+            for previous_road in self.previous_of(affected_road):
+                if next_hop[previous_road] == affected_road and previous_road not in in_subtree:
+                    in_subtree.add(previous_road)
+                    affected.append(previous_road)
+
+        for affected_road in affected:
+            cost[affected_road] = CLOSED
+            next_hop[affected_road] = UNREACHABLE
+
+        heap = []
+        for affected_road in affected:
+            for next_road in self.network.next_of(affected_road):
+                if next_road not in in_subtree and cost[next_road] + self.weights[next_road] < cost[affected_road]:
+                    cost[affected_road] = cost[next_road] + self.weights[next_road]
+                    next_hop[affected_road] = next_road
+            if cost[affected_road] != CLOSED:
+                heap.append((cost[affected_road], affected_road))
+        heapq.heapify(heap)
+
+        while heap:
+            road_cost, affected_road = heapq.heappop(heap)
+            if road_cost > cost[affected_road]:
+                continue
+            new_cost = road_cost + self.weights[affected_road]
+            for previous_road in self.previous_of(affected_road):
+                if previous_road in in_subtree and new_cost < cost[previous_road]:
+                    cost[previous_road] = new_cost
+                    next_hop[previous_road] = affected_road
+                    heapq.heappush(heap, (new_cost, previous_road))
+
+        return len(affected)
+
+    # The road got cheaper: the roads that turn into it get the cheaper route through it if it is better, and so on going back while the cost improves
+    def repair_decrease(self, next_hop, cost, road):
+        if cost[road] == CLOSED:
+            return 0
+
+        repaired = 0
+        heap = [(cost[road], road)]
+        while heap:
+            road_cost, improved_road = heapq.heappop(heap)
+            if road_cost > cost[improved_road]:
+                continue
+            new_cost = road_cost + self.weights[improved_road]
+            for previous_road in self.previous_of(improved_road):
+                if new_cost < cost[previous_road]:
+                    cost[previous_road] = new_cost
+                    next_hop[previous_road] = improved_road
+                    heapq.heappush(heap, (new_cost, previous_road))
+                    repaired += 1
+
+        return repaired
+
+    def close_road(self, road):
+        self.set_weight(road, CLOSED)
+
+    def open_road(self, road, weight=1.0):
+        self.set_weight(road, weight)
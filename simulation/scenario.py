@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import random
+import asyncio
+import network
+import coordination
+from environment import Environment
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Scenario spec: which network to use and how many agents of each type to create, where and when, ex: scenarios/demo.json
+#   "network": file in networks/ (or a path), or {"grid": [rows, cols]} for a generated grid
+#   "cars"/"ambulances"/"people": {"count": n, "roads": [...]} - the roads are used in turn, without roads every agent gets a random start road
+#   "cars"/"ambulances": optional "destinations": [...] (used in turn) or "random" - the vehicles follow the cheapest route to their destination (see routing.py)
+#     and start a new trip to a random destination when they reach it, without destinations they take random turns
+#   "spawn_interval": seconds between the start of consecutive vehicles/people (0 = all at once)
+#   "startup_concurrency": maximum number of agents starting/stopping at the same time
+#   "signal_control": "fixed" (green -> yellow -> red every 3 s) or "actuated" (colors held/cut by the queues, see coordination.ActuatedController)
+#   "signal_plan": durations/offsets/override colors of the fixed cycle - a JSON file or a dict, null = the default plan (see coordination.SignalPlan)
+# The agents are generated from the spec, so the same scenario runs on the SPADE agents (main.py) and on the headless engine (headless.py)
+
+SCENARIOS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scenarios")
+DEFAULT_SCENARIO = os.path.join(SCENARIOS_DIR, "demo.json")
+
+DEFAULTS = {"name": "scenario",
+            "network": "three_lights.json",
+            "seed": None,
+            "duration": 60,
+            "domain": "localhost",
+            "password": "060303",
+            "shards": 1,
+            "startup_concurrency": 32,
+            "spawn_interval": 0,
+            "signal_control": "fixed",
+            "signal_plan": None,
+            "queue_capacity": 1000,
+            "cars": {"count": 0},
+            "ambulances": {"count": 0},
+            "people": {"count": 0}}
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def load_scenario(path=DEFAULT_SCENARIO, **overrides):
+    with open(path) as file:
+        scenario = dict(DEFAULTS, **json.load(file))
+
+    # Command line values (None = keep the one of the file)
+    for key, value in overrides.items():
+        if value is not None:
+            scenario[key] = value
+
+    return scenario
+
+
+def load_scenario_network(scenario):
+    description = scenario["network"]
+
+    if isinstance(description, dict):
+        return network.generate_grid(*description["grid"])
+
+    if os.path.exists(description):
+        return network.load_network(description)
+    return network.load_network(os.path.join(network.NETWORKS_DIR, description))
+
+
+# road_network: already loaded network of the scenario (ex: loaded once for many runs)
+def build_environment(scenario, road_network=None):
+    environment = Environment(scenario["seed"], road_network or load_scenario_network(scenario))
+    for traffic_light_name, color_name in coordination.load_signal_plan(scenario["signal_plan"]).initial_colors.items():
+        environment.traffic_lights[traffic_light_name] = color_name
+    return environment
+
+
+# List of the agents to create, in start order within each type, ex: {"type": "car", "jid": "vehicle1@localhost", "id": "car_1", "road": env.road_1, "delay": 0}
+def plan_agents(scenario, environment):
+    domain = scenario["domain"]
+
+    # Separate generator so that the spawn choices do not change the route choices of the environment
+    spawn_random = random.Random(f"{scenario['seed']}-spawn")
+
+    plan = []
+
+    for index, traffic_light_name in enumerate(environment.network.traffic_light_names, start=1):
+        plan.append({"type": "traffic_light", "jid": f"traffic_light{index}@{domain}", "id": traffic_light_name, "road": None, "delay": 0})
+
+    spawned = 0
+    for agent_type, jid_prefix, id_prefix, default_roads in (("car", "vehicle", "car", environment.choose_new_road),
+                                                             ("ambulance", "ambulance", "ambulance", environment.choose_new_road),
+                                                             ("person", "person", "person", environment.choose_zebra_crossing)):
+        spec = scenario[{"car": "cars", "ambulance": "ambulances", "person": "people"}[agent_type]]
+        roads = [environment.roads[environment.network.road_index[name]] for name in spec.get("roads", [])]
+        destinations = spec.get("destinations")
+        if isinstance(destinations, list):
+            destinations = [environment.roads[environment.network.road_index[name]] for name in destinations]
+
+        for index in range(1, spec["count"] + 1):
+            road = roads[(index - 1) % len(roads)] if roads else spawn_random.choice(default_roads)
+            if destinations == "random":
+                destination = spawn_random.choice(environment.destination_roads)
+            else:
+                destination = destinations[(index - 1) % len(destinations)] if destinations else None
+            plan.append({"type": agent_type, "jid": f"{jid_prefix}{index}@{domain}", "id": f"{id_prefix}_{index}", "road": road,
+                         "destination": destination, "delay": spawned * scenario["spawn_interval"]})
+            spawned += 1
+
+    return plan
+
+
+def central_jids(scenario):
+    if scenario["shards"] == 1:
+        return [f"central@{scenario['domain']}"]
+    return [f"central{index}@{scenario['domain']}" for index in range(1, scenario["shards"] + 1)]
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Real-time mode: creates the agents of the scenario, ex: {"traffic_light": [...], "central": [...], "car": [...], "ambulance": [...], "person": [...]}
+def build_agents(scenario, environment):
+    from agents import CarAgent, TrafficLightAgent, CentralCordinateAgent, AmbulanceAgent, PersonAgent
+    from coordination import ShardMap
+
+    password = scenario["password"]
+    shard_map = ShardMap(environment, central_jids(scenario))
+    plan = plan_agents(scenario, environment)
+    signal_plan = coordination.load_signal_plan(scenario["signal_plan"])
+
+    traffic_light_jids = {spec["id"]: spec["jid"] for spec in plan if spec["type"] == "traffic_light"}
+    agents = {"traffic_light": [], "central": [], "car": [], "ambulance": [], "person": []}
+    delays = {}
+
+    agents["central"] = [CentralCordinateAgent(jid, password, environment, traffic_light_jids, signal_plan, scenario["queue_capacity"]) for jid in shard_map.central_jids]
+
+    for spec in plan:
+        if spec["type"] == "traffic_light":
+            agent = TrafficLightAgent(spec["jid"], password, environment, spec["id"], shard_map.shard_for_traffic_light(spec["id"]),
+                                       scenario["signal_control"], signal_plan)
+
+        elif spec["type"] == "car":
+            agent = CarAgent(spec["jid"], password, environment, spec["id"], spec["road"], shard_map.central_jids[0], spec["destination"])
+            environment.add_car_agent(agent)
+
+        elif spec["type"] == "ambulance":
+            agent = AmbulanceAgent(spec["jid"], password, environment, spec["id"], spec["road"], shard_map.central_jids[0], spec["destination"])
+            environment.add_ambulance_agent(agent)
+
+        else: # spec["type"] == "person"
+            agent = PersonAgent(spec["jid"], password, shard_map.central_jids[0], environment, spec["id"], spec["road"])
+            environment.add_person_agent(agent)
+
+        agents[spec["type"]].append(agent)
+        delays[agent] = spec["delay"]
+
+    # Routes every vehicle/person to the central of its road
+    environment.set_shard_map(shard_map)
+
+    return agents, delays, shard_map
+
+
+# Starts the agents with at most "concurrency" registrations at the same time: centrals and traffic lights first, then vehicles and people (after their delay)
+# Returns the time to first tick - the longest an agent took to be running from its planned start (the call plus its spawn delay), so that
+# the spawn schedule itself (see spawn_schedule) is not counted
+async def start_agents(agents, delays, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+    time_to_first_tick = 0.0
+
+    async def start_agent(agent):
+        nonlocal time_to_first_tick
+        planned = start + delays.get(agent, 0)
+        delay = planned - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with semaphore:
+            await agent.start(auto_register=True)
+        time_to_first_tick = max(time_to_first_tick, time.perf_counter() - planned)
+
+    await asyncio.gather(*(start_agent(agent) for agent in agents["central"] + agents["traffic_light"]))
+    await asyncio.gather(*(start_agent(agent) for agent in agents["car"] + agents["ambulance"] + agents["person"]))
+
+    return time_to_first_tick
+
+
+# Seconds from the start call to the planned start of the last agent, ex: 100 vehicles with a spawn interval of 0.5 s -> 49.5
+def spawn_schedule(delays):
+    return max(delays.values(), default=0)
+
+
+async def stop_agents(agents, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+
+    async def stop_agent(agent):
+        async with semaphore:
+            await agent.stop()
+
+    # Vehicles and people first, so that the centrals do not get requests while stopping
+    await asyncio.gather(*(stop_agent(agent) for agent in agents["car"] + agents["ambulance"] + agents["person"]))
+    await asyncio.gather(*(stop_agent(agent) for agent in agents["traffic_light"] + agents["central"]))
+
+    return time.perf_counter() - start
@@ -0,0 +1,275 @@
+import json
+import mmap
+import struct
+from array import array
+import scenario as scenarios
+import coordination
+from coordination import colors
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Snapshots: the state of a headless simulation (or of a VehicleFleet) in one binary file, to start experiments from a saved (ex: congested) state.
+# File: b"TSNP", header length (uint32), JSON header (counts, clock, offsets of the columns), then the columns aligned to 8 bytes:
+#   - one fixed-width array per field, ex: the road (int32), position (int8) and destination (int32, -1 = none) of every vehicle - read with a cast of the memory-mapped file, no parsing
+#   - the ids are one "\n"-separated UTF-8 column, only decoded by the headless restore
+# Headless snapshot: clock, roads/positions of the cars and ambulances, zebra crossings of the people, colors and phase timers of the traffic lights,
+# messages not yet received by the agents, state of the route generator (Environment.random).
+# The behaviours are generators, so they can not be saved: on restore every agent starts its cycle again, from the top, at the time it was going to wake up.
+# The restored run is therefore not the exact continuation of the saved one: an agent suspended in the middle of its cycle does the beginning of the cycle again
+# (ex: a car that had just moved and was in its "yield 3" asks to move again, a person waiting for the central approaches the zebra crossing again),
+# only the traffic lights resume their phase (from the time elapsed in their color). The central starts a new cycle: the requests it had already taken
+# out of its inbox get no answer and their senders give up after coordination.REQUEST_TIMEOUT.
+# VehicleFleet snapshot: the arrays of the fleet, plus the destinations of the next trips (destination_roads), which are not all assigned to a vehicle.
+
+MAGIC = b"TSNP"
+VERSION = 1
+ALIGNMENT = 8
+
+# Vehicle kinds (same codes as fleet.py)
+CAR = 0
+AMBULANCE = 1
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class SnapshotError(ValueError):
+    pass
+
+
+def write_snapshot(path, header, columns):
+    offsets = {}
+    data = bytearray()
+    for name, (typecode, values) in columns.items():
+        column = values if isinstance(values, (bytes, bytearray)) else array(typecode, values).tobytes()
+        offsets[name] = (typecode, len(data), len(column))
+        data += column
+        data += bytes(-len(data) % ALIGNMENT)
+
+    header_bytes = json.dumps(dict(header, version=VERSION, columns=offsets)).encode()
+    header_bytes += b" " * (-(len(header_bytes) + 8) % ALIGNMENT)
+
+    with open(path, "wb") as file:
+        file.write(MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes)
+        file.write(data)
+
+
+# Snapshot file opened with mmap - the columns are views on the file, read on demand
+class Snapshot:
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.mmap[:4] != MAGIC:
+            self.close()
+            raise SnapshotError(f"{path} is not a snapshot")
+
+        header_length, = struct.unpack_from("<I", self.mmap, 4)
+        self.header = json.loads(self.mmap[8:8 + header_length])
+        if self.header["version"] != VERSION:
+            self.close()
+            raise SnapshotError(f"{path} has version {self.header['version']}, expected {VERSION}")
+        self.data_offset = 8 + header_length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.mmap.close()
+
+    # Zero-copy view of a column, ex: column("vehicle_road")[3] - valid while the snapshot is open
+    def column(self, name):
+        typecode, offset, size = self.header["columns"][name]
+        start = self.data_offset + offset
+        return memoryview(self.mmap)[start:start + size].cast(typecode)
+
+    # Copy of a column as a list, ex: for the object by object headless restore
+    def values(self, name):
+        with self.column(name) as view:
+            return view.tolist()
+
+    def numpy_column(self, name):
+        import numpy as np
+        typecode, offset, size = self.header["columns"][name]
+        dtype = np.dtype(typecode)
+        return np.frombuffer(self.mmap, dtype, size // dtype.itemsize, self.data_offset + offset)
+
+    def strings(self, name):
+        with self.column(name) as view:
+            text = bytes(view).decode()
+        return text.split("\n") if text else []
+
+    def check_network(self, network):
+        if self.header["n_roads"] != len(network.road_names) or self.header["n_traffic_lights"] != len(network.traffic_light_names):
+            raise SnapshotError(f"The snapshot is of another road network ({self.header['network']})")
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def random_state_columns(generator):
+    version, state, gauss = generator.getstate()
+    return {"random_state": ("I", state)}, {"random_version": version, "random_gauss": gauss}
+
+
+def restore_random_state(snapshot, generator):
+    generator.setstate((snapshot.header["random_version"], tuple(snapshot.values("random_state")), snapshot.header["random_gauss"]))
+
+
+# Next time every agent was going to run, and the messages that were on their way to it
+def pending_wakeups(simulation):
+    wakeups = {}
+    messages = {jid: list(inbox) for jid, inbox in simulation.inboxes.items() if inbox}
+
+    for time, _, jid, value, token in sorted(simulation.events):
+        # Timeout of a Receive that was already answered
+        if token is not None and simulation.waiting.get(jid) != token:
+            continue
+        wakeups.setdefault(jid, time)
+        if value is not None:
+            messages.setdefault(jid, []).insert(0, value)
+
+    return wakeups, messages
+
+
+def save_headless(simulation, path):
+    environment = simulation.environment
+    network = environment.network
+    wakeups, messages = pending_wakeups(simulation)
+
+    vehicles = [(CAR, car) for car in environment.cars.values()] + [(AMBULANCE, ambulance) for ambulance in environment.ambulances.values()]
+    people = list(environment.people.values())
+    traffic_light_names = network.traffic_light_names
+
+    random_columns, random_header = random_state_columns(environment.random)
+    header = {"type": "headless", "network": network.name, "n_roads": len(network.road_names), "n_traffic_lights": len(traffic_light_names),
+              "now": simulation.now, "n_vehicles": len(vehicles), "n_people": len(people), **random_header}
+
+    ids = [f"{vehicle.jid}\t{vehicle.car_id if kind == CAR else vehicle.ambulance_id}" for kind, vehicle in vehicles]
+    ids += [f"{person.jid}\t{person.person_id}" for person in people]
+    ids += [simulation.traffic_light_jids.get(name, "") for name in traffic_light_names]
+    pending = [f"{jid}\t{message}" for jid, jid_messages in messages.items() for message in jid_messages]
+
+    columns = {"vehicle_kind": ("b", [kind for kind, _ in vehicles]),
+               "vehicle_road": ("i", [vehicle.road.index for _, vehicle in vehicles]),
+               "vehicle_position": ("b", [vehicle.position for _, vehicle in vehicles]),
+               "vehicle_wakeup": ("d", [wakeups.get(vehicle.jid, simulation.now) for _, vehicle in vehicles]),
+               "vehicle_destination": ("i", [vehicle.destination.index if getattr(vehicle, "destination", None) is not None else -1 for _, vehicle in vehicles]),
+               "person_road": ("i", [person.road.index for person in people]),
+               "person_wakeup": ("d", [wakeups.get(person.jid, simulation.now) for person in people]),
+               "light_color": ("b", [colors.index(environment.traffic_lights[name]) for name in traffic_light_names]),
+               "light_elapsed": ("d", [simulation.now - simulation.light_changed_at.get(name, 0.0) for name in traffic_light_names]),
+               "ids": ("B", "\n".join(ids).encode()),
+               "messages": ("B", "\n".join(pending).encode()),
+               **random_columns}
+
+    write_snapshot(path, header, columns)
+
+
+# New headless simulation of the scenario (network, domain) in the state of the snapshot
+def restore_headless(path, scenario):
+    from headless import HeadlessSimulation, HeadlessCarAgent, HeadlessAmbulanceAgent, HeadlessPersonAgent, HeadlessTrafficLightAgent
+
+    environment = scenarios.build_environment(scenario)
+
+    with Snapshot(path) as snapshot:
+        if snapshot.header["type"] != "headless":
+            raise SnapshotError(f"{path} is a {snapshot.header['type']} snapshot")
+        snapshot.check_network(environment.network)
+        restore_random_state(snapshot, environment.random)
+
+        traffic_light_names = environment.network.traffic_light_names
+        for traffic_light_name, color_index in zip(traffic_light_names, snapshot.values("light_color")):
+            environment.traffic_lights[traffic_light_name] = colors[color_index]
+
+        simulation = HeadlessSimulation(environment, scenario["signal_control"], coordination.load_signal_plan(scenario["signal_plan"]))
+        simulation.now = snapshot.header["now"]
+        for traffic_light_name in traffic_light_names:
+            simulation.light_changed_at[traffic_light_name] = simulation.now
+
+        n_vehicles = snapshot.header["n_vehicles"]
+        n_people = snapshot.header["n_people"]
+        ids = snapshot.strings("ids")
+
+        for traffic_light_name, jid, elapsed in zip(traffic_light_names, ids[n_vehicles + n_people:], snapshot.values("light_elapsed")):
+            simulation.add_traffic_light_agent(HeadlessTrafficLightAgent(jid, traffic_light_name), elapsed)
+            simulation.light_changed_at[traffic_light_name] = simulation.now - elapsed
+
+        # Snapshots written before the routing have no destinations
+        destinations = snapshot.values("vehicle_destination") if "vehicle_destination" in snapshot.header["columns"] else [-1] * n_vehicles
+
+        vehicle_columns = zip(ids[:n_vehicles], snapshot.values("vehicle_kind"), snapshot.values("vehicle_road"),
+                              snapshot.values("vehicle_position"), snapshot.values("vehicle_wakeup"), destinations)
+        for entry, kind, road, position, wakeup, destination in vehicle_columns:
+            jid, vehicle_id = entry.split("\t")
+            destination = environment.roads[destination] if destination >= 0 else None
+            if kind == CAR:
+                car = HeadlessCarAgent(jid, vehicle_id, environment.roads[road], destination)
+                car.position = position
+                simulation.add_car_agent(car, wakeup - simulation.now)
+            else:
+                ambulance = HeadlessAmbulanceAgent(jid, vehicle_id, environment.roads[road], destination)
+                ambulance.position = position
+                simulation.add_ambulance_agent(ambulance, wakeup - simulation.now)
+
+        for entry, road, wakeup in zip(ids[n_vehicles:n_vehicles + n_people], snapshot.values("person_road"), snapshot.values("person_wakeup")):
+            jid, person_id = entry.split("\t")
+            simulation.add_person_agent(HeadlessPersonAgent(jid, person_id, environment.roads[road]), wakeup - simulation.now)
+
+        for entry in snapshot.strings("messages"):
+            jid, message = entry.split("\t")
+            simulation.inboxes[jid].append(message)
+
+    return simulation
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# VehicleFleet snapshot: the columns are the arrays of the fleet
+def save_fleet(vehicles, path):
+    network = vehicles.network
+    header = {"type": "fleet", "network": network.name, "n_roads": len(network.road_names), "n_traffic_lights": len(network.traffic_light_names),
+              "n_vehicles": len(vehicles), "rng": vehicles.rng.bit_generator.state}
+
+    columns = {"vehicle_kind": ("b", vehicles.kind.astype("i1").tobytes()),
+               "vehicle_road": ("i", vehicles.road.astype("i4").tobytes()),
+               "vehicle_position": ("b", vehicles.position.astype("i1").tobytes()),
+               "vehicle_status": ("b", vehicles.status.astype("i1").tobytes()),
+               "vehicle_destination": ("i", vehicles.destination.astype("i4").tobytes()),
+               "destination_roads": ("i", vehicles.destination_roads.astype("i4").tobytes()),
+               "light_color": ("b", vehicles.light_colors.astype("i1").tobytes())}
+
+    write_snapshot(path, header, columns)
+
+
+# The arrays are converted straight from the memory-mapped columns (one vectorized copy each, no object per vehicle)
+def restore_fleet(path, network):
+    import numpy as np
+    from fleet import VehicleFleet
+
+    with Snapshot(path) as snapshot:
+        if snapshot.header["type"] != "fleet":
+            raise SnapshotError(f"{path} is a {snapshot.header['type']} snapshot")
+        snapshot.check_network(network)
+
+        vehicles = VehicleFleet(network)
+        vehicles.rng.bit_generator.state = snapshot.header["rng"]
+        vehicles.kind = snapshot.numpy_column("vehicle_kind").astype(np.int8)
+        vehicles.road = snapshot.numpy_column("vehicle_road").astype(np.int64)
+        vehicles.position = snapshot.numpy_column("vehicle_position").astype(np.int64)
+        vehicles.status = snapshot.numpy_column("vehicle_status").astype(np.int8)
+        vehicles.light_colors = snapshot.numpy_column("light_color").astype(np.int8)
+        if "vehicle_destination" in snapshot.header["columns"]:
+            vehicles.destination = snapshot.numpy_column("vehicle_destination").astype(np.int64)
+        else:
+            vehicles.destination = np.full(len(vehicles.road), -1, dtype=np.int64)
+
+        # Snapshots written before destination_roads was saved only have the destinations of the vehicles
+        indexes = np.flatnonzero(vehicles.destination >= 0)
+        if "destination_roads" in snapshot.header["columns"]:
+            destination_roads = snapshot.numpy_column("destination_roads").astype(np.int64)
+        else:
+            destination_roads = vehicles.destination[indexes]
+        if len(destination_roads):
+            vehicles.set_destinations(indexes, vehicles.destination[indexes])
+            vehicles.destination_roads = np.union1d(vehicles.destination_roads, destination_roads)
+
+    return vehicles
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules of the simulation import each other by name (ex: "import coordination"), as when they are run from simulation/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The agents run on the in-process transport (no XMPP server), chosen before transport.py is imported
+os.environ.setdefault("SIM_TRANSPORT", "local")
@@ -0,0 +1,106 @@
+import asyncio
+import agents
+import protocol
+import transport
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Central that sends an emergency alert before the answer to every request
+class AlertingCentral(transport.LocalCyclicBehaviour):
+    async def run(self):
+        msg = await self.receive(timeout=1)
+        if msg:
+            request = protocol.decode(msg.body)
+            await self.send(agents.make_message(msg.sender, protocol.encode(protocol.EMERGENCY, protocol.CENTRAL, "central", "road_1")))
+            await self.send(agents.make_message(msg.sender, protocol.encode(protocol.COMMAND, protocol.CENTRAL, "central", value="move",
+                                                                            correlation_id=request.correlation_id)))
+
+
+class OneRequest(agents.RequestBehaviour):
+    async def run(self):
+        self.answer = await self.request("central@localhost", protocol.MAY_I_GO, protocol.CAR, "car_1", "road_1", timeout=1)
+        self.alert = await self.receive_envelope(timeout=0.1)
+        self.kill()
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_deferred_message_is_decoded_once(monkeypatch):
+    decoded = []
+    read_message = agents.read_message
+    monkeypatch.setattr(agents, "read_message", lambda msg: decoded.append(msg) or read_message(msg))
+
+    async def scenario():
+        central = transport.LocalAgent("central@localhost", "password")
+        central.add_behaviour(AlertingCentral())
+        car = transport.LocalAgent("car@localhost", "password")
+        behaviour = OneRequest()
+        car.add_behaviour(behaviour)
+        await central.start()
+        await car.start()
+        await asyncio.sleep(0.1)
+        await car.stop()
+        await central.stop()
+        return behaviour
+
+    behaviour = asyncio.run(scenario())
+
+    assert behaviour.answer.kind == protocol.COMMAND and behaviour.answer.value == "move"
+    assert behaviour.alert.kind == protocol.EMERGENCY
+    assert len(decoded) == 2
+    assert not behaviour.deferred
+
+
+def test_take_deferred_returns_the_first_message_of_the_kind():
+    behaviour = agents.RequestBehaviour()
+    first = agents.make_message("car@localhost", protocol.encode(protocol.EMERGENCY, protocol.CENTRAL, "central", "road_1"))
+    second = agents.make_message("car@localhost", protocol.encode(protocol.EMERGENCY, protocol.CENTRAL, "central", "road_2"))
+    command = agents.make_message("car@localhost", protocol.encode(protocol.COMMAND, protocol.CENTRAL, "central", value="stop"))
+    for msg in (command, first, second):
+        behaviour.route(msg)
+
+    assert behaviour.take_deferred(protocol.EMERGENCY).subject == "road_1"
+    assert [envelope.subject for _, envelope in behaviour.deferred] == ["", "road_2"]
+    assert behaviour.take_deferred(protocol.SET_COLOR) is None
+
+
+# The "may i go?"/"color" requests of a cycle on the same traffic light are answered from one lookup of its color
+def test_central_answers_the_requests_on_a_traffic_light_from_one_lookup():
+    from benchmarks import BenchVehicle, central_fixture
+    from environment import Environment
+
+    async def scenario():
+        env = Environment(0)
+        senders = []
+        for index in range(30):
+            car = BenchVehicle(f"coalesced_car{index}@localhost", env.choose_zebra_crossing[index % 3])
+            car.position = 4
+            env.add_car_agent(car)
+            senders.append(car)
+        ambulance = BenchVehicle("coalesced_ambulance@localhost", env.choose_zebra_crossing[2])
+        ambulance.ambulance_id = "ambulance_1"
+        env.add_ambulance_agent(ambulance)
+        senders.append(ambulance)
+
+        answers = []
+        async with central_fixture(env, senders, answers, [], queue_capacity=None) as central:
+            for sender in senders:
+                kind, role = (protocol.COLOR, protocol.AMBULANCE) if sender is ambulance else (protocol.MAY_I_GO, protocol.CAR)
+                transport.router.deliver(transport.LocalMessage(to=central.jid, sender=sender.jid,
+                                                                body=protocol.encode(kind, role, sender.jid, subject=sender.road.name,
+                                                                                     correlation_id=protocol.new_correlation_id())))
+            while len(answers) < len(senders):
+                await asyncio.sleep(0.01)
+        return env, central, answers
+
+    env, central, answers = asyncio.run(scenario())
+
+    roads = {car.jid: car.road for car in env.cars.values()}
+    for _, msg in answers:
+        envelope = protocol.decode(msg.body)
+        if msg.to == "coalesced_ambulance@localhost":
+            assert (envelope.kind, envelope.value) == (protocol.COLOR_REPLY, env.traffic_lights[env.choose_zebra_crossing[2].traffic_light])
+        else:
+            assert envelope.kind == protocol.COMMAND
+            assert envelope.value == ("move" if env.traffic_lights[roads[msg.to].traffic_light] == "green" else "stop")
+    assert central.traffic_light_cache.lookups == 3
+    assert central.lookups_saved == len(answers) - 3
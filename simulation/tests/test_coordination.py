@@ -0,0 +1,273 @@
+import json
+import pytest
+import protocol
+import scenario as scenarios
+from environment import Environment
+from coordination import PriorityScheduler, ShardMap, EmergencyBatch, SignalPlan, load_signal_plan
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def drain(scheduler, now=0.0):
+    items = []
+    while scheduler:
+        try:
+            items.append(scheduler.get(now))
+        except IndexError:
+            break
+    return items
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_more_urgent_classes_first_whatever_the_arrival_order():
+    scheduler = PriorityScheduler(len(protocol.PRIORITY_CLASS_NAMES))
+    scheduler.put(protocol.PEDESTRIAN_CLASS, "person")
+    scheduler.put(protocol.VEHICLE_CLASS, "car")
+    scheduler.put(protocol.SIGNAL_CLASS, "traffic light")
+    scheduler.put(protocol.EMERGENCY_CLASS, "ambulance")
+
+    assert drain(scheduler) == [(protocol.EMERGENCY_CLASS, "ambulance"), (protocol.SIGNAL_CLASS, "traffic light"),
+                                (protocol.VEHICLE_CLASS, "car"), (protocol.PEDESTRIAN_CLASS, "person")]
+    assert len(scheduler) == 0
+
+
+def test_an_emergency_put_while_draining_goes_before_the_waiting_requests():
+    scheduler = PriorityScheduler(4)
+    for index in range(3):
+        scheduler.put(protocol.VEHICLE_CLASS, f"car{index}")
+
+    assert scheduler.get() == (protocol.VEHICLE_CLASS, "car0")
+    scheduler.put(protocol.EMERGENCY_CLASS, "ambulance")
+    assert scheduler.get() == (protocol.EMERGENCY_CLASS, "ambulance")
+    assert scheduler.get() == (protocol.VEHICLE_CLASS, "car1")
+
+
+def test_fifo_within_a_class():
+    scheduler = PriorityScheduler(4)
+    for index in range(100):
+        scheduler.put(index % 2 + protocol.VEHICLE_CLASS, index)
+
+    items = drain(scheduler)
+    assert [item for _, item in items] == list(range(0, 100, 2)) + list(range(1, 100, 2))
+
+
+def test_a_full_class_refuses_its_oldest_message_and_only_that_class():
+    scheduler = PriorityScheduler(4, capacities=[None, None, 2, 2])
+
+    assert scheduler.put(protocol.VEHICLE_CLASS, "car0") is None
+    assert scheduler.put(protocol.VEHICLE_CLASS, "car1") is None
+    assert scheduler.put(protocol.VEHICLE_CLASS, "car2") == "car0"
+    assert scheduler.put(protocol.PEDESTRIAN_CLASS, "person0") is None
+    for index in range(10):
+        assert scheduler.put(protocol.EMERGENCY_CLASS, f"ambulance{index}") is None
+
+    assert scheduler.shed == [0, 0, 1, 0]
+    assert scheduler.depths() == [10, 0, 2, 1]
+    assert len(scheduler) == 13
+    assert [item for _, item in drain(scheduler)][-3:] == ["car1", "car2", "person0"]
+
+
+def test_messages_past_their_deadline_are_dropped():
+    scheduler = PriorityScheduler(4, deadlines=[None, None, 5, None])
+    scheduler.put(protocol.VEHICLE_CLASS, "old car", received=0.0)
+    scheduler.put(protocol.VEHICLE_CLASS, "new car", received=8.0)
+    scheduler.put(protocol.EMERGENCY_CLASS, "old ambulance", received=0.0)
+
+    assert drain(scheduler, now=10.0) == [(protocol.EMERGENCY_CLASS, "old ambulance"), (protocol.VEHICLE_CLASS, "new car")]
+    assert scheduler.expired == [0, 0, 1, 0]
+
+
+def test_get_from_an_empty_scheduler():
+    with pytest.raises(IndexError):
+        PriorityScheduler(4).get()
+
+
+# Central on the local transport: an emergency sent after 200 requests is alerted before any of them is answered
+def test_central_alerts_the_emergency_before_answering_the_requests():
+    import asyncio
+    import benchmarks
+
+    result = asyncio.run(benchmarks.emergency_under_load(200))
+    assert result["answers_before_alert"] == 0
+
+
+# The deadline of a request counts from its send: one that spent longer than the deadline on its way (mailbox, cycle of the central) is dropped unanswered
+def test_central_drops_a_request_sent_before_its_deadline():
+    import asyncio
+    import time
+    import transport
+    from agents import CentralCordinateAgent
+    from benchmarks import BenchSink, BenchVehicle
+    from environment import Environment
+
+    async def scenario():
+        env = Environment(0)
+        answers = []
+        cars = []
+        for index, sent_ago in enumerate((10.0, 0.0)):
+            car = BenchVehicle(f"deadline_car{index}@localhost", env.choose_zebra_crossing[0])
+            car.position = 4
+            env.add_car_agent(car)
+            transport.router.register(BenchSink(car.jid, answers))
+            cars.append((car, sent_ago))
+
+        central = CentralCordinateAgent("deadline_central@localhost", "test", env, {}, request_deadline=5)
+        await central.start()
+        for car, sent_ago in cars:
+            body = protocol.encode(protocol.MAY_I_GO, protocol.CAR, car.jid, subject=car.road.name, correlation_id=protocol.new_correlation_id(),
+                                   sent_at=f"{time.time() - sent_ago:.3f}")
+            transport.router.deliver(transport.LocalMessage(to=central.jid, sender=car.jid, body=body))
+
+        while central.decisions + central.expired < 2:
+            await asyncio.sleep(0.01)
+        await central.stop()
+        for car, _ in cars:
+            transport.router.unregister(car)
+        return central, answers
+
+    central, answers = asyncio.run(scenario())
+    assert central.expired == 1
+    assert [msg.to for _, msg in answers] == ["deadline_car1@localhost"]
+
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def shard_environment(n_intersections):
+    from benchmarks import add_bench_intersections
+    from environment import Environment
+
+    env = Environment(0)
+    roads = add_bench_intersections(env, n_intersections)
+    return env, roads
+
+
+def test_intersections_go_round_robin_with_their_roads_and_traffic_lights():
+    env, _ = shard_environment(4)
+    central_jids = ["central0@localhost", "central1@localhost", "central2@localhost"]
+    shard_map = ShardMap(env, central_jids)
+
+    for index, intersection_name in enumerate(env.intersection_roads):
+        central_jid = central_jids[index % len(central_jids)]
+        assert shard_map.intersection_shard[intersection_name] == central_jid
+        assert all(shard_map.shard_for_road(road) == central_jid for road in env.intersection_roads[intersection_name])
+        assert all(shard_map.shard_for_traffic_light(name) == central_jid for name in env.intersection_traffic_lights[intersection_name])
+
+    # Every traffic light belongs to exactly one central
+    owned = [name for central_jid in central_jids for name in shard_map.traffic_lights_of(central_jid)]
+    assert sorted(owned) == sorted(env.traffic_lights)
+
+
+def test_roads_without_intersection_have_no_shard():
+    env, _ = shard_environment(2)
+    shard_map = ShardMap(env, ["central0@localhost", "central1@localhost"])
+    intersection_roads = {road for roads in env.intersection_roads.values() for road in roads}
+
+    for road in env.roads:
+        if road not in intersection_roads:
+            assert shard_map.shard_for_road(road) is None
+    assert shard_map.shard_for_traffic_light("Unknown_Light") == "central0@localhost"
+
+
+def test_route_counts_only_the_moves_between_centrals():
+    from benchmarks import BenchVehicle
+
+    env, roads = shard_environment(2)
+    shard_map = ShardMap(env, ["central0@localhost", "central1@localhost"])
+    first, second = (shard_map.shard_for_road(road) for road in roads)
+    assert first != second
+
+    vehicle = BenchVehicle("vehicle1@localhost", roads[0])
+    shard_map.route(vehicle) # First assignment, not a hand-off
+    assert vehicle.central_jid == first and shard_map.handoffs == 0
+
+    vehicle.road = roads[1]
+    shard_map.route(vehicle)
+    assert vehicle.central_jid == second and shard_map.handoffs == 1
+
+    shard_map.route(vehicle) # Same central
+    assert shard_map.handoffs == 1
+
+    vehicle.road = next(road for road in env.roads if shard_map.shard_for_road(road) is None)
+    shard_map.route(vehicle) # No intersection: keeps its central
+    assert vehicle.central_jid == second and shard_map.handoffs == 1
+
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def ambulance(ambulance_id, road):
+    from benchmarks import BenchVehicle
+
+    vehicle = BenchVehicle(f"{ambulance_id}@localhost", road)
+    vehicle.ambulance_id = ambulance_id
+    return vehicle
+
+
+def test_emergencies_on_the_same_road_share_one_alert():
+    from environment import Road
+
+    road_1 = Road("road_1", "Traffic_Light_1", "Zebra_Crossing_1", "No traffic sign")
+    road_9 = Road("road_9", "No traffic light", "No Zebra Crossing", "Priority")
+    batch = EmergencyBatch()
+    for ambulance_id, road in (("ambulance_1", road_1), ("ambulance_2", road_9), ("ambulance_3", road_1), ("ambulance_1", road_1)):
+        batch.add(ambulance(ambulance_id, road))
+
+    assert batch.received == 4
+    assert batch.coalesced == 2
+    assert batch.take() == {road_1: ["ambulance_1", "ambulance_3", "ambulance_1"], road_9: ["ambulance_2"]}
+    assert batch.take() == {}
+
+
+def test_traffic_lights_with_emergencies_stay_known_until_the_end_of_the_cycle():
+    from environment import Road
+
+    batch = EmergencyBatch()
+    assert not batch.pending_on_traffic_light()
+    batch.add(ambulance("ambulance_1", Road("road_1", "Traffic_Light_1", "Zebra_Crossing_1", "No traffic sign")))
+    batch.add(ambulance("ambulance_2", Road("road_9", "No traffic light", "No Zebra Crossing", "Priority")))
+    batch.take()
+
+    assert batch.pending_on_traffic_light()
+    assert batch.pending_on_traffic_light(["Traffic_Light_2", "Traffic_Light_1"])
+    assert not batch.pending_on_traffic_light(["Traffic_Light_2", "No traffic light"])
+
+    batch.end_cycle()
+    assert not batch.pending_on_traffic_light()
+
+
+def test_central_sends_one_alert_per_road_for_a_burst_of_emergencies():
+    import asyncio
+    import benchmarks
+
+    result = asyncio.run(benchmarks.central_flood("emergency", 300, n_senders=30, n_cars=20))
+    assert result["alerts"] == 3 # One per traffic light road of the senders
+    assert result["coalesced"] == 300 - 3
+
+
+def test_signal_plan_from_a_json_file(tmp_path):
+    path = tmp_path / "plan.json"
+    path.write_text(json.dumps({"durations": {"green": 5}, "offsets": {"Traffic_Light_2": 2},
+                                "emergency_colors": {"Traffic_Light_1": {"Traffic_Light_2": "yellow"}}}))
+    plan = load_signal_plan(str(path))
+
+    assert plan.durations == {"green": 5, "yellow": 3, "red": 3} # The colors not in the file keep their default duration
+    assert plan.offsets == {"Traffic_Light_2": 2}
+    assert load_signal_plan(plan.to_dict()).key() == plan.key()
+    assert load_signal_plan(plan) is plan
+    assert load_signal_plan(None).key() == SignalPlan().key()
+
+
+def test_override_colors_of_a_plan_fall_back_on_the_phases():
+    environment = Environment(0)
+    plan = SignalPlan(emergency_colors={"Traffic_Light_1": {"Traffic_Light_2": "yellow"}})
+
+    assert plan.new_colors("Traffic_Light_1", "emergency", environment.phases) == {"Traffic_Light_2": "yellow"}
+    assert plan.new_colors("Traffic_Light_1", "person", environment.phases) == environment.phases.new_colors("Traffic_Light_1", "person")
+    assert plan.new_colors("Traffic_Light_1", "person") == {}
+
+
+def test_initial_colors_of_the_plan_are_set_on_the_environment():
+    default = scenarios.build_environment(scenarios.load_scenario())
+    name = next(iter(default.traffic_lights))
+    other_color = "green" if default.traffic_lights[name] != "green" else "red"
+
+    environment = scenarios.build_environment(scenarios.load_scenario(signal_plan={"initial_colors": {name: other_color}}))
+    assert environment.traffic_lights == dict(default.traffic_lights, **{name: other_color})
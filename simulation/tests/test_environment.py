@@ -0,0 +1,35 @@
+from environment import Environment
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class Vehicle:
+    def __init__(self, jid, road, position):
+        self.jid = jid
+        self.road = road
+        self.position = position
+
+
+def add_cars(environment, road, positions):
+    for index, position in enumerate(positions):
+        environment.add_car_agent(Vehicle(f"car{road.name}_{index}@localhost", road, position))
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_queue_length_counts_only_the_cars_at_the_stop_line():
+    environment = Environment(0)
+
+    # road_1 and road_2 are both controlled by Traffic_Light_1
+    add_cars(environment, environment.road_1, [0, 1, 2, 3, 4, 5])
+    add_cars(environment, environment.road_2, [3, 4])
+
+    assert environment.queue_length("Traffic_Light_1") == 3
+
+
+def test_queue_length_ignores_moving_cars():
+    environment = Environment(0)
+    add_cars(environment, environment.road_3, [0, 1, 2, 3])
+
+    assert environment.queue_length("Traffic_Light_2") == 0
+
+    environment.set_vehicle_location("carroad_3_3@localhost", "car", environment.road_3, 4)
+    assert environment.queue_length("Traffic_Light_2") == 1
@@ -0,0 +1,48 @@
+import pytest
+import events
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class ListSink(events.BufferedSink):
+    def __init__(self):
+        super().__init__(buffer_size=1000)
+        self.records = []
+
+    def write(self, records):
+        self.records.extend(records)
+
+
+class FailingSink(ListSink):
+    def write(self, records):
+        raise OSError("disk full")
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_background_sink_flush_writes_everything_emitted():
+    sink = ListSink()
+    background = events.BackgroundSink(sink)
+    for index in range(100):
+        background.emit((0.0, "vehicle", events.INFO, "moving", {"index": index}))
+
+    background.flush()
+    assert [fields["index"] for *_, fields in sink.records] == list(range(100))
+    background.close()
+
+
+def test_background_sink_flush_raises_when_the_thread_died():
+    background = events.BackgroundSink(FailingSink())
+    background.emit((0.0, "vehicle", events.INFO, "moving", {}))
+
+    with pytest.raises(RuntimeError, match="disk full"):
+        background.flush()
+
+
+def test_parse_level_accepts_a_level_with_or_without_category():
+    assert events.parse_level("info") == (None, events.INFO)
+    assert events.parse_level("vehicle=off") == ("vehicle", events.OFF)
+
+
+@pytest.mark.parametrize("spec", ["vehicle=loud", "car=off", "loud", ""])
+def test_parse_level_rejects_unknown_categories_and_levels(spec):
+    with pytest.raises(ValueError):
+        events.parse_level(spec)
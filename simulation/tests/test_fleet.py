@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+import network
+from fleet import VehicleFleet, CAR, AMBULANCE, CELLS_PER_ROAD, LAST_POSITION, MOVED, WAITING
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Fleet with the vehicles of each type in distinct cells (a car and an ambulance may share one)
+def scattered_fleet(road_network, n_cars, n_ambulances, seed=0):
+    fleet = VehicleFleet(road_network, seed=seed)
+    rng = np.random.default_rng(seed)
+    n_cells = len(road_network.road_names) * CELLS_PER_ROAD
+    for kind, count in ((CAR, n_cars), (AMBULANCE, n_ambulances)):
+        cells = rng.choice(n_cells, count, replace=False)
+        indexes = fleet.add_vehicles(cells // CELLS_PER_ROAD, kind)
+        fleet.position[indexes] = cells % CELLS_PER_ROAD
+    return fleet
+
+
+def assert_one_vehicle_per_cell_and_type(fleet):
+    for kind in (CAR, AMBULANCE):
+        assert fleet.cell_occupancy(fleet.kind == kind).max(initial=0) <= 1
+
+
+def merge_network():
+    return network.RoadNetwork({"traffic_lights": {"Light_A": "green", "Light_B": "green"},
+                                "roads": [{"id": "in_a", "traffic_light": "Light_A", "next": ["out"]},
+                                          {"id": "in_b", "traffic_light": "Light_B", "next": ["out"]},
+                                          {"id": "out"}],
+                                "start_roads": ["in_a", "in_b"],
+                                "intersections": [{"id": "Merge", "roads": ["in_a", "in_b"], "traffic_lights": ["Light_A", "Light_B"]}]})
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("routed", [False, True])
+def test_step_keeps_one_vehicle_per_cell_and_conserves_the_vehicles(routed):
+    grid = network.generate_grid(4, 4)
+    fleet = scattered_fleet(grid, 120, 30)
+    if routed:
+        fleet.set_destinations(np.arange(0, len(fleet), 2), np.arange(0, len(fleet), 2) % len(grid.road_names))
+    rng = np.random.default_rng(1)
+    kinds = fleet.kind.copy()
+
+    moved = 0
+    for _ in range(300):
+        fleet.light_colors[:] = rng.integers(0, 3, len(fleet.light_colors))
+        moved += int(fleet.step().sum())
+
+        assert_one_vehicle_per_cell_and_type(fleet)
+        assert np.array_equal(fleet.kind, kinds)
+        assert fleet.position.min() >= 0 and fleet.position.max() <= LAST_POSITION
+        assert fleet.road.min() >= 0 and fleet.road.max() < len(grid.road_names)
+    assert moved > 0
+
+
+def test_only_one_of_the_cars_turning_into_the_same_cell_enters():
+    fleet = VehicleFleet(merge_network(), seed=0)
+    fleet.add_vehicles([0, 1])
+    fleet.position[:] = LAST_POSITION
+
+    fleet.step()
+
+    out = merge_network().road_index["out"]
+    assert list(fleet.road) == [out, 1]
+    assert list(fleet.position) == [1, LAST_POSITION]
+    assert list(fleet.status) == [MOVED, WAITING]
+
+
+def test_car_waits_at_position_4_while_the_last_position_is_taken():
+    fleet = VehicleFleet(merge_network(), seed=0)
+    out = merge_network().road_index["out"]
+    fleet.add_vehicles([0, 1, out, 0])
+    fleet.position[:] = [LAST_POSITION, LAST_POSITION, 0, 3]
+
+    fleet.step()
+
+    # The car ahead cannot enter "out" (taken by the car that moves from position 0), so the green light does not let the car behind jump
+    assert list(fleet.position) == [LAST_POSITION, LAST_POSITION, 1, 4]
+    assert fleet.status[3] == WAITING
+    assert_one_vehicle_per_cell_and_type(fleet)
@@ -0,0 +1,125 @@
+import asyncio
+import pytest
+import protocol
+import scenario as scenarios
+import transport
+from collections import deque
+from benchmarks import BenchSink, BenchVehicle
+from headless import HeadlessSimulation, CENTRAL_JID
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Requests of one cycle of the central on the demo network (three_lights): (kind, type of the sender, road, position)
+# Traffic_Light_1 (road_1, road_2) is red, Traffic_Light_2 (road_3) yellow, Traffic_Light_3 (road_4) green, road_9 gives priority to road_5 and road_6
+WITH_EMERGENCY = [(protocol.MAY_I_GO, "car", "road_1", 4),
+                  (protocol.MAY_I_GO, "car", "road_4", 4),
+                  (protocol.MAY_I_GO, "car", "road_9", 4),
+                  (None, "car", "road_5", 5),
+                  (None, "car", "road_3", 2),
+                  (protocol.COLOR, "ambulance", "road_3", 4),
+                  (protocol.CHANGE_TO_RED, "person", "road_4", 0),
+                  (protocol.EMERGENCY, "ambulance", "road_3", 4),
+                  (protocol.CHANGED_TO_GREEN, "traffic_light", "Traffic_Light_2", 0)]
+
+WITHOUT_EMERGENCY = [(protocol.MAY_I_GO, "car", "road_9", 4),
+                     (protocol.CHANGE_TO_RED, "person", "road_4", 0),
+                     (protocol.CHANGE_TO_RED, "person", "road_1", 0),
+                     (protocol.CHANGED_TO_RED, "traffic_light", "Traffic_Light_3", 0)]
+
+
+# Environment of the demo scenario with the senders of the requests - the traffic lights are only there as the recipients of the central
+def build(requests):
+    env = scenarios.build_environment(scenarios.load_scenario())
+    traffic_light_jids = {name: f"traffic_light{index}@localhost" for index, name in enumerate(env.traffic_lights)}
+    senders = []
+    for index, (kind, role, road_name, position) in enumerate(requests):
+        if role == "traffic_light":
+            senders.append((kind, role, road_name, traffic_light_jids[road_name]))
+            continue
+
+        sender = BenchVehicle(f"{role}{index}@localhost", next(road for road in env.roads if road.name == road_name))
+        sender.position = position
+        if role == "car":
+            env.add_car_agent(sender)
+        elif role == "ambulance":
+            sender.ambulance_id = f"ambulance_{index}"
+            env.add_ambulance_agent(sender)
+        else:
+            env.add_person_agent(sender)
+        if kind is not None:
+            senders.append((kind, role, sender.road.name, sender.jid))
+    return env, traffic_light_jids, senders
+
+
+# Messages every agent got from the central, in the headless form: "emergency", "person", "red:emergency" (traffic lights), "move", "yellow" (answers)
+def real_time_decisions(requests):
+    from agents import CentralCordinateAgent
+
+    env, traffic_light_jids, senders = build(requests)
+    inbox = []
+
+    async def cycle():
+        recipients = list(traffic_light_jids.values()) + list(env.cars) + list(env.ambulances) + list(env.people)
+        for jid in recipients:
+            transport.router.register(BenchSink(jid, inbox))
+        central = CentralCordinateAgent("parity_central@localhost", "test", env, traffic_light_jids)
+        await central.start()
+        for kind, role, subject, jid in senders:
+            entity = subject if role == "traffic_light" else jid
+            transport.router.deliver(transport.LocalMessage(to=central.jid, sender=jid, body=protocol.encode(kind, role, entity, subject=subject)))
+        await asyncio.sleep(2)
+        await central.stop()
+        for jid in recipients:
+            transport.router.agents.pop(jid, None)
+
+    asyncio.run(cycle())
+
+    decisions = {}
+    for _, msg in inbox:
+        envelope = protocol.decode(msg.body)
+        if envelope.kind == protocol.EMERGENCY:
+            message = "emergency"
+        elif envelope.kind == protocol.PERSON_CROSSING:
+            message = "person"
+        elif envelope.kind == protocol.SET_COLOR:
+            message = f"{envelope.value}:{envelope.event}"
+        else:
+            message = envelope.value
+        decisions.setdefault(str(msg.to), []).append(message)
+    return decisions
+
+
+def headless_decisions(requests):
+    env, traffic_light_jids, senders = build(requests)
+    simulation = HeadlessSimulation(env)
+    simulation.traffic_light_jids = dict(traffic_light_jids)
+    for jid in list(traffic_light_jids.values()) + list(env.cars) + list(env.ambulances) + list(env.people):
+        simulation.inboxes[jid] = deque()
+    for kind, role, subject, jid in senders:
+        simulation.send(CENTRAL_JID, f"{kind}|{subject if role == 'traffic_light' else jid}")
+    simulation.run(2)
+
+    return {jid: [message[len("answer:"):] if message.startswith("answer:") else message for message in inbox]
+            for jid, inbox in simulation.inboxes.items() if inbox and jid != CENTRAL_JID}
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# The same requests in one cycle get the same answers and the same messages to the traffic lights and cars in both modes
+@pytest.mark.parametrize("requests", [WITH_EMERGENCY, WITHOUT_EMERGENCY], ids=["with_emergency", "without_emergency"])
+def test_headless_central_decides_like_the_real_time_central(requests):
+    expected = real_time_decisions(requests)
+
+    assert headless_decisions(requests) == expected
+    assert expected # The cycle was handled
+
+
+def test_decisions_of_the_cycle():
+    decisions = headless_decisions(WITH_EMERGENCY)
+
+    assert decisions["car0@localhost"] == ["stop"]
+    assert decisions["car1@localhost"] == ["move"]
+    assert decisions["car2@localhost"] == ["give priority"]
+    assert decisions["car4@localhost"] == ["emergency"]
+    assert decisions["ambulance5@localhost"] == ["yellow"]
+    assert decisions["person6@localhost"] == ["wait"]
+    assert decisions["traffic_light1@localhost"] == ["emergency"]
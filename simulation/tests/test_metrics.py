@@ -0,0 +1,94 @@
+import json
+import os
+import re
+import urllib.request
+import metrics
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def filled_registry():
+    registry = metrics.Registry()
+    for value in (0.00005, 0.0001, 0.003, 0.003, 500):
+        registry.observe("request_seconds", "may i go?", value)
+    registry.gauge("central_queue_depth", "central", 12)
+    registry.gauge("central_queue_depth", "central", 3)
+    registry.increment("messages_received", "car", 40)
+    registry.increment("messages_received", 'we"ird\\label\n')
+    return registry
+
+
+# Sample lines of the exposition: name, labels, value
+SAMPLE = re.compile(r'^([a-z_]+)\{((?:[a-z_]+="(?:[^"\\]|\\.)*",?)+)\} (\S+)$')
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_prometheus_exposition_format():
+    lines = filled_registry().prometheus().splitlines()
+
+    # HELP and TYPE once per metric, before its samples
+    for name, metric_type in (("request_seconds", "histogram"), ("central_queue_depth", "gauge"), ("messages_received", "counter")):
+        full_name = metrics.PREFIX + name
+        assert lines.count(f"# TYPE {full_name} {metric_type}") == 1
+        help_line = lines.index(f"# HELP {full_name} {metrics.DEFINITIONS[name][2]}")
+        first_sample = next(index for index, line in enumerate(lines) if line.startswith(full_name))
+        assert help_line < first_sample
+
+    samples = [SAMPLE.match(line) for line in lines if not line.startswith("#")]
+    assert all(samples)
+    samples = [(match.group(1), match.group(2), float(match.group(3))) for match in samples]
+
+    # Histogram: cumulative buckets with their exact bounds, +Inf equal to the count, sum of the values
+    prefix = metrics.PREFIX + "request_seconds"
+    buckets = [(labels, value) for name, labels, value in samples if name == prefix + "_bucket"]
+    bounds = [re.search(r'le="([^"]+)"', labels).group(1) for labels, _ in buckets]
+    assert bounds == [repr(bound) for bound in metrics.BUCKETS] + ["+Inf"]
+    counts = [value for _, value in buckets]
+    assert counts == sorted(counts)
+    assert counts[0] == 2 # 0.00005 and 0.0001 (a value on a bound is in its bucket)
+    assert counts[-1] == 5
+    assert counts[-2] == 4 # 500 s is only in +Inf
+    assert [value for name, _, value in samples if name == prefix + "_count"] == [5]
+    assert [value for name, _, value in samples if name == prefix + "_sum"] == [sum((0.00005, 0.0001, 0.003, 0.003, 500))]
+
+    assert (metrics.PREFIX + "central_queue_depth", 'central="central"', 3) in samples
+    assert (metrics.PREFIX + "messages_received", 'role="car"', 40) in samples
+    assert (metrics.PREFIX + "messages_received", 'role="we\\"ird\\\\label\\n"', 1) in samples
+
+
+def test_snapshot_has_every_metric_by_name_and_label():
+    snapshot = filled_registry().snapshot()["metrics"]
+
+    assert snapshot["messages_received"]["car"] == 40
+    assert snapshot["central_queue_depth"]["central"] == {"value": 3, "max": 12}
+    histogram = snapshot["request_seconds"]["may i go?"]
+    assert histogram["count"] == 5
+    assert histogram["p50"] == 0.0032
+    assert histogram["p99"] is None or histogram["p99"] >= metrics.BUCKETS[-1]
+    assert sum(histogram["buckets"]) == 5
+
+
+def test_exporters_serve_and_write_the_registry(tmp_path):
+    registry = filled_registry()
+    endpoint = metrics.PrometheusEndpoint(registry, 0)
+    writer = metrics.SnapshotWriter(registry, str(tmp_path / "metrics.json"), interval=3600)
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{endpoint.port}/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert response.read().decode() == registry.prometheus()
+    finally:
+        endpoint.close()
+        writer.close()
+
+    with open(tmp_path / "metrics.json") as file:
+        assert json.load(file)["metrics"]["messages_received"]["car"] == 40
+    assert not os.path.exists(tmp_path / "metrics.json.tmp")
+
+
+def test_disabled_metrics_record_nothing():
+    metrics.disable()
+    metrics.registry.reset()
+    metrics.increment("messages_received", "car")
+    metrics.observe("request_seconds", "color", 0.1)
+
+    assert not metrics.enabled()
+    assert metrics.registry.metrics == {}
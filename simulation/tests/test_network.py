@@ -0,0 +1,62 @@
+import copy
+import pytest
+import network
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def tiny_description():
+    return {"name": "tiny",
+            "traffic_lights": {"Light_A": "green", "Light_B": "red"},
+            "roads": [{"id": "in_a", "traffic_light": "Light_A", "next": ["out_1", "out_2"]},
+                      {"id": "in_b", "traffic_light": "Light_B", "next": ["out_2"], "give_priority_to": ["in_a"]},
+                      {"id": "out_1"},
+                      {"id": "out_2", "next": ["in_a"]}],
+            "start_roads": ["in_a", "in_b"],
+            "zebra_crossing_roads": ["in_a"],
+            "intersections": [{"id": "Cross", "roads": ["in_a", "in_b"], "traffic_lights": ["Light_A", "Light_B"], "phases": [["Light_A"], ["Light_B"]]}]}
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_csr_lookups_follow_the_description():
+    description = tiny_description()
+    net = network.RoadNetwork(description)
+
+    for index, road in enumerate(description["roads"]):
+        assert [net.road_names[next_road] for next_road in net.next_of(index)] == road.get("next", [])
+        assert [net.road_names[other] for other in net.priority_of(index)] == road.get("give_priority_to", [])
+        assert net.traffic_light_name_of(index) == road.get("traffic_light", network.NO_TRAFFIC_LIGHT)
+
+    assert list(net.next_offsets) == [0, 2, 3, 3, 4]
+    assert [net.traffic_light_names[light] for light in net.lights_of(0)] == ["Light_A", "Light_B"]
+    assert list(net.road_intersection) == [0, 0, -1, -1]
+    assert net.intersection_phases == [[[0], [1]]]
+    assert [net.road_names[road] for road in net.start_roads] == ["in_a", "in_b"]
+    assert net.initial_colors == ["green", "red"]
+
+
+def test_generated_grid_never_goes_back():
+    net = network.generate_grid(3, 3)
+
+    assert len(net.intersection_names) == 9
+    for index, name in enumerate(net.road_names):
+        origin = name[len("road_"):].split("_to_")[0]
+        assert all(not net.road_names[next_road].endswith(f"_to_{origin}") for next_road in net.next_of(index))
+        assert net.road_intersection[index] >= 0
+
+
+@pytest.mark.parametrize("change, message", [
+    (lambda d: d["roads"].append({"id": "in_a"}), "duplicated road ids"),
+    (lambda d: d["roads"][0].update(traffic_light="Light_C"), "road in_a has the traffic light 'Light_C'"),
+    (lambda d: d["intersections"][0]["traffic_lights"].append("Light_C"), "intersection Cross has the traffic light 'Light_C'"),
+    (lambda d: d["intersections"][0]["phases"].append(["Light_C"]), "intersection Cross has the traffic light 'Light_C'"),
+    (lambda d: d["roads"][0]["next"].append("nowhere"), "road in_a has the road 'nowhere'"),
+    (lambda d: d["roads"][1]["give_priority_to"].append("nowhere"), "road in_b has the road 'nowhere'"),
+    (lambda d: d["start_roads"].append("nowhere"), "start_roads has the road 'nowhere'"),
+    (lambda d: d["intersections"][0]["roads"].append("nowhere"), "intersection Cross has the road 'nowhere'"),
+])
+def test_invalid_descriptions_are_rejected(change, message):
+    description = copy.deepcopy(tiny_description())
+    change(description)
+
+    with pytest.raises(ValueError, match=message):
+        network.RoadNetwork(description)
@@ -0,0 +1,78 @@
+import json
+import optimizer
+import scenario as scenarios
+from coordination import SignalPlan
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def short_optimizer(cache=None):
+    return optimizer.Optimizer(scenarios.load_scenario(duration=20), n_seeds=2, population=2, cache=cache)
+
+
+def counting_evaluations(monkeypatch):
+    evaluated = []
+    evaluate_plan = optimizer.evaluate_plan
+
+    def counted(key):
+        evaluated.append(key)
+        return evaluate_plan(key)
+
+    monkeypatch.setattr(optimizer, "evaluate_plan", counted)
+    return evaluated
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_a_plan_is_never_run_twice(monkeypatch):
+    evaluated = counting_evaluations(monkeypatch)
+    first = short_optimizer()
+    first.run(6, n_workers=1)
+
+    assert len(evaluated) == len(set(evaluated)) == first.evaluated == 6
+    assert first.runs == 12
+    assert evaluated[0] == first.default_plan.key()
+    assert set(first.cache) == set(evaluated)
+
+    # A search with the same cache only runs new plans, the cached ones still take part in the selection
+    evaluated.clear()
+    second = short_optimizer(dict(first.cache))
+    second.run(6, n_workers=1)
+
+    assert second.cache_hits > 0
+    assert not set(evaluated) & set(first.cache)
+    assert second.best[0][0] <= first.best[0][0]
+
+
+def test_same_plan_same_key_whatever_the_order_it_was_built_in():
+    plan = SignalPlan(offsets={"Traffic_Light_2": 2, "Traffic_Light_1": 1})
+    same = SignalPlan(offsets={"Traffic_Light_1": 1})
+    same.offsets["Traffic_Light_2"] = 2
+
+    assert plan.key() == same.key()
+    assert SignalPlan.from_dict(json.loads(plan.key())).key() == plan.key()
+    assert SignalPlan(durations={"green": 4}).key() != SignalPlan().key()
+
+
+def test_cache_file_is_only_used_with_the_same_settings(tmp_path):
+    search = short_optimizer()
+    search.run(2, n_workers=1)
+    path = str(tmp_path / "cache.json")
+    optimizer.save_cache(path, search.settings(), search.cache)
+
+    assert optimizer.load_cache(path, short_optimizer().settings()) == search.cache
+    longer = optimizer.Optimizer(scenarios.load_scenario(duration=30), n_seeds=2, population=2)
+    assert optimizer.load_cache(path, longer.settings()) == {}
+    assert optimizer.load_cache(str(tmp_path / "missing.json"), search.settings()) == {}
+
+
+def test_mutations_stay_in_the_search_space():
+    search = short_optimizer()
+    rng = search.random
+    plan = search.default_plan
+
+    for _ in range(50):
+        plan = search.space.mutate(plan, rng, 3)
+        for gene in search.space.genes:
+            if gene[0] == "duration":
+                assert plan.durations[gene[1]] in search.space.choices(gene)
+            elif gene[0] == "offset":
+                assert plan.offsets.get(gene[1], 0) in search.space.choices(gene)
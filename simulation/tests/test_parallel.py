@@ -0,0 +1,42 @@
+import pytest
+import network
+from parallel import ParallelSimulation, Region, partition_roads
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("n_workers", [1, 2, 3])
+def test_vehicles_are_conserved_across_hand_offs(n_workers):
+    grid = network.generate_grid(6, 6)
+    with ParallelSimulation(grid, n_workers, seed=0) as simulation:
+        simulation.add_vehicles(270, "car")
+        simulation.add_vehicles(30, "ambulance")
+        simulation.run(15)
+        counts = simulation.close()
+
+    assert sum(counts) == 300
+    assert len(counts) == n_workers
+    if n_workers > 1:
+        assert simulation.handoffs > 0
+
+
+def test_partition_covers_every_road_with_balanced_regions():
+    grid = network.generate_grid(6, 6)
+    region_of_road = partition_roads(grid, 4)
+
+    assert len(region_of_road) == len(grid.road_names)
+    sizes = [region_of_road.count(region) for region in range(4)]
+    assert max(sizes) - min(sizes) <= 1
+
+
+# A vehicle handed off into a cell a vehicle of the region took during the hand-off tick waits at the entry of the road instead of sharing the cell
+def test_arrival_into_a_taken_cell_waits_at_the_entry():
+    grid = network.generate_grid(4, 4)
+    region = Region(grid, [0] * len(grid.road_names), 0, seed=0)
+    region.add_vehicles([("car1", "car", 3, 1)])
+    region.add_vehicles([("car2", "car", 3, 1), ("ambulance3", "ambulance", 3, 1), ("car4", "car", 5, 1)])
+
+    environment = region.environment
+    assert environment.cars["car1"].position == 1
+    assert environment.cars["car2"].position == 0
+    assert environment.ambulances["ambulance3"].position == 1 # An ambulance only stops for ambulances
+    assert environment.cars["car4"].position == 1
@@ -0,0 +1,71 @@
+import random
+import pytest
+import network
+from phases import Junction, PhaseTable
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# The tables of the three traffic lights demo before the phases (define_new_colors_ambulance/person): sender -> colors of the other traffic lights
+BASELINE = {"emergency": {"Traffic_Light_1": {"Traffic_Light_2": "red", "Traffic_Light_3": "yellow"},
+                          "Traffic_Light_2": {"Traffic_Light_1": "yellow", "Traffic_Light_3": "red"},
+                          "Traffic_Light_3": {"Traffic_Light_1": "red", "Traffic_Light_2": "yellow"}},
+            "person": {"Traffic_Light_1": {"Traffic_Light_2": "yellow", "Traffic_Light_3": "green"},
+                       "Traffic_Light_2": {"Traffic_Light_1": "green", "Traffic_Light_3": "yellow"},
+                       "Traffic_Light_3": {"Traffic_Light_1": "yellow", "Traffic_Light_2": "green"}}}
+
+
+# Every color of the junction after the override, the sender included (green for an emergency, red for a person)
+def junction_colors(junction, approach, event):
+    colors = junction.new_colors(approach, event)
+    colors[approach] = "green" if event == "emergency" else "red"
+    return colors
+
+
+def random_junction(rng, index):
+    approaches = [f"Traffic_Light_{index}_{letter}" for letter in "ABCDE"[:rng.randint(2, 5)]]
+    phases = [rng.sample(approaches, rng.randint(1, len(approaches) - 1)) for _ in range(rng.randint(2, 4))]
+    # Every approach in at least one phase
+    for approach in approaches:
+        if not any(approach in phase for phase in phases):
+            rng.choice(phases).append(approach)
+    return Junction(f"Intersection_{index}", approaches, phases)
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("event", ["emergency", "person"])
+@pytest.mark.parametrize("traffic_light_name", ["Traffic_Light_1", "Traffic_Light_2", "Traffic_Light_3"])
+def test_three_lights_reproduces_the_baseline_tables(traffic_light_name, event):
+    table = PhaseTable(network.load_network())
+    new_colors = table.new_colors(traffic_light_name, event)
+
+    assert new_colors == BASELINE[event][traffic_light_name]
+    assert list(new_colors) == list(BASELINE[event][traffic_light_name]) # Same order: the central sends the changes in this order
+
+
+def test_conflict_masks():
+    junction = Junction("Intersection", ["N", "E", "S", "W"], [["N", "S"], ["E", "W"]])
+
+    assert junction.conflicting("N") == ["E", "W"]
+    assert not junction.in_conflict("N", "S")
+    assert junction.in_conflict("E", "S")
+    assert junction.compatible_phases == [0b01, 0b10, 0b01, 0b10]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_no_two_conflicting_approaches_are_ever_green_together(seed):
+    rng = random.Random(seed)
+    junction = random_junction(rng, seed)
+
+    for approach in junction.approaches:
+        for event in ("emergency", "person"):
+            green = [name for name, color in junction_colors(junction, approach, event).items() if color == "green"]
+            for index, name in enumerate(green):
+                for other in green[index + 1:]:
+                    assert not junction.in_conflict(name, other), (approach, event, name, other)
+
+
+def test_phases_must_use_the_traffic_lights_of_the_intersection():
+    with pytest.raises(ValueError):
+        Junction("Intersection", ["N", "E"], [["N"], ["X"]])
+    with pytest.raises(ValueError):
+        Junction("Intersection", ["N", "E"], [["N"]])
@@ -0,0 +1,59 @@
+import pytest
+import protocol
+from protocol import ProtocolError
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("kind", sorted(protocol.KIND_NAMES))
+def test_round_trip_of_every_kind(kind):
+    body = protocol.encode(kind, protocol.CAR, "car_1", subject="road_1", value="move", event="emergency", correlation_id="1f", sent_at="12.5")
+    assert protocol.decode(body) == (kind, protocol.CAR, "car_1", "road_1", "move", "emergency", "1f", "12.5")
+
+
+def test_empty_fields_round_trip_as_empty_strings():
+    envelope = protocol.decode(protocol.encode(protocol.EMERGENCY, protocol.AMBULANCE, "ambulance_1"))
+
+    assert envelope.kind == protocol.EMERGENCY
+    assert envelope.subject == envelope.value == envelope.event == envelope.correlation_id == envelope.sent_at == ""
+
+
+def test_reply_keeps_the_correlation_id():
+    request = protocol.decode(protocol.encode(protocol.MAY_I_GO, protocol.CAR, "car_1", subject="road_1", correlation_id="a3"))
+    answer = protocol.decode(protocol.reply(request, protocol.COMMAND, protocol.CENTRAL, "central@localhost", value="stop"))
+
+    assert answer.correlation_id == "a3"
+    assert answer.value == "stop"
+
+
+@pytest.mark.parametrize("field", ["entity", "subject", "value", "event", "correlation_id", "sent_at"])
+def test_a_field_with_the_separator_is_refused(field):
+    with pytest.raises(ProtocolError, match="separator"):
+        protocol.encode(protocol.MAY_I_GO, protocol.CAR, **dict({"entity": "car_1"}, **{field: "a|b"}))
+
+
+@pytest.mark.parametrize("body, error", [("99|car|car_1|||||", "unknown kind '99'"),
+                                          ("x|car|car_1|||||", "unknown kind 'x'"),
+                                          ("1|bus|bus_1|||||", "unknown role 'bus'"),
+                                          ("1|car|car_1|road_1", "has 4 fields"),
+                                          ("1|car|car_1|road_1|a|b|c", "has 7 fields"),
+                                          ("", "has 1 fields"),
+                                          (None, "is not a string")])
+def test_malformed_bodies_raise_a_protocol_error(body, error):
+    with pytest.raises(ProtocolError, match=error):
+        protocol.decode(body)
+
+
+# The agents (and the dispatch of the central) get None for a message that does not follow the protocol, instead of an exception
+def test_read_message_skips_malformed_bodies():
+    import transport
+    from agents import read_message
+
+    assert read_message(transport.LocalMessage(to="central@localhost", sender="car1@localhost", body="1|car")) is None
+    assert read_message(transport.LocalMessage(to="central@localhost", sender="car1@localhost", body="1|car|car_1|road_1||||")).kind == protocol.MAY_I_GO
+
+
+def test_sent_time_of_a_request():
+    request = protocol.decode(protocol.encode(protocol.MAY_I_GO, protocol.CAR, "car_1", sent_at="1760790000.125"))
+    assert protocol.sent_time(request, 0.0) == 1760790000.125
+    assert protocol.sent_time(protocol.decode(protocol.encode(protocol.MAY_I_GO, protocol.CAR, "car_1")), 7.0) == 7.0
+    assert protocol.sent_time(protocol.decode(protocol.encode(protocol.MAY_I_GO, protocol.CAR, "car_1", sent_at="soon")), 7.0) == 7.0
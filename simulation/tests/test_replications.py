@@ -0,0 +1,45 @@
+import math
+import statistics
+import pytest
+from replications import T_95, t_quantile, confidence_interval
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_t_quantile_rows_of_the_table():
+    for degrees_of_freedom, quantile in T_95.items():
+        assert t_quantile(degrees_of_freedom) == quantile
+
+
+# Between two rows the quantile of the smaller degrees of freedom (the larger quantile), so that the interval is never too narrow
+@pytest.mark.parametrize("degrees_of_freedom, quantile", [(35, 2.042), (59, 2.021), (100, 2.000), (120, 1.980), (121, 1.96), (10000, 1.96)])
+def test_t_quantile_between_and_beyond_the_rows(degrees_of_freedom, quantile):
+    assert t_quantile(degrees_of_freedom) == quantile
+
+
+def test_t_quantile_decreases_with_the_degrees_of_freedom():
+    quantiles = [t_quantile(degrees_of_freedom) for degrees_of_freedom in range(1, 200)]
+    assert quantiles == sorted(quantiles, reverse=True)
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_confidence_interval_of_known_values():
+    values = [1, 2, 3, 4, 5]
+    result = confidence_interval(values)
+
+    half_width = 2.776 * statistics.stdev(values) / math.sqrt(5)
+    assert result["n"] == 5
+    assert result["mean"] == 3
+    assert result["std"] == pytest.approx(math.sqrt(2.5))
+    assert result["ci_low"] == pytest.approx(3 - half_width)
+    assert result["ci_high"] == pytest.approx(3 + half_width)
+
+
+def test_confidence_interval_leaves_out_the_missing_values():
+    assert confidence_interval([None, 1, None, 2, 3, 4, 5]) == confidence_interval([1, 2, 3, 4, 5])
+
+
+def test_confidence_interval_without_enough_values_or_spread():
+    assert confidence_interval([]) == {"n": 0, "mean": None, "std": None, "ci_low": None, "ci_high": None}
+    assert confidence_interval([None]) == {"n": 0, "mean": None, "std": None, "ci_low": None, "ci_high": None}
+    assert confidence_interval([4.0]) == {"n": 1, "mean": 4.0, "std": None, "ci_low": None, "ci_high": None}
+    assert confidence_interval([2.5, 2.5, 2.5]) == {"n": 3, "mean": 2.5, "std": 0.0, "ci_low": None, "ci_high": None, "constant": True}
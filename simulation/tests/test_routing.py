@@ -0,0 +1,58 @@
+import random
+import pytest
+import network
+from routing import RoutingTable, CLOSED
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Tables built from scratch with the current weights - the repaired tables must have the same costs, and next hops that reach the destination at that cost
+def fresh_tables(routing):
+    fresh = RoutingTable(routing.network, routing.weights)
+    return {destination: fresh.compute(destination) for destination in routing.tables}
+
+
+def check_against_compute(routing):
+    for destination, (fresh_next_hop, fresh_cost) in fresh_tables(routing).items():
+        next_hop, cost = routing.tables[destination]
+        assert cost == pytest.approx(fresh_cost)
+
+        for road in range(routing.n_roads):
+            if fresh_cost[road] == CLOSED:
+                assert next_hop[road] == -1
+            elif road != destination:
+                # Ties can be broken another way than by a full Dijkstra: the hop must be a turn option on a cheapest route
+                assert next_hop[road] in routing.network.next_of(road)
+                assert cost[next_hop[road]] + routing.weights[next_hop[road]] == pytest.approx(fresh_cost[road])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_repairs_match_compute_after_random_closures_reopenings_and_reweights(seed):
+    rng = random.Random(seed)
+    routing = RoutingTable(network.generate_grid(4, 4))
+    routing.precompute()
+
+    for _ in range(40):
+        road = rng.randrange(routing.n_roads)
+        action = rng.choice(("close", "open", "reweight"))
+        if action == "close":
+            routing.close_road(road)
+        elif action == "open":
+            routing.open_road(road)
+        else:
+            routing.set_weight(road, rng.choice((0.5, 1.0, 2.0, 5.0)))
+        check_against_compute(routing)
+
+
+def test_closing_the_only_way_makes_the_roads_unreachable_and_reopening_restores_them():
+    routing = RoutingTable(network.load_network())
+    road_1, road_5, road_11 = (routing.network.road_index[name] for name in ("road_1", "road_5", "road_11"))
+
+    assert routing.route(road_1, road_11) == [road_1, road_5, road_11]
+
+    routing.close_road(road_5)
+    assert routing.route(road_1, road_11) == []
+    check_against_compute(routing)
+
+    routing.open_road(road_5)
+    assert routing.route(road_1, road_11) == [road_1, road_5, road_11]
+    check_against_compute(routing)
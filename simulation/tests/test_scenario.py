@@ -0,0 +1,27 @@
+import asyncio
+import scenario as scenarios
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class SlowAgent:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.started_at = None
+
+    async def start(self, auto_register=True):
+        await asyncio.sleep(self.seconds)
+        self.started_at = asyncio.get_running_loop().time()
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_time_to_first_tick_does_not_count_the_spawn_delays():
+    central, car, late_car = SlowAgent(0.01), SlowAgent(0.01), SlowAgent(0.01)
+    agents = {"central": [central], "traffic_light": [], "car": [car, late_car], "ambulance": [], "person": []}
+    delays = {car: 0, late_car: 0.3}
+
+    time_to_first_tick = asyncio.run(scenarios.start_agents(agents, delays, concurrency=4))
+
+    assert late_car.started_at - car.started_at >= 0.25
+    assert time_to_first_tick < 0.2
+    assert scenarios.spawn_schedule(delays) == 0.3
+    assert scenarios.spawn_schedule({}) == 0
@@ -0,0 +1,37 @@
+import numpy as np
+import network
+import snapshot
+from fleet import VehicleFleet
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_fleet_round_trip_keeps_destinations_no_vehicle_is_heading_to(tmp_path):
+    grid = network.generate_grid(3, 3)
+    vehicles = VehicleFleet(grid, seed=0)
+    vehicles.spawn(20)
+    vehicles.set_destinations(np.arange(20), 5)
+    vehicles.set_destinations(np.arange(10), 7)
+    assert vehicles.destination_roads.tolist() == [5, 7]
+    vehicles.destination[:] = 7
+
+    path = tmp_path / "fleet.snapshot"
+    snapshot.save_fleet(vehicles, path)
+    restored = snapshot.restore_fleet(path, grid)
+
+    assert restored.destination_roads.tolist() == [5, 7]
+    assert restored.destination.tolist() == vehicles.destination.tolist()
+    assert restored.road.tolist() == vehicles.road.tolist()
+
+
+def test_fleet_round_trip_without_destinations(tmp_path):
+    grid = network.generate_grid(3, 3)
+    vehicles = VehicleFleet(grid, seed=0)
+    vehicles.spawn(5)
+
+    path = tmp_path / "fleet.snapshot"
+    snapshot.save_fleet(vehicles, path)
+    restored = snapshot.restore_fleet(path, grid)
+
+    assert len(restored.destination_roads) == 0
+    assert restored.routing is None
+    assert (restored.destination == -1).all()
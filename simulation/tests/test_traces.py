@@ -0,0 +1,91 @@
+import os
+import traces
+from environment import Environment
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Records as the event log hands them to the sinks: (time, category, level, kind, fields)
+RECORDS = [
+    (1.0, "vehicle", 10, "moving", {"vehicle": "car_1@localhost", "road": "road_1", "position": 0}),
+    (1.5, "vehicle", 10, "moving", {"vehicle": "ambulance_1@localhost", "road": "road_3", "position": 2}),
+    (2.0, "traffic_light", 20, "changed", {"traffic_light": "Traffic_Light_1", "color": "red"}),
+    (2.5, "vehicle", 10, "moving", {"vehicle": "car_1@localhost", "road": "road_1", "position": 1}),
+    (3.0, "central", 30, "unexpected_message", {"central": "central@localhost", "sender": "car_1@localhost", "request": "color"}),
+]
+
+
+def write_trace(directory, records, buffer_size=2):
+    sink = traces.TraceSink(str(directory), buffer_size)
+    for record in records:
+        sink.emit(record)
+    sink.close()
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_trace_round_trip(tmp_path):
+    write_trace(tmp_path, RECORDS)
+
+    with traces.TraceReader(str(tmp_path)) as trace:
+        assert len(trace) == 5
+        assert list(trace.records()) == [
+            (1.0, "vehicle.moving", "car_1@localhost", "", "road_1", "", 0),
+            (1.5, "vehicle.moving", "ambulance_1@localhost", "", "road_3", "", 2),
+            (2.0, "traffic_light.changed", "Traffic_Light_1", "", "", "red", -1),
+            (2.5, "vehicle.moving", "car_1@localhost", "", "road_1", "", 1),
+            (3.0, "central.unexpected_message", "central@localhost", "car_1@localhost", "", "color", -1),
+        ]
+        assert trace.counts() == {"vehicle.moving": 3, "traffic_light.changed": 1, "central.unexpected_message": 1}
+
+    # Every string is interned once
+    with open(tmp_path / "strings.txt") as file:
+        strings = file.read().splitlines()
+    assert strings[0] == ""
+    assert len(strings) == len(set(strings))
+
+
+def test_continued_trace_keeps_the_ids_of_its_strings(tmp_path):
+    write_trace(tmp_path, RECORDS[:3])
+    write_trace(tmp_path, RECORDS[3:])
+
+    with traces.TraceReader(str(tmp_path)) as trace:
+        assert [record[:3] for record in trace.records()] == [(t, f"{category}.{kind}", fields.get("vehicle", fields.get("traffic_light", fields.get("central"))))
+                                                           for t, category, _, kind, fields in RECORDS]
+        assert trace.strings.count("car_1@localhost") == 1
+
+
+def test_partial_last_batch_is_not_read(tmp_path):
+    write_trace(tmp_path, RECORDS)
+
+    # A writer stopped after the time column of a batch, and in the middle of a value
+    with open(tmp_path / "time.col", "ab") as file:
+        file.write(bytes(8 * 2 + 3))
+
+    with traces.TraceReader(str(tmp_path)) as trace:
+        assert len(trace) == 5
+        assert len(list(trace.records())) == 5
+
+
+def test_replay_re_drives_the_environment(tmp_path):
+    write_trace(tmp_path, RECORDS)
+    environment = Environment(0)
+
+    with traces.TraceReader(str(tmp_path)) as trace:
+        traces.replay(trace, environment, until=2.0)
+        assert environment.cars["car_1@localhost"].position == 0
+        assert environment.traffic_lights["Traffic_Light_1"] == "red"
+
+        traces.replay(trace, environment)
+
+    assert environment.cars["car_1@localhost"].position == 1
+    assert list(environment.vehicles_at(environment.road_1, 1, "car")) == ["car_1@localhost"]
+    assert list(environment.vehicles_at(environment.road_1, 0, "car")) == []
+    assert list(environment.vehicles_on_road(environment.road_3, "ambulance")) == ["ambulance_1@localhost"]
+
+
+def test_empty_trace(tmp_path):
+    write_trace(tmp_path, [])
+
+    with traces.TraceReader(str(tmp_path)) as trace:
+        assert len(trace) == 0
+        assert list(trace.records()) == []
+    assert sorted(os.listdir(tmp_path)) == sorted([f"{name}.col" for name in traces.COLUMNS] + ["strings.txt"])
@@ -0,0 +1,48 @@
+import asyncio
+import events
+import transport
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class ListSink(events.BufferedSink):
+    def __init__(self):
+        super().__init__(buffer_size=1000)
+        self.records = []
+
+    def write(self, records):
+        self.records.extend(records)
+
+
+class FailingBehaviour(transport.LocalCyclicBehaviour):
+    async def run(self):
+        raise ValueError("bad state")
+
+
+class IdleBehaviour(transport.LocalCyclicBehaviour):
+    async def run(self):
+        await asyncio.sleep(1)
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+def test_failing_behaviour_is_logged_and_kills_the_agent():
+    sink = events.log.add_sink(ListSink())
+
+    async def scenario():
+        agent = transport.LocalAgent("failing@localhost", "password")
+        failing, idle = FailingBehaviour(), IdleBehaviour()
+        agent.add_behaviour(failing)
+        agent.add_behaviour(idle)
+        await agent.start()
+        await asyncio.sleep(0.05)
+        return agent, failing, idle
+
+    try:
+        agent, failing, idle = asyncio.run(scenario())
+    finally:
+        events.log.remove_sink(sink)
+
+    assert isinstance(failing.exit_code, ValueError)
+    assert not agent.is_alive()
+    assert idle.is_killed()
+    assert "failing@localhost" not in transport.router.agents
+    assert any(kind == "behaviour_failed" and fields["agent"] == "failing@localhost" for _, _, _, kind, fields in sink.records)
@@ -0,0 +1,219 @@
+import os
+import sys
+import mmap
+import time
+import argparse
+from array import array
+from collections import Counter
+import events
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Trace of a run: every event of the event log (movements, light changes, central decisions, messages) appended to a directory of column files.
+#   - one file per column, one fixed-width value per event: time (float64), event, entity, other, road, label (uint32 ids) and number (int32)
+#   - the strings (event names, agent ids, roads, colors, commands) are interned: strings.txt has one per line and the columns keep its line number
+#   - the files are only appended to, in batches (TraceSink is a BufferedSink, wrapped by a BackgroundSink by events.configure)
+#   - TraceReader maps the column files in memory, so a scan does not read/parse the whole trace first
+# Usage: main.py --trace runs/trace1, then: python traces.py summary runs/trace1 / python traces.py replay runs/trace1
+
+COLUMNS = {"time": "d", "event": "I", "entity": "I", "other": "I", "road": "I", "label": "I", "number": "i"}
+
+# Fields of an event that go to every column - the first one present is used, ex: "moving" -> entity: vehicle, road: road, number: position
+ENTITY_FIELDS = ("vehicle", "ambulance", "person", "traffic_light", "central", "agent", "to", "sender")
+OTHER_FIELDS = ("sender", "traffic_light", "to")
+LABEL_FIELDS = ("color", "command", "request", "destination")
+
+NONE = 0 # Id of the empty string - the field is not in the event
+NO_NUMBER = -1
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class TraceSink(events.BufferedSink):
+    def __init__(self, directory, buffer_size=4096):
+        super().__init__(buffer_size)
+        os.makedirs(directory, exist_ok=True)
+        self.files = {name: open(os.path.join(directory, f"{name}.col"), "ab") for name in COLUMNS}
+        self.strings_file = open(os.path.join(directory, "strings.txt"), "a")
+
+        # Strings already in the trace (an existing trace is continued)
+        self.ids = {"": NONE}
+        self.plans = {} # (category, kind) -> event id and fields of the columns
+        with open(os.path.join(directory, "strings.txt")) as file:
+            for line in file:
+                self.ids.setdefault(line[:-1], len(self.ids))
+        if len(self.ids) == 1 and self.strings_file.tell() == 0:
+            self.strings_file.write("\n") # Line 0: the empty string
+
+    def intern(self, value):
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = self.ids[value] = len(self.ids)
+            self.strings_file.write(str(value).replace("\n", " ") + "\n")
+        return string_id
+
+    # Fields of the event that go to the entity/other/road/label columns - the same for every event of a type, so it is found once per type
+    def plan(self, category, kind, fields):
+        plan = self.plans.get((category, kind))
+        if plan is None:
+            entity = next((field for field in ENTITY_FIELDS if field in fields), None)
+            other = next((field for field in OTHER_FIELDS if field in fields and field != entity), None)
+            label = next((field for field in LABEL_FIELDS if field in fields), None)
+            plan = self.plans[category, kind] = (self.intern(f"{category}.{kind}"), entity, other, "road" if "road" in fields else None, label)
+        return plan
+
+    def write(self, records):
+        intern = self.intern
+        plan = self.plan
+        times, event_ids, entities, others, roads, labels, numbers = (array(typecode) for typecode in COLUMNS.values())
+
+        for t, category, _, kind, fields in records:
+            event_id, entity, other, road, label = plan(category, kind, fields)
+            times.append(t)
+            event_ids.append(event_id)
+            entities.append(intern(fields.get(entity, "")) if entity else NONE)
+            others.append(intern(fields.get(other, "")) if other else NONE)
+            roads.append(intern(fields.get(road, "")) if road else NONE)
+            labels.append(intern(fields.get(label, "")) if label else NONE)
+            numbers.append(fields.get("position", NO_NUMBER))
+
+        columns = dict(zip(COLUMNS, (times, event_ids, entities, others, roads, labels, numbers)))
+
+        # The strings first, so that a reader never finds an id without its string
+        self.strings_file.flush()
+        for name, column in columns.items():
+            self.files[name].write(column.tobytes())
+            self.files[name].flush()
+
+    def close(self):
+        super().close()
+        for file in [*self.files.values(), self.strings_file]:
+            if not file.closed:
+                file.close()
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class TraceReader:
+    def __init__(self, directory):
+        with open(os.path.join(directory, "strings.txt")) as file:
+            self.strings = [line[:-1] for line in file]
+        self.ids = {string: string_id for string_id, string in enumerate(self.strings)}
+
+        self.maps = []
+        self.columns = {}
+        for name, typecode in COLUMNS.items():
+            with open(os.path.join(directory, f"{name}.col"), "rb") as file:
+                size = os.fstat(file.fileno()).st_size
+                size -= size % array(typecode).itemsize
+                if size:
+                    self.maps.append(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+                    self.columns[name] = memoryview(self.maps[-1])[:size].cast(typecode)
+                else:
+                    self.columns[name] = memoryview(array(typecode))
+
+        # The columns are written one after the other - a trace still being written can have a partial last batch
+        self.length = min(len(column) for column in self.columns.values())
+
+    def __len__(self):
+        return self.length
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for column in self.columns.values():
+            column.release()
+        for trace_map in self.maps:
+            # Views returned by column() that are still alive keep the map open - it is unmapped when they go away
+            try:
+                trace_map.close()
+            except BufferError:
+                pass
+
+    def column(self, name):
+        return self.columns[name][:self.length]
+
+    # Events as tuples of strings (the numbers as they are), ex: (12.0, "vehicle.moving", "car_1", "", "road_1", "", 3)
+    def records(self):
+        strings = self.strings
+        for t, event, entity, other, road, label, number in zip(*(self.column(name) for name in COLUMNS)):
+            yield t, strings[event], strings[entity], strings[other], strings[road], strings[label], number
+
+    # Number of events of every type, ex: {"vehicle.moving": 1200, ...}
+    def counts(self):
+        return {self.strings[event]: count for event, count in Counter(self.column("event")).most_common()}
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Trace vehicle - only what the Environment keeps of a vehicle
+class ReplayVehicle:
+    def __init__(self, vehicle_id, road):
+        self.jid = vehicle_id
+        self.road = road
+        self.position = 0
+
+
+# Re-drives an Environment from the movements and the light changes of a trace, without agents, up to "until" (trace time)
+# Returns the environment in the state of the run at that time
+def replay(trace, environment, until=None):
+    roads = {road.name: road for road in environment.roads}
+    strings = trace.strings
+    moving = trace.ids.get("vehicle.moving")
+    light_changes = {trace.ids[event] for event in ("traffic_light.changed", "traffic_light.changed_emergency", "traffic_light.changed_person") if event in trace.ids}
+
+    for t, event, entity, road, label, number in zip(*(trace.column(name) for name in ("time", "event", "entity", "road", "label", "number"))):
+        if until is not None and t > until:
+            break
+
+        if event == moving:
+            vehicle_id = strings[entity]
+            type_vehicle = "ambulance" if vehicle_id.startswith("ambulance") else "car"
+            vehicles = environment.get_vehicles(type_vehicle)
+            if vehicle_id not in vehicles:
+                vehicles[vehicle_id] = ReplayVehicle(vehicle_id, roads[strings[road]])
+                environment.index_vehicle(vehicle_id, type_vehicle)
+            environment.set_vehicle_location(vehicle_id, type_vehicle, roads[strings[road]], number)
+
+        elif event in light_changes:
+            environment.traffic_lights[strings[entity]] = strings[label]
+
+    return environment
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import scenario as scenarios
+
+    parser = argparse.ArgumentParser(description="Summary and replay of the traces written by main.py --trace")
+    parser.add_argument("command", choices=["summary", "replay"])
+    parser.add_argument("directory", help="trace directory")
+    parser.add_argument("--scenario", default=scenarios.DEFAULT_SCENARIO, help="replay: scenario of the traced run (for its road network)")
+    parser.add_argument("--until", type=float, default=None, help="replay: stop at this trace time")
+    args = parser.parse_args()
+
+    events.configure(console_output=False)
+
+    with TraceReader(args.directory) as trace:
+        if args.command == "summary":
+            times = trace.column("time")
+            duration = times[-1] - times[0] if len(trace) else 0
+            print(f"{len(trace)} events over {duration:.1f} s, {len(trace.strings)} distinct strings")
+            for event, count in trace.counts().items():
+                print(f"    {event}: {count}")
+
+        else:
+            environment = scenarios.build_environment(scenarios.load_scenario(args.scenario))
+            start = time.perf_counter()
+            replay(trace, environment, args.until)
+            elapsed = time.perf_counter() - start
+
+            times = trace.column("time")
+            traced = (min(args.until, times[-1]) if args.until is not None else times[-1]) - times[0] if len(trace) else 0
+            print(f"Replayed {traced:.1f} s of trace in {elapsed:.3f} s ({traced / elapsed if elapsed else 0:.0f}x real time)", file=sys.stderr)
+            for road in environment.roads:
+                cars = sorted(environment.vehicles_on_road(road, "car"))
+                ambulances = sorted(environment.vehicles_on_road(road, "ambulance"))
+                if cars or ambulances:
+                    print(f"{road.name}: {', '.join(cars + ambulances)} | {environment.traffic_lights.get(road.traffic_light, road.traffic_light)}")
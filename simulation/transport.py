@@ -0,0 +1,257 @@
+import os
+import time
+import asyncio
+import events
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Message transport used by the agents. Two backends, chosen by the SIM_TRANSPORT environment variable before the agents are imported:
+#   - "xmpp" (default): SPADE agents, every message goes through the XMPP server
+#   - "local": in-memory asyncio mailboxes in this process - same Agent/CyclicBehaviour/Message API (send, receive(timeout=...), start, stop), no server needed
+
+BACKEND = os.environ.get("SIM_TRANSPORT", "xmpp")
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Counts the messages sent through the transport, to report the messages/sec of a run
+class TransportStats:
+    def __init__(self):
+        self.sent = 0
+        self.dropped = 0 # Messages to a JID with no running agent (local backend only)
+        self.started_at = time.perf_counter()
+
+    def reset(self):
+        self.sent = 0
+        self.dropped = 0
+        self.started_at = time.perf_counter()
+
+    def messages_per_second(self):
+        elapsed = time.perf_counter() - self.started_at
+        if elapsed <= 0:
+            return 0.0
+        return self.sent / elapsed
+
+    def report(self):
+        return f"{BACKEND} transport: {self.sent} messages, {self.messages_per_second():.1f} messages/sec"
+
+stats = TransportStats()
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class LocalMessage:
+    def __init__(self, to=None, sender=None, body=None, thread=None, metadata=None):
+        self.to = to
+        self.sender = sender
+        self.body = body
+        self.thread = thread
+        self.metadata = dict(metadata) if metadata else {}
+
+    def set_metadata(self, key, value):
+        self.metadata[key] = value
+
+    def get_metadata(self, key):
+        return self.metadata.get(key)
+
+    def make_reply(self):
+        return LocalMessage(to=self.sender, sender=self.to, thread=self.thread, metadata=self.metadata)
+
+    def __repr__(self):
+        return f"<Message to={self.to} sender={self.sender} body={self.body!r}>"
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Registry of the running local agents, ex: "vehicle1@localhost": CarAgent()
+class LocalRouter:
+    def __init__(self):
+        self.agents = {}
+
+    def register(self, agent):
+        self.agents[str(agent.jid)] = agent
+
+    def unregister(self, agent):
+        self.agents.pop(str(agent.jid), None)
+
+    # Puts the message in the mailbox of every behaviour of the receiver that matches it (like SPADE does)
+    def deliver(self, msg):
+        agent = self.agents.get(str(msg.to))
+        if agent is None:
+            stats.dropped += 1
+            return
+
+        for behaviour in agent.behaviours:
+            if behaviour.match(msg):
+                behaviour.queue.put_nowait(msg)
+
+router = LocalRouter()
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class LocalAgent:
+    def __init__(self, jid, password, verify_security=False):
+        self.jid = str(jid)
+        self.password = password
+        self.behaviours = []
+        self.router = router
+        self.alive = False
+
+    async def setup(self):
+        pass
+
+    def add_behaviour(self, behaviour, template=None):
+        behaviour.set_agent(self)
+        behaviour.template = template
+        self.behaviours.append(behaviour)
+        if self.alive:
+            behaviour.start()
+
+    def remove_behaviour(self, behaviour):
+        behaviour.kill()
+        self.behaviours.remove(behaviour)
+
+    # auto_register is accepted for compatibility with SPADE - there is no server to register with
+    async def start(self, auto_register=True):
+        self.router.register(self)
+        await self.setup()
+
+        # Like SPADE, the behaviours added in setup() start once it is done - add_behaviour() only starts them right away after that
+        self.alive = True
+        for behaviour in self.behaviours:
+            behaviour.start()
+
+    async def stop(self):
+        self.alive = False
+        for behaviour in self.behaviours:
+            behaviour.kill()
+        await asyncio.gather(*(behaviour.task for behaviour in self.behaviours if behaviour.task is not None), return_exceptions=True)
+        self.router.unregister(self)
+
+    def is_alive(self):
+        return self.alive
+
+    # A behaviour failed: the other behaviours stop and the messages to the agent are dropped from now on
+    def die(self, failed_behaviour):
+        self.alive = False
+        for behaviour in self.behaviours:
+            if behaviour is not failed_behaviour:
+                behaviour.kill()
+        self.router.unregister(self)
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+class LocalCyclicBehaviour:
+    def __init__(self):
+        self.agent = None
+        self.template = None
+        self.queue = asyncio.Queue()
+        self.task = None
+        self.killed = False
+        self.exit_code = None # The exception that stopped run(), if any
+
+    def set_agent(self, agent):
+        self.agent = agent
+
+    def match(self, msg):
+        if self.template is None:
+            return True
+        return self.template.match(msg)
+
+    def start(self):
+        self.killed = False
+        self.task = asyncio.get_running_loop().create_task(self._run_forever())
+
+    def kill(self):
+        self.killed = True
+        if self.task is not None:
+            self.task.cancel()
+
+    def is_killed(self):
+        return self.killed
+
+    async def on_start(self):
+        pass
+
+    async def on_end(self):
+        pass
+
+    async def run(self):
+        raise NotImplementedError
+
+    async def _run_forever(self):
+        try:
+            await self.on_start()
+            while not self.killed:
+                await self.run()
+                # Gives the other agents a chance to run if run() did not await anything
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            pass
+        except Exception as error:
+            # Nothing awaits the task, so the error is logged and the agent is marked dead (like SPADE) instead of stopping without a trace
+            self.exit_code = error
+            self.killed = True
+            events.agent.warning("behaviour_failed", agent=self.agent.jid, behaviour=type(self).__name__, error=repr(error))
+            self.agent.die(self)
+        finally:
+            await self.on_end()
+
+    async def send(self, msg):
+        if msg.sender is None:
+            msg.sender = self.agent.jid
+        stats.sent += 1
+        self.agent.router.deliver(msg)
+
+    # Same body to many agents in one call, ex: the emergency to every car on a road
+    async def multicast(self, to_jids, body, performative="inform"):
+        for to in to_jids:
+            msg = LocalMessage(to=str(to), sender=self.agent.jid, body=body, metadata={"performative": performative})
+            stats.sent += 1
+            self.agent.router.deliver(msg)
+
+    # Same semantics as SPADE: without timeout it only returns a message that is already in the mailbox
+    async def receive(self, timeout=None):
+        if timeout is None:
+            try:
+                return self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return None
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def enqueue(self, msg):
+        self.queue.put_nowait(msg)
+
+    def mailbox_size(self):
+        return self.queue.qsize()
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+if BACKEND == "local":
+    Agent = LocalAgent
+    CyclicBehaviour = LocalCyclicBehaviour
+    Message = LocalMessage
+
+elif BACKEND == "xmpp":
+    from spade.agent import Agent
+    from spade.behaviour import CyclicBehaviour as SpadeCyclicBehaviour
+    from spade.message import Message
+
+    # Only adds the message count and the multicast to the SPADE behaviour
+    class CyclicBehaviour(SpadeCyclicBehaviour):
+        async def send(self, msg):
+            stats.sent += 1
+            await super().send(msg)
+
+        # The sends go out concurrently instead of one after the other
+        async def multicast(self, to_jids, body, performative="inform"):
+            msgs = []
+            for to in to_jids:
+                msg = Message(to=str(to))
+                msg.set_metadata("performative", performative)
+                msg.body = body
+                msgs.append(msg)
+            await asyncio.gather(*(self.send(msg) for msg in msgs))
+
+else:
+    raise ValueError(f"Unknown SIM_TRANSPORT {BACKEND!r}, expected 'xmpp' or 'local'")